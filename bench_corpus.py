@@ -0,0 +1,350 @@
+"""
+Synthetic benchmark corpus: transfer slips and Krungsri statements whose
+contents are known, so the benchmark can score what the pipelines read.
+
+  slips       transfer slips drawn with PIL: bank header, date, parties,
+              amount, fee and reference, as a phone screenshot (PNG) or a
+              recompressed photo (JPEG, slight noise), 720-1440 px wide
+  statements  Krungsri savings-account statement PDFs drawn with reportlab
+              in the layout parse_bank_statement reads: header block,
+              transaction lines with continuation lines, page numbers and
+              the withdrawal / deposit summary on the last page
+
+Everything is drawn from a seeded random.Random, so a seed and the same
+font always give the same corpus.
+
+Thai text needs a TrueType font with Thai glyphs: --font, or the first of
+THAI_FONT_PATHS found on the machine.  Without one the corpus is English
+only: slip labels and months in English (Gregorian years), statements
+without the Thai header, deposits or summary, which are then left out of
+the ground truth as well.
+
+    python bench_corpus.py --out bench-corpus --slips 200 --pages 1,10,50,200
+"""
+
+import argparse
+import io
+import json
+import os
+import random
+from datetime import datetime, timedelta
+from typing import Optional
+
+from PIL import Image, ImageDraw, ImageFont
+
+from extractor import month_abbreviation
+
+
+THAI_FONT_PATHS = (
+    "/usr/share/fonts/truetype/noto/NotoSansThai-Regular.ttf",
+    "/usr/share/fonts/opentype/noto/NotoSansThai-Regular.ttf",
+    "/usr/share/fonts/truetype/tlwg/Loma.ttf",
+    "/usr/share/fonts/truetype/tlwg/Garuda.ttf",
+    "/usr/share/fonts/truetype/thai/Garuda.ttf",
+    "C:\\Windows\\Fonts\\tahoma.ttf",
+    "/Library/Fonts/Thonburi.ttc",
+)
+
+_EN_MONTHS = ("Jan", "Feb", "Mar", "Apr", "May", "Jun",
+              "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
+_NAMES_TH = ("นาย สมชาย ใจดี", "นางสาว สุดา แสงทอง", "นาย ธนา วงศ์ไทย", "บริษัท ทดสอบ จำกัด")
+_NAMES_EN = ("MR. SOMCHAI JAIDEE", "MS. SUDA SAENGTHONG", "MR. THANA WONGTHAI", "TEST CO., LTD.")
+_BANKS = (("กรุงศรี", "Krungsri", (254, 202, 10)), ("กสิกรไทย", "KBank", (19, 138, 54)),
+          ("ไทยพาณิชย์", "SCB", (78, 42, 132)), ("กรุงเทพ", "Bangkok Bank", (30, 69, 153)))
+
+_WITHDRAWAL_TYPES_TH = ("โอนเงิน", "จ่ายคิวอาร์พร้อมเพย์", "ถอนเงิน", "ชำระค่าสินค้า/บริการ")
+_DEPOSIT_TYPES_TH = ("รับโอนเงิน", "รับโอนเงินพร้อมเพย์", "รับดอกเบี้ย")
+_WITHDRAWAL_TYPES_EN = ("Transfer", "QR Payment", "Cash Withdrawal", "Bill Payment")
+_CHANNELS = ("MOBILE", "MOBILE", "MOBILE", "ATM", "OTHERS")
+
+# Transaction rows per statement page (a continuation line takes a row too)
+_ROWS_PER_PAGE = 40
+
+
+def _has_thai_glyphs(path: str) -> bool:
+    from reportlab.pdfbase.ttfonts import TTFontFile
+
+    # Missing glyphs would come out of the PDF as blanks, not as Thai text
+    chars = TTFontFile(path).charToGlyph
+    return all(ord(c) in chars for c in "กขคงจรอาเ่้ำบ")
+
+
+def find_thai_font(path: Optional[str] = None) -> Optional[str]:
+    """path if given, else the first THAI_FONT_PATHS entry that exists; None without one."""
+    if path:
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Font not found: {path}")
+        if not _has_thai_glyphs(path):
+            raise ValueError(f"Font has no Thai glyphs: {path}")
+        return path
+    return next((p for p in THAI_FONT_PATHS if os.path.exists(p) and _has_thai_glyphs(p)), None)
+
+
+def _font(font_path, size):
+    if font_path:
+        return ImageFont.truetype(font_path, size)
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:
+        # Pillow < 10.1: fixed-size bitmap font
+        return ImageFont.load_default()
+
+
+def _ref(rng) -> str:
+    stamp = f"{rng.randrange(10 ** 12):012d}"
+    return stamp + "".join(rng.choice("ABCDEFGHJKLMNPQRSTUVWXYZ0123456789") for _ in range(6))
+
+
+def _amount(rng) -> float:
+    # Mostly small everyday payments, sometimes rent-sized transfers
+    if rng.random() < 0.8:
+        return round(rng.uniform(20, 3000), 2)
+    return round(rng.uniform(3000, 250000), 2)
+
+
+def _masked_account(rng) -> str:
+    return f"xxx-x-x{rng.randrange(10000):04d}-x"
+
+
+# ---------------------------------------------------------------------------
+# Slips
+# ---------------------------------------------------------------------------
+
+def make_slip(rng: random.Random, font_path: Optional[str] = None, thai: bool = False):
+    """
+    One transfer slip: (encoded image bytes, truth). truth has the amount as
+    printed ("1,250.00"), date_iso, ref and how the image was made.
+    """
+    when = datetime(2025, 1, 1) + timedelta(minutes=rng.randrange(2 * 365 * 24 * 60))
+    amount = f"{_amount(rng):,.2f}"
+    ref = _ref(rng)
+    bank_th, bank_en, colour = rng.choice(_BANKS)
+
+    if thai:
+        title = "โอนเงินสำเร็จ"
+        date_text = f"{when.day} {month_abbreviation(when.month)} {when.year + 543} - {when:%H:%M}"
+        lines = [
+            ("จาก", rng.choice(_NAMES_TH)), ("", f"ธ.{bank_th}"), ("", _masked_account(rng)),
+            ("ไปยัง", rng.choice(_NAMES_TH)), ("", _masked_account(rng)),
+            ("จำนวน:", f"{amount} บาท"), ("ค่าธรรมเนียม:", "0.00 บาท"),
+            ("เลขที่อ้างอิง:", ref),
+        ]
+    else:
+        title = "Transfer successful"
+        date_text = f"{when.day} {_EN_MONTHS[when.month - 1]} {when.year} - {when:%H:%M}"
+        lines = [
+            ("From", rng.choice(_NAMES_EN)), ("", bank_en), ("", _masked_account(rng)),
+            ("To", rng.choice(_NAMES_EN)), ("", _masked_account(rng)),
+            ("Amount", f"{amount} THB"), ("Fee", "0.00 THB"),
+            ("Ref:", ref),
+        ]
+
+    width = rng.choice((720, 1080, 1440))
+    scale = width / 720
+    img = Image.new("RGB", (width, int(width * 1.7)), "white")
+    draw = ImageDraw.Draw(img)
+    draw.rectangle((0, 0, width, int(110 * scale)), fill=colour)
+    draw.text((int(40 * scale), int(30 * scale)), bank_en, fill="white", font=_font(font_path, int(40 * scale)))
+
+    big, body = _font(font_path, int(38 * scale)), _font(font_path, int(28 * scale))
+    x, y = int(48 * scale), int(160 * scale)
+    draw.text((x, y), title, fill=(20, 120, 60), font=big)
+    y += int(60 * scale)
+    draw.text((x, y), date_text, fill=(90, 90, 90), font=body)
+    y += int(80 * scale)
+    for label, value in lines:
+        if label:
+            draw.text((x, y), label, fill=(90, 90, 90), font=body)
+        draw.text((x + int(220 * scale), y), value, fill="black", font=body)
+        y += int(52 * scale)
+
+    out = io.BytesIO()
+    if rng.random() < 0.5:
+        kind = "screenshot"
+        img.save(out, format="PNG")
+    else:
+        # Photo of a screen: slight noise, then JPEG at phone-camera quality
+        kind = "photo"
+        noise = Image.effect_noise(img.size, rng.uniform(4, 12)).convert("RGB")
+        img = Image.blend(img, noise, 0.08)
+        img.save(out, format="JPEG", quality=rng.randrange(60, 95))
+
+    truth = {
+        "amount": amount,
+        "date_iso": when.strftime("%Y-%m-%dT%H:%M:00"),
+        "ref": ref,
+        "kind": kind,
+        "width": width,
+    }
+    return out.getvalue(), truth
+
+
+# ---------------------------------------------------------------------------
+# Statements
+# ---------------------------------------------------------------------------
+
+def _register_pdf_font(font_path) -> str:
+    if not font_path:
+        return "Helvetica"
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+
+    name = "BenchThai"
+    if name not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(TTFont(name, font_path))
+    return name
+
+
+def make_statement(rng: random.Random, pages: int, font_path: Optional[str] = None,
+                   thai: bool = False):
+    """
+    A Krungsri-format statement PDF of `pages` pages: (pdf bytes, truth).
+    truth lists every transaction as [datetime, withdrawal, deposit, balance]
+    and, with Thai text, the account number and summary counts / totals.
+    """
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen import canvas
+
+    font = _register_pdf_font(font_path if thai else None)
+    account = f"{rng.randrange(1000):03d}-{rng.randrange(10)}-{rng.randrange(100000):05d}-{rng.randrange(10)}"
+    start = datetime(2026, rng.randrange(1, 13), 1)
+    when = start
+    # Enough to cover every withdrawal of the statement
+    balance = round(rng.uniform(50000, 500000) + pages * _ROWS_PER_PAGE * 30000, 2)
+
+    out = io.BytesIO()
+    pdf = canvas.Canvas(out, pagesize=A4)
+    _, height = A4
+    transactions = []
+    w_count = d_count = 0
+    w_total = d_total = 0.0
+
+    for page in range(1, pages + 1):
+        pdf.setFont(font, 9)
+        y = height - 40
+
+        def line(text, indent=40):
+            nonlocal y
+            pdf.drawString(indent, y, text)
+            y -= 14
+
+        line(f"Page {page}", indent=500)
+        if thai:
+            line("ธนาคารกรุงศรีอยุธยา จำกัด (มหาชน)")
+            if page == 1:
+                line("รายการเดินบัญชี")
+                line(f"ชื่อบัญชี {rng.choice(_NAMES_TH)}")
+                line(f"เลขบัญชีเงินฝาก {account}")
+                line("สาขาเจ้าของบัญชี สาขาทดสอบ")
+                end = start + timedelta(days=30)
+                line(f"รอบบัญชีระหว่างวันที่ {start:%d/%m/%Y} - {end:%d/%m/%Y}")
+            line("เวลาทำรายการ รายการ จำนวนเงิน ยอดคงเหลือ ช่องทาง รายละเอียด")
+
+        rows = 0
+        while rows < _ROWS_PER_PAGE - 1:
+            when += timedelta(seconds=rng.randrange(60, 3 * 3600))
+            amount = _amount(rng)
+            deposit = thai and rng.random() < 0.25
+            if deposit:
+                tx_type = rng.choice(_DEPOSIT_TYPES_TH)
+                balance = round(balance + amount, 2)
+                d_count += 1
+                d_total += amount
+            else:
+                tx_type = rng.choice(_WITHDRAWAL_TYPES_TH if thai else _WITHDRAWAL_TYPES_EN)
+                balance = round(balance - amount, 2)
+                w_count += 1
+                w_total += amount
+            stamp = when.strftime("%d/%m/%Y %H:%M:%S")
+            details = rng.choice(_NAMES_TH if thai else _NAMES_EN) if rng.random() < 0.5 else ""
+            line(f"{stamp} {tx_type} {amount:,.2f} {balance:,.2f} {rng.choice(_CHANNELS)} {details}".rstrip())
+            rows += 1
+            if thai and rng.random() < 0.4:
+                label = "บัญชีต้นทาง" if deposit else rng.choice(("บัญชีปลายทาง", "รหัสพร้อมเพย์"))
+                line(f"{label} : {_masked_account(rng)}", indent=60)
+                rows += 1
+            transactions.append([stamp, None if deposit else amount, amount if deposit else None, balance])
+
+        if thai and page == pages:
+            line(f"รายการถอนเงิน {w_count:,} รายการ {w_total:,.2f}")
+            line(f"รายการฝากเงิน {d_count:,} รายการ {d_total:,.2f}")
+        pdf.showPage()
+    pdf.save()
+
+    truth = {"pages": pages, "transactions": transactions}
+    if thai:
+        truth.update(
+            account_number=account,
+            withdrawal_count=w_count, withdrawal_total=round(w_total, 2),
+            deposit_count=d_count, deposit_total=round(d_total, 2),
+        )
+    return out.getvalue(), truth
+
+
+# ---------------------------------------------------------------------------
+# Corpus on disk
+# ---------------------------------------------------------------------------
+
+def write_corpus(out_dir: str, slips: int, pages: list, seed: int = 0,
+                 font_path: Optional[str] = None) -> dict:
+    """Write the slips, statements and manifest.json (the ground truth) under out_dir."""
+    font_path = find_thai_font(font_path)
+    thai = font_path is not None
+    if not thai:
+        print("No Thai font found (--font): generating an English-only corpus")
+    rng = random.Random(seed)
+
+    os.makedirs(os.path.join(out_dir, "slips"), exist_ok=True)
+    os.makedirs(os.path.join(out_dir, "statements"), exist_ok=True)
+    manifest = {"seed": seed, "thai": thai, "font": font_path, "slips": [], "statements": []}
+
+    for i in range(slips):
+        data, truth = make_slip(rng, font_path, thai)
+        ext = "png" if truth["kind"] == "screenshot" else "jpg"
+        name = os.path.join("slips", f"slip-{i:04d}.{ext}")
+        with open(os.path.join(out_dir, name), "wb") as f:
+            f.write(data)
+        manifest["slips"].append({"file": name, **truth})
+
+    for n in pages:
+        data, truth = make_statement(rng, n, font_path, thai)
+        name = os.path.join("statements", f"statement-{n:03d}p.pdf")
+        with open(os.path.join(out_dir, name), "wb") as f:
+            f.write(data)
+        manifest["statements"].append({"file": name, **truth})
+
+    with open(os.path.join(out_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    print(f"Corpus in {out_dir}: {slips} slips, statements of {pages} pages "
+          f"({'Thai' if thai else 'English'})")
+    return manifest
+
+
+def load_corpus(corpus_dir: str) -> dict:
+    """manifest.json of a corpus written by write_corpus."""
+    with open(os.path.join(corpus_dir, "manifest.json"), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def parse_pages(text: str) -> list:
+    """"1,10,50,200" → [1, 10, 50, 200]; statements have 1-200 pages."""
+    pages = [int(p) for p in text.split(",") if p.strip()]
+    if any(not 1 <= p <= 200 for p in pages):
+        raise argparse.ArgumentTypeError("statement pages must be between 1 and 200")
+    return pages
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate the synthetic benchmark corpus")
+    parser.add_argument("--out", default="bench-corpus", help="output directory")
+    parser.add_argument("--slips", type=int, default=100, help="number of slips")
+    parser.add_argument("--pages", type=parse_pages, default=[1, 10, 50, 200],
+                        help="comma-separated page counts, one statement each")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--font", help="TrueType font with Thai glyphs")
+    args = parser.parse_args()
+    write_corpus(args.out, args.slips, args.pages, args.seed, args.font)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,700 @@
+"""
+Benchmark suite for the slip OCR and statement pipelines.
+
+Targets (--targets, default all):
+  extract     process_image_bytes (decode + extract_info_from_image) on the
+              in-process OCR pool, --concurrency images at a time
+  statement   parse_krungsri_statement, one generated statement at a time
+  grpc        ProcessImage, ProcessBatch and ProcessStatement against a local
+              OCRService (threaded or asyncio, --server) with OCR worker
+              processes as in production.  Transactions go to an in-memory
+              store (--db, DB_BACKEND); n8n calls are only counted, or with
+              --webhook fake delivered through the outbox to a local
+              fake_n8n with --n8n-latency-ms / --n8n-failure-rate injected
+
+The corpus comes from bench_corpus: --corpus DIR, or generated into a
+temporary directory from --slips / --pages / --seed / --font.  Each target
+runs in a fresh process with the OCR cache off, so it OCRs every image and
+its peak RSS is its own.
+
+The JSON report (--out) has the run's metadata (git commit, Python, CPU
+count, OCR_* / STATEMENT_* / GRPC_* settings, corpus) and per target:
+
+  count, errors          items measured and how many failed (by reason)
+  seconds, throughput    wall time and items (or pages) per second
+  latency_ms             p50 / p95 / p99 / max of one item
+  peak_rss_mb            the target's process; peak_child_rss_mb is the
+                         largest child it reaped (OCR workers, tesseract)
+  accuracy               share of slips whose amount / date_iso / ref match
+                         the truth; for statements, share of transactions
+                         read exactly and of header / summary fields
+  duplicates             (grpc) slips / statement lines the store rejected
+                         as ingested before; each RPC pass runs against
+                         fresh fingerprints, so this should be 0
+  webhook                (grpc) outbox stats and how long it took to drain
+                         after the last RPC
+
+Run two releases on the same corpus and pass the older report as
+--baseline to print the changes.
+
+    python benchmark.py --slips 100 --pages 1,10,50,200 --out bench-results.json
+    python benchmark.py --corpus bench-corpus --targets grpc --server aio --baseline old.json
+"""
+
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent import futures
+from datetime import datetime, timezone
+
+import bench_corpus
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+TARGETS = ("extract", "statement", "grpc")
+SLIP_FIELDS = ("amount", "date_iso", "ref")
+_CONFIG_PREFIXES = ("OCR_", "STATEMENT_", "GRPC_MAX_", "GRPC_ASYNC", "BATCH_MAX_", "STREAM_MAX_", "QR_")
+
+
+# ---------------------------------------------------------------------------
+# Measurements
+# ---------------------------------------------------------------------------
+
+def percentiles(seconds: list) -> dict:
+    """p50 / p95 / p99 / max in milliseconds (nearest rank)."""
+    if not seconds:
+        return {}
+    ordered = sorted(seconds)
+
+    def rank(p):
+        return ordered[min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered))) - 1))]
+
+    return {
+        "p50": round(rank(50) * 1000, 2),
+        "p95": round(rank(95) * 1000, 2),
+        "p99": round(rank(99) * 1000, 2),
+        "max": round(ordered[-1] * 1000, 2),
+    }
+
+
+def _rss_mb(who) -> float:
+    if resource is None:
+        return None
+    peak = resource.getrusage(who).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+class Timings:
+    """Per-item latencies and error reasons of one measured run (thread-safe)."""
+
+    def __init__(self):
+        self.latencies = []
+        self.errors = Counter()
+        self._lock = threading.Lock()
+
+    def time(self, fn, *args):
+        """fn(*args), its latency recorded; None (and the error counted) if it raised."""
+        t0 = time.perf_counter()
+        try:
+            result = fn(*args)
+        except Exception as e:
+            with self._lock:
+                self.errors[_reason(e)] += 1
+            return None
+        with self._lock:
+            self.latencies.append(time.perf_counter() - t0)
+        return result
+
+    def report(self, seconds, items=None, unit="items") -> dict:
+        count = len(self.latencies) + sum(self.errors.values())
+        items = count if items is None else items
+        return {
+            "count": count,
+            "errors": dict(self.errors),
+            "seconds": round(seconds, 3),
+            f"{unit}_per_second": round(items / seconds, 3) if seconds else None,
+            "latency_ms": percentiles(self.latencies),
+        }
+
+
+def _reason(error) -> str:
+    code = getattr(error, "code", None)
+    if callable(code):
+        # grpc.RpcError: the status code name
+        return str(code()).rsplit(".", 1)[-1]
+    return type(error).__name__
+
+
+def _concurrently(fn, items, concurrency):
+    """[fn(item) for item in items] on `concurrency` threads; (results, wall seconds)."""
+    t0 = time.perf_counter()
+    with futures.ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        results = list(pool.map(fn, items))
+    return results, time.perf_counter() - t0
+
+
+# ---------------------------------------------------------------------------
+# Accuracy
+# ---------------------------------------------------------------------------
+
+def slip_accuracy(results, truths) -> dict:
+    """Share of slips per field (and all fields) read exactly as printed."""
+    hits = Counter()
+    for result, truth in zip(results, truths):
+        if result is None:
+            continue
+        matched = [str(result.get(field, "")) == truth[field] for field in SLIP_FIELDS]
+        for field, ok in zip(SLIP_FIELDS, matched):
+            hits[field] += ok
+        hits["all"] += all(matched)
+    total = len(truths)
+    return {field: round(hits[field] / total, 4) if total else None
+            for field in SLIP_FIELDS + ("all",)}
+
+
+def _float_or_none(value):
+    return float(value) if value not in (None, "") else None
+
+
+def statement_accuracy(parsed, truth) -> dict:
+    """
+    Transactions of one parsed statement against its truth: share read
+    exactly (datetime, withdrawal, deposit, balance), and the header /
+    summary fields both the truth and the parsed statement have.
+    """
+    expected = Counter(tuple(tx) for tx in truth["transactions"])
+    got = Counter(tuple(tx) for tx in parsed["transactions"])
+    matched = sum((expected & got).values())
+    accuracy = {
+        "transactions": round(matched / len(truth["transactions"]), 4),
+        "extra_transactions": sum((got - expected).values()),
+    }
+    for field in ("account_number", "withdrawal_count", "withdrawal_total",
+                  "deposit_count", "deposit_total"):
+        if field in truth and field in parsed:
+            accuracy[field] = parsed.get(field) == truth[field]
+    return accuracy
+
+
+def _statement_fields(stmt) -> dict:
+    """The fields statement_accuracy compares, from a BankStatement."""
+    fields = {
+        "account_number": stmt.account_number,
+        "transactions": [[tx.datetime, tx.withdrawal, tx.deposit, tx.balance]
+                         for tx in stmt.transactions],
+    }
+    if stmt.summary:
+        fields.update(
+            withdrawal_count=stmt.summary.withdrawal_count,
+            withdrawal_total=stmt.summary.withdrawal_total,
+            deposit_count=stmt.summary.deposit_count,
+            deposit_total=stmt.summary.deposit_total,
+        )
+    return fields
+
+
+def _statement_result_fields(result) -> dict:
+    """The fields statement_accuracy compares, from an ocr_pb2.StatementResult."""
+    return {
+        "account_number": result.account_number,
+        "transactions": [[tx.datetime, _float_or_none(tx.withdrawal), _float_or_none(tx.deposit),
+                          _float_or_none(tx.balance)] for tx in result.transactions],
+        "withdrawal_total": _float_or_none(result.withdrawal_total),
+        "deposit_total": _float_or_none(result.deposit_total),
+    }
+
+
+def _mean_accuracy(per_statement) -> dict:
+    """Averages of the per-statement accuracies (booleans as shares)."""
+    keys = {key for acc in per_statement for key in acc}
+    return {key: round(sum(acc[key] for acc in per_statement if key in acc)
+                       / sum(1 for acc in per_statement if key in acc), 4)
+            for key in sorted(keys)}
+
+
+# ---------------------------------------------------------------------------
+# Targets
+# ---------------------------------------------------------------------------
+
+def _read(corpus_dir, entry) -> bytes:
+    with open(os.path.join(corpus_dir, entry["file"]), "rb") as f:
+        return f.read()
+
+
+def bench_extract(args, corpus_dir, manifest) -> dict:
+    from main import process_image_bytes
+    from ocr_pool import OCRPool
+
+    slips = manifest["slips"]
+    images = [_read(corpus_dir, slip) for slip in slips]
+    pool = OCRPool(size=args.concurrency)
+    pool.warm_up()
+    for data in images[:args.warmup]:
+        process_image_bytes(data, pool)
+
+    timings = Timings()
+    results, seconds = _concurrently(
+        lambda data: timings.time(process_image_bytes, data, pool), images, args.concurrency)
+    report = timings.report(seconds, unit="images")
+    report["accuracy"] = slip_accuracy(results, slips)
+    return report
+
+
+def bench_statement(args, corpus_dir, manifest) -> dict:
+    from parse_bank_statement import parse_krungsri_statement
+
+    statements = manifest["statements"]
+    timings = Timings()
+    per_statement = []
+    total_pages = 0
+    t_all = time.perf_counter()
+    for entry in statements:
+        data = _read(corpus_dir, entry)
+        t0 = time.perf_counter()
+        stmt = timings.time(parse_krungsri_statement, data, args.statement_workers)
+        seconds = time.perf_counter() - t0
+        total_pages += entry["pages"]
+        item = {"file": entry["file"], "pages": entry["pages"], "seconds": round(seconds, 3),
+                "pages_per_second": round(entry["pages"] / seconds, 2)}
+        if stmt is not None:
+            item["accuracy"] = statement_accuracy(_statement_fields(stmt), entry)
+        per_statement.append(item)
+
+    report = timings.report(time.perf_counter() - t_all, items=total_pages, unit="pages")
+    report["accuracy"] = _mean_accuracy([s["accuracy"] for s in per_statement if "accuracy" in s])
+    report["statements"] = per_statement
+    return report
+
+
+class StubWebhook:
+    """WebhookDispatcher stand-in: enqueue() only counts the calls."""
+
+    def __init__(self):
+        self.enqueued = 0
+        self._lock = threading.Lock()
+
+    def enqueue(self, url, payload):
+        with self._lock:
+            self.enqueued += 1
+            return {"status": "queued", "id": self.enqueued}
+
+    def stats(self):
+        return {"enqueued": self.enqueued}
+
+    def stop(self):
+        pass
+
+
+def _webhook_dispatcher(args, tmp_dir):
+    """(dispatcher, fake n8n or None) the gRPC target's create_expenses calls go to."""
+    if args.webhook == "stub":
+        return StubWebhook(), None
+
+    from fake_n8n import FakeN8N
+    from webhook import WebhookDispatcher
+
+    n8n = FakeN8N(port=0, latency_ms=args.n8n_latency_ms,
+                  failure_rate=args.n8n_failure_rate).start()
+    # create_expenses reads it on every call
+    os.environ["N8N_PRODUCTION_API"] = n8n.url
+    dispatcher = WebhookDispatcher(outbox_path=os.path.join(tmp_dir, "outbox.db"))
+    dispatcher.start()
+    return dispatcher, n8n
+
+
+def _drain(dispatcher, timeout) -> float:
+    """Wait for the outbox to empty (at most timeout); seconds waited."""
+    t0 = time.perf_counter()
+    while time.perf_counter() - t0 < timeout and dispatcher.stats().get("queue_depth"):
+        time.sleep(0.1)
+    return round(time.perf_counter() - t0, 3)
+
+
+class PhaseStore:
+    """
+    The transaction store as seen by one pass of the gRPC target.
+
+    Every pass sends the same corpus, and a slip ingested before comes back
+    as a duplicate without an insert or an n8n call.  Slip fingerprints are
+    salted with the run and the pass so each pass measures the full path,
+    and whatever the store still rejects is counted.
+    """
+
+    def __init__(self, store, salt):
+        self._store = store
+        self._salt = salt
+        self.duplicates = 0
+        self._lock = threading.Lock()
+
+    def _count(self, duplicates):
+        with self._lock:
+            self.duplicates += duplicates
+
+    def record_transaction(self, *args, fingerprint=None, **kwargs):
+        if fingerprint is not None:
+            fingerprint = hashlib.sha256(f"{self._salt}:{fingerprint}".encode()).hexdigest()
+        txn_id, duplicate = self._store.record_transaction(*args, fingerprint=fingerprint, **kwargs)
+        self._count(int(duplicate))
+        return txn_id, duplicate
+
+    def insert_transactions_bulk(self, statement, *args, **kwargs):
+        ids = self._store.insert_transactions_bulk(statement, *args, **kwargs)
+        self._count(sum(1 for txn_id in ids if txn_id is None))
+        return ids
+
+    def __getattr__(self, name):
+        return getattr(self._store, name)
+
+
+def _start_server(kind, ocr_executor):
+    """Serve OCRService on a free localhost port; (port, stop())."""
+    import grpc
+
+    import ocr_pb2_grpc
+    from grpc_server import GRPC_MAX_IN_FLIGHT, SERVER_OPTIONS, OCRService
+
+    if kind == "threaded":
+        server = grpc.server(futures.ThreadPoolExecutor(max_workers=10), options=SERVER_OPTIONS,
+                             maximum_concurrent_rpcs=GRPC_MAX_IN_FLIGHT)
+        ocr_pb2_grpc.add_OCRServiceServicer_to_server(OCRService(ocr_executor), server)
+        port = server.add_insecure_port("127.0.0.1:0")
+        server.start()
+        return port, lambda: server.stop(0)
+
+    import asyncio
+
+    from grpc_aio_server import AsyncOCRService
+
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+
+    async def start():
+        server = grpc.aio.server(options=SERVER_OPTIONS)
+        ocr_pb2_grpc.add_OCRServiceServicer_to_server(AsyncOCRService(ocr_executor), server)
+        port = server.add_insecure_port("127.0.0.1:0")
+        await server.start()
+        return server, port
+
+    server, port = asyncio.run_coroutine_threadsafe(start(), loop).result()
+
+    def stop():
+        asyncio.run_coroutine_threadsafe(server.stop(0), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+    return port, stop
+
+
+def _check_rpc(response):
+    """Per-image errors come back inside the response; count them like RPC errors."""
+    if response.error:
+        raise RuntimeError(response.error)
+    return response
+
+
+def bench_grpc(args, corpus_dir, manifest) -> dict:
+    import grpc
+
+    import grpc_server
+    import ocr_pb2
+    import ocr_pb2_grpc
+    from ocr_executor import OCRExecutor
+
+    # The transaction store comes from DB_BACKEND (memory unless --db says otherwise)
+    tmp_dir = tempfile.mkdtemp(prefix="bench-grpc-")
+    dispatcher, n8n = _webhook_dispatcher(args, tmp_dir)
+    grpc_server.get_webhook_dispatcher = lambda: dispatcher
+    store = grpc_server.get_db_service()
+    run_id = uuid.uuid4().hex
+
+    def phase(name):
+        """A fresh PhaseStore for the next pass, installed as the server's store."""
+        phase_store = PhaseStore(store, f"{run_id}:{name}")
+        grpc_server.get_db_service = lambda: phase_store
+        return phase_store
+
+    ocr_executor = OCRExecutor(workers=args.workers)
+    ocr_executor.warm_up()
+    port, stop = _start_server(args.server, ocr_executor)
+    channel = grpc.insecure_channel(f"127.0.0.1:{port}", options=[
+        ("grpc.max_send_message_length", 64 * 1024 * 1024),
+        ("grpc.max_receive_message_length", 64 * 1024 * 1024),
+    ])
+    stub = ocr_pb2_grpc.OCRServiceStub(channel)
+
+    slips = manifest["slips"]
+    images = [_read(corpus_dir, slip) for slip in slips]
+    report = {"server": args.server, "workers": ocr_executor.workers}
+    try:
+        phase("warmup")
+        for data in images[:args.warmup]:
+            stub.ProcessImage(ocr_pb2.ImageRequest(image_data=data))
+
+        def process_image(data):
+            return _check_rpc(stub.ProcessImage(ocr_pb2.ImageRequest(image_data=data)))
+
+        phase_store = phase("ProcessImage")
+        timings = Timings()
+        responses, seconds = _concurrently(
+            lambda data: timings.time(process_image, data), images, args.concurrency)
+        report["ProcessImage"] = timings.report(seconds, unit="images")
+        report["ProcessImage"]["duplicates"] = phase_store.duplicates
+        report["ProcessImage"]["accuracy"] = slip_accuracy(
+            [_response_fields(r) if r is not None else None for r in responses], slips)
+
+        batches = [images[i:i + args.batch_size] for i in range(0, len(images), args.batch_size)]
+
+        def process_batch(batch):
+            request = ocr_pb2.BatchImageRequest(
+                requests=[ocr_pb2.ImageRequest(image_data=data) for data in batch])
+            return stub.ProcessBatch(request)
+
+        phase_store = phase("ProcessBatch")
+        timings = Timings()
+        responses, seconds = _concurrently(
+            lambda batch: timings.time(process_batch, batch),
+            batches, max(1, args.concurrency // args.batch_size))
+        report["ProcessBatch"] = timings.report(seconds, items=len(images), unit="images")
+        report["ProcessBatch"]["batch_size"] = args.batch_size
+        report["ProcessBatch"]["duplicates"] = phase_store.duplicates
+        report["ProcessBatch"]["image_errors"] = sum(
+            1 for r in responses if r is not None for result in r.results if result.error)
+
+        phase_store = phase("ProcessStatement")
+        timings = Timings()
+        per_statement = []
+        total_pages = 0
+        t_all = time.perf_counter()
+        for entry in manifest["statements"]:
+            request = ocr_pb2.PDFStatementRequest(pdf_data=_read(corpus_dir, entry))
+            result = timings.time(lambda: _check_rpc(stub.ProcessStatement(request)))
+            total_pages += entry["pages"]
+            if result is not None:
+                per_statement.append(statement_accuracy(_statement_result_fields(result), entry))
+        report["ProcessStatement"] = timings.report(time.perf_counter() - t_all,
+                                                    items=total_pages, unit="pages")
+        report["ProcessStatement"]["accuracy"] = _mean_accuracy(per_statement)
+        # Statement lines are keyed by the store itself: a re-run against the
+        # same Postgres shows up here
+        report["ProcessStatement"]["duplicates"] = phase_store.duplicates
+    finally:
+        channel.close()
+        stop()
+        # Reaps the workers, so their peak RSS counts as the children's
+        ocr_executor.shutdown()
+
+    # How long the n8n deliveries trail the RPCs
+    report["webhook"] = {"mode": args.webhook, "drain_seconds": _drain(dispatcher, args.drain_timeout)}
+    report["webhook"].update(dispatcher.stats())
+    dispatcher.stop()
+    if n8n is not None:
+        report["webhook"]["n8n"] = n8n.stats()
+        n8n.shutdown()
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    return report
+
+
+def _response_fields(response) -> dict:
+    return {"amount": response.amount, "date_iso": response.date_iso, "ref": response.ref}
+
+
+_BENCHES = {"extract": bench_extract, "statement": bench_statement, "grpc": bench_grpc}
+
+
+def _run_target(name, args, corpus_dir, manifest, queue):
+    """Child process entry point: one target, its report put on queue."""
+    try:
+        report = _BENCHES[name](args, corpus_dir, manifest)
+        report["peak_rss_mb"] = _rss_mb(resource.RUSAGE_SELF) if resource else None
+        report["peak_child_rss_mb"] = _rss_mb(resource.RUSAGE_CHILDREN) if resource else None
+    except Exception as e:
+        report = {"failed": f"{type(e).__name__}: {e}"}
+    queue.put(report)
+
+
+def run_target(name, args, corpus_dir, manifest) -> dict:
+    """Run one target in a fresh (spawned) process and return its report."""
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    proc = ctx.Process(target=_run_target, args=(name, args, corpus_dir, manifest, queue))
+    proc.start()
+    # Read before join: a large report would block the child on the pipe
+    report = queue.get()
+    proc.join()
+    return report
+
+
+# ---------------------------------------------------------------------------
+# Report
+# ---------------------------------------------------------------------------
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)),
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def metadata(args, manifest) -> dict:
+    return {
+        "started": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "config": {key: value for key, value in sorted(os.environ.items())
+                   if key.startswith(_CONFIG_PREFIXES)},
+        "args": {key: value for key, value in vars(args).items()
+                 if key not in ("out", "baseline")},
+        "corpus": {
+            "seed": manifest["seed"],
+            "thai": manifest["thai"],
+            "font": manifest["font"],
+            "slips": len(manifest["slips"]),
+            "statement_pages": [s["pages"] for s in manifest["statements"]],
+        },
+    }
+
+
+def _summary_rows(results) -> dict:
+    """{name: (throughput, unit, p95 ms, accuracy)} of every measured run in a report."""
+    rows = {}
+
+    def add(name, report):
+        if not isinstance(report, dict) or "latency_ms" not in report:
+            return
+        unit, rate = next(((k, v) for k, v in report.items() if k.endswith("_per_second")),
+                          ("", None))
+        accuracy = report.get("accuracy", {})
+        rows[name] = (rate, unit.replace("_per_second", "/s"), report["latency_ms"].get("p95"),
+                      accuracy.get("all", accuracy.get("transactions")))
+
+    for name, report in results.items():
+        add(name, report)
+        if name == "grpc" and isinstance(report, dict):
+            for rpc, rpc_report in report.items():
+                add(f"grpc.{rpc}", rpc_report)
+    return rows
+
+
+def print_summary(results, baseline=None) -> None:
+    rows = _summary_rows(results)
+    before = _summary_rows(baseline["results"]) if baseline else {}
+    print(f"\n{'target':<24}{'throughput':>20}{'p95 ms':>12}{'accuracy':>10}")
+    for name, (rate, unit, p95, accuracy) in rows.items():
+        print(f"{name:<24}{f'{rate} {unit}':>20}{p95 if p95 is not None else '-':>12}"
+              f"{accuracy if accuracy is not None else '-':>10}")
+        if name in before:
+            old_rate, _, old_p95, old_accuracy = before[name]
+            print(f"{'  vs baseline':<24}{_change(rate, old_rate):>20}{_change(p95, old_p95):>12}"
+                  f"{_change(accuracy, old_accuracy, relative=False):>10}")
+    for name, report in results.items():
+        if "failed" in report:
+            print(f"{name:<24}failed: {report['failed']}")
+        elif name == "grpc":
+            for rpc, rpc_report in report.items():
+                if isinstance(rpc_report, dict) and rpc_report.get("duplicates"):
+                    print(f"grpc.{rpc:<19}{rpc_report['duplicates']} duplicates "
+                          f"(not inserted, no webhook)")
+
+
+def _change(new, old, relative=True) -> str:
+    if new is None or old is None:
+        return "-"
+    if not relative:
+        return f"{new - old:+.4f}"
+    return f"{(new - old) / old * 100:+.1f}%" if old else "-"
+
+
+# ---------------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------------
+
+def _targets(text):
+    names = [t.strip() for t in text.split(",") if t.strip()]
+    unknown = set(names) - set(TARGETS)
+    if unknown:
+        raise argparse.ArgumentTypeError(f"unknown target(s) {sorted(unknown)}; choose from {TARGETS}")
+    return names
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the OCR and statement pipelines")
+    parser.add_argument("--targets", type=_targets, default=list(TARGETS),
+                        help="comma-separated: extract, statement, grpc")
+    parser.add_argument("--corpus", help="corpus directory from bench_corpus.py "
+                                         "(default: generate one into a temp directory)")
+    parser.add_argument("--slips", type=int, default=50, help="slips to generate")
+    parser.add_argument("--pages", type=bench_corpus.parse_pages, default=[1, 10, 50],
+                        help="page counts of the statements to generate")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--font", help="TrueType font with Thai glyphs for the generated corpus")
+    parser.add_argument("--concurrency", type=int, default=4,
+                        help="images in flight (extract pool size / gRPC client threads)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="OCR worker processes of the gRPC server (0: in-process)")
+    parser.add_argument("--statement-workers", type=int, default=None,
+                        help="page extraction processes (default STATEMENT_PARSE_WORKERS)")
+    parser.add_argument("--server", choices=("threaded", "aio"), default="threaded")
+    parser.add_argument("--batch-size", type=int, default=8, help="images per ProcessBatch call")
+    parser.add_argument("--db", choices=("memory", "sqlite", "postgres"), default="memory",
+                        help="DB_BACKEND of the gRPC target (postgres: the DB_* settings)")
+    parser.add_argument("--webhook", choices=("stub", "fake"), default="stub",
+                        help="n8n calls of the gRPC target: counted only, or delivered through "
+                             "the outbox to a local fake_n8n")
+    parser.add_argument("--n8n-latency-ms", type=float, default=0, help="fake n8n response delay")
+    parser.add_argument("--n8n-failure-rate", type=float, default=0,
+                        help="share of fake n8n calls failing with 503")
+    parser.add_argument("--drain-timeout", type=float, default=30,
+                        help="seconds to wait for the webhook outbox to empty")
+    parser.add_argument("--warmup", type=int, default=2, help="slips processed before measuring")
+    parser.add_argument("--out", default="bench-results.json", help="JSON report")
+    parser.add_argument("--baseline", help="earlier JSON report to compare against")
+    args = parser.parse_args()
+
+    # Every image must go through OCR, not the upload cache
+    os.environ["OCR_CACHE_ENABLED"] = "0"
+
+    with tempfile.TemporaryDirectory(prefix="bench-corpus-") as tmp:
+        # Inherited by the target processes
+        os.environ["DB_BACKEND"] = args.db
+        os.environ["DB_SQLITE_PATH"] = os.path.join(tmp, "transactions.db")
+        corpus_dir = args.corpus or tmp
+        if args.corpus:
+            manifest = bench_corpus.load_corpus(corpus_dir)
+        else:
+            manifest = bench_corpus.write_corpus(tmp, args.slips, args.pages, args.seed, args.font)
+
+        report = {"meta": metadata(args, manifest), "results": {}}
+        for name in args.targets:
+            print(f"Running {name}...")
+            report["results"][name] = run_target(name, args, corpus_dir, manifest)
+
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_summary(report["results"], baseline)
+    print(f"\nReport written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
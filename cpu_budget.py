@@ -0,0 +1,60 @@
+"""
+CPUs this process may actually use.
+
+os.cpu_count() reports every core of the node.  In a pod the process is
+confined by its CPU affinity mask (cpuset) and throttled by the cgroup CPU
+quota (resources.limits.cpu), so sizing worker pools by cpu_count() starts
+far more busy processes than there are CPUs to run them.
+
+Used for the default size of the OCR worker processes (ocr_executor), the
+Tesseract engine pool (ocr_pool) and the statement page workers
+(parse_bank_statement).
+"""
+
+import math
+import os
+from typing import Optional
+
+
+# cgroup v2, then v1
+_CPU_MAX = "/sys/fs/cgroup/cpu.max"
+_CFS_QUOTA = "/sys/fs/cgroup/cpu/cpu.cfs_quota_us"
+_CFS_PERIOD = "/sys/fs/cgroup/cpu/cpu.cfs_period_us"
+
+
+def _read(path: str) -> Optional[str]:
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def cgroup_cpu_quota() -> Optional[float]:
+    """CPUs allowed by the cgroup quota (1.5 for limits.cpu: 1500m); None when unlimited."""
+    cpu_max = _read(_CPU_MAX)
+    if cpu_max:
+        quota, _, period = cpu_max.partition(" ")
+        if quota != "max" and period:
+            return int(quota) / int(period)
+        return None
+    quota, period = _read(_CFS_QUOTA), _read(_CFS_PERIOD)
+    if quota and period and int(quota) > 0:
+        return int(quota) / int(period)
+    return None
+
+
+def available_cpus() -> int:
+    """Affinity-mask CPUs, capped by the cgroup quota (rounded up); at least 1."""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        # No affinity API (macOS, Windows)
+        cpus = os.cpu_count() or 1
+    try:
+        quota = cgroup_cpu_quota()
+    except ValueError:
+        quota = None
+    if quota:
+        cpus = min(cpus, math.ceil(quota))
+    return max(1, cpus)
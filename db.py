@@ -1,7 +1,78 @@
+import hashlib
 import psycopg2
+from psycopg2 import pool as pg_pool
+from psycopg2.extras import execute_values
 import os
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime
 
+from extractor import NOT_FOUND, OCR_FIELD_CONFIDENCE, parse_amount, parse_datetime_text
+
+# Errors that mean the connection itself is gone (server restart, network drop)
+_CONNECTION_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError)
+
+# Transaction store: postgres (DBService), sqlite (file at DB_SQLITE_PATH) or
+# memory; the last two are db_sqlite.SQLiteDBService, for running without Postgres
+DB_BACKEND = os.environ.get("DB_BACKEND", "postgres").lower()
+DB_SQLITE_PATH = os.environ.get("DB_SQLITE_PATH", "transactions.db")
+# Bring the schema up to date when the store is opened ("0": only verify it
+# and refuse to start when it is out of date, e.g. when a job runs migrations)
+DB_MIGRATE_ON_START = os.environ.get("DB_MIGRATE_ON_START", "1") != "0"
+
+
+# ---------------------------------------------------------------------------
+# Fingerprints: the same slip / statement line always hashes to the same key
+# ---------------------------------------------------------------------------
+
+def _fingerprint(*parts) -> str:
+    return hashlib.sha256("|".join(str(p) for p in parts).encode("utf-8")).hexdigest()
+
+
+# A ref shorter than this, or without a digit, is more likely a misread label
+# word than a bank reference
+_SLIP_REF_MIN_LENGTH = 6
+
+
+def _trusted_ref(result):
+    """The slip's ref when it looks like a real bank reference read with confidence, else None."""
+    ref = result.get("ref")
+    if not ref or ref == NOT_FOUND or len(ref) < _SLIP_REF_MIN_LENGTH:
+        return None
+    if not any(ch.isdigit() for ch in ref):
+        return None
+    if result.get("confidence", {}).get("ref", 0.0) < OCR_FIELD_CONFIDENCE:
+        return None
+    return ref
+
+
+def slip_fingerprint(result, image_data=None):
+    """
+    Key of an OCR'd slip: its bank reference + amount (+ date_iso when it was
+    read) when the ref can be trusted (see _trusted_ref), so re-photographed
+    or re-encoded uploads still match; else the image bytes. None when
+    neither is available.
+    """
+    amount = parse_amount(result.get("amount"))
+    ref = _trusted_ref(result)
+    if amount is not None and ref:
+        # Slips read from the QR alone carry no date
+        date_iso = result.get("date_iso") or ""
+        if date_iso:
+            return _fingerprint("slip", ref, f"{amount:.2f}", date_iso)
+        return _fingerprint("slip", ref, f"{amount:.2f}")
+    if image_data is not None:
+        return _fingerprint("slip-image", hashlib.blake2b(image_data, digest_size=20).hexdigest())
+    return None
+
+
+def statement_line_fingerprint(account_number, tx):
+    """Key of one statement line: account + datetime + signed amount + balance after it."""
+    amount = -tx.withdrawal if tx.withdrawal is not None else tx.deposit
+    return _fingerprint("stmt", account_number, tx.datetime, f"{amount:.2f}", f"{tx.balance:.2f}")
+
+
 class DBService:
     def __init__(self):
         self.dbname = os.environ.get("DB_NAME", "IE")
@@ -10,6 +81,26 @@ class DBService:
         self.host = os.environ.get("DB_HOST", "192.168.1.44")
         self.port = os.environ.get("DB_PORT", "5432")
 
+        # Connection pool shared by every OCRService handler thread
+        self.pool_min = int(os.environ.get("DB_POOL_MIN", "1"))
+        self.pool_max = int(os.environ.get("DB_POOL_MAX", "10"))
+        # Connections idle longer than this are pinged before being handed out
+        self.health_check_after = float(os.environ.get("DB_POOL_HEALTHCHECK_SECONDS", "30"))
+
+        # Slip / statement times carry no zone; this is the zone they were printed in
+        self.timezone = os.environ.get("DB_TIMEZONE", "Asia/Bangkok")
+        # New tables only: range-partition transactions by occurred_at month
+        self.partition_monthly = os.environ.get("DB_PARTITION_MONTHLY", "0") == "1"
+        self.partition_months_ahead = int(os.environ.get("DB_PARTITION_MONTHS_AHEAD", "3"))
+        # Statements and late uploads carry dates well in the past
+        self.partition_months_back = int(os.environ.get("DB_PARTITION_MONTHS_BACK", "24"))
+
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        # ThreadedConnectionPool raises when exhausted; make callers wait instead
+        self._slots = threading.BoundedSemaphore(self.pool_max)
+        self._last_used = {}
+
     def get_connection(self):
         return psycopg2.connect(
             dbname=self.dbname,
@@ -19,58 +110,536 @@ class DBService:
             port=self.port
         )
 
-    def create_table(self):
-        conn = None
+    def _get_pool(self):
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._pool = pg_pool.ThreadedConnectionPool(
+                        self.pool_min,
+                        self.pool_max,
+                        dbname=self.dbname,
+                        user=self.user,
+                        password=self.password,
+                        host=self.host,
+                        port=self.port
+                    )
+        return self._pool
+
+    def _is_healthy(self, conn):
+        if conn.closed:
+            return False
+        last_used = self._last_used.get(id(conn), 0)
+        if time.monotonic() - last_used < self.health_check_after:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except _CONNECTION_ERRORS:
+            return False
+
+    @contextmanager
+    def connection(self):
+        """Borrow a healthy pooled connection; broken ones are discarded on return."""
+        self._slots.acquire()
+        try:
+            pool = self._get_pool()
+            conn = pool.getconn()
+            if not self._is_healthy(conn):
+                self._last_used.pop(id(conn), None)
+                pool.putconn(conn, close=True)
+                conn = pool.getconn()
+
+            broken = False
+            try:
+                yield conn
+            except _CONNECTION_ERRORS:
+                broken = True
+                raise
+            finally:
+                broken = broken or conn.closed != 0
+                if broken:
+                    self._last_used.pop(id(conn), None)
+                else:
+                    self._last_used[id(conn)] = time.monotonic()
+                pool.putconn(conn, close=broken)
+        finally:
+            self._slots.release()
+
+    def _run(self, work):
+        """Run work(conn) on a pooled connection, reconnecting once if the connection dropped."""
         try:
-            conn = self.get_connection()
+            with self.connection() as conn:
+                return work(conn)
+        except _CONNECTION_ERRORS as e:
+            print(f"DB connection lost ({e}), reconnecting")
+            with self.connection() as conn:
+                return work(conn)
+
+    def close(self):
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.closeall()
+                self._pool = None
+                self._last_used.clear()
+
+    # -- schema -------------------------------------------------------------
+    #
+    # amount / date keep the text exactly as OCR or the statement produced it
+    # ("Not found" included). amount_value / occurred_at are the typed copies
+    # every report should filter and aggregate on.
+
+    _COLUMNS = """
+        amount VARCHAR(50),
+        date VARCHAR(50),
+        description TEXT,
+        type_of_ie VARCHAR(50),
+        username VARCHAR(100),
+        amount_value NUMERIC(14,2),
+        occurred_at TIMESTAMPTZ,
+        fingerprint CHAR(64),
+    """
+
+    _INDEXES = (
+        ("transactions_occurred_at_idx", "(occurred_at)"),
+        ("transactions_username_occurred_at_idx", "(username, occurred_at)"),
+        ("transactions_type_occurred_at_idx", "(type_of_ie, occurred_at)"),
+        ("transactions_fingerprint_idx", "(fingerprint)"),
+    )
+
+    def create_table(self):
+        def work(conn):
             cur = conn.cursor()
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS transactions (
-                    id SERIAL PRIMARY KEY,
-                    amount VARCHAR(50),
-                    date VARCHAR(50),
-                    description TEXT,
-                    type_of_ie VARCHAR(50),
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                );
-            """)
+            if self.partition_monthly:
+                # Partitioned by the transaction's own time, so occurred_at
+                # range reports (expense_summary) only scan their months. A
+                # primary key would have to include occurred_at, which is NULL
+                # when OCR could not read a date, so id only gets an index;
+                # deduplication never relied on it (transaction_fingerprints).
+                # NULL and out-of-range dates land in the DEFAULT partition.
+                cur.execute(f"""
+                    CREATE TABLE IF NOT EXISTS transactions (
+                        id SERIAL,
+                        {self._COLUMNS}
+                        created_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP
+                    ) PARTITION BY RANGE (occurred_at);
+                """)
+                cur.execute("""
+                    CREATE TABLE IF NOT EXISTS transactions_default
+                    PARTITION OF transactions DEFAULT;
+                """)
+                cur.execute("CREATE INDEX IF NOT EXISTS transactions_id_idx ON transactions (id);")
+            else:
+                cur.execute(f"""
+                    CREATE TABLE IF NOT EXISTS transactions (
+                        id SERIAL PRIMARY KEY,
+                        {self._COLUMNS}
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    );
+                """)
             conn.commit()
             cur.close()
+
+        try:
+            self._run(work)
             print("Table 'transactions' check/creation successful.")
         except Exception as e:
+            # The pool rolls back any open transaction when the connection is returned
             print(f"Error creating table: {e}")
-            if conn:
-                conn.rollback()
-        finally:
-            if conn:
-                conn.close()
+            return
+        self.migrate_schema()
+        if self.partition_monthly:
+            self.ensure_partitions()
+
+    def migrate_schema(self):
+        """
+        Bring an existing transactions table up to the typed schema: add the
+        typed / username columns and the reporting indexes. Idempotent.
+
+        Indexes on a plain table are built CONCURRENTLY so a large table keeps
+        taking inserts meanwhile. Existing rows are filled in by
+        backfill_typed_columns().
+        """
+        def work(conn):
+            conn.autocommit = True
+            try:
+                cur = conn.cursor()
+                cur.execute("""
+                    ALTER TABLE transactions
+                        ADD COLUMN IF NOT EXISTS username VARCHAR(100),
+                        ADD COLUMN IF NOT EXISTS amount_value NUMERIC(14,2),
+                        ADD COLUMN IF NOT EXISTS occurred_at TIMESTAMPTZ,
+                        ADD COLUMN IF NOT EXISTS fingerprint CHAR(64);
+                """)
+                # One row per ingested fingerprint. Its primary key is the
+                # unique index deduplication relies on; it lives outside
+                # transactions so it stays global when that table is
+                # partitioned (a partitioned unique index must include the
+                # partition key)
+                cur.execute("""
+                    CREATE TABLE IF NOT EXISTS transaction_fingerprints (
+                        fingerprint CHAR(64) PRIMARY KEY,
+                        created_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP
+                    );
+                """)
+                cur.execute("""
+                    SELECT c.relkind = 'p' FROM pg_class c
+                    WHERE c.oid = 'transactions'::regclass;
+                """)
+                partitioned = cur.fetchone()[0]
+                # CONCURRENTLY is not supported on a partitioned parent
+                concurrently = "" if partitioned else "CONCURRENTLY"
+                for name, columns in self._INDEXES:
+                    cur.execute(
+                        f"CREATE INDEX {concurrently} IF NOT EXISTS {name} ON transactions {columns};"
+                    )
+                cur.close()
+                return partitioned
+            finally:
+                conn.autocommit = False
 
-    def insert_transaction(self, amount, date, description, type_of_ie):
-        conn = None
         try:
-            conn = self.get_connection()
+            partitioned = self._run(work)
+            print("Schema migration successful"
+                  + (" (monthly partitions)" if partitioned else ""))
+            if self.partition_monthly and not partitioned:
+                print("DB_PARTITION_MONTHLY only applies to a newly created table; "
+                      "existing 'transactions' stays unpartitioned")
+        except Exception as e:
+            print(f"Error migrating schema: {e}")
+
+    def ensure_partitions(self, months_ahead=None, months_back=None):
+        """
+        Create the monthly occurred_at partitions from months_back months ago
+        to months_ahead months out. Runs on every start, so the window moves
+        with the calendar.
+        """
+        months_ahead = self.partition_months_ahead if months_ahead is None else months_ahead
+        months_back = self.partition_months_back if months_back is None else months_back
+        this_month = datetime.now().date().replace(day=1)
+        months = []
+        for i in range(-months_back, months_ahead + 2):
+            y, m = divmod(this_month.month - 1 + i, 12)
+            months.append(this_month.replace(year=this_month.year + y, month=m + 1))
+
+        def work(conn):
+            conn.autocommit = True
+            try:
+                cur = conn.cursor()
+                # Partition bounds are read in the zone the dates were printed in
+                cur.execute("SET TIME ZONE %s;", (self.timezone,))
+                for start, end in zip(months, months[1:]):
+                    try:
+                        cur.execute(f"""
+                            CREATE TABLE IF NOT EXISTS transactions_{start:%Y%m}
+                            PARTITION OF transactions FOR VALUES FROM ('{start}') TO ('{end}');
+                        """)
+                    except psycopg2.Error as e:
+                        # e.g. transactions_default already holds rows of that month
+                        print(f"Error creating partition for {start:%Y-%m}: {e}")
+                cur.execute("RESET TIME ZONE;")
+                cur.close()
+            finally:
+                conn.autocommit = False
+
+        try:
+            self._run(work)
+        except Exception as e:
+            # Rows still land in transactions_default
+            print(f"Error creating partitions: {e}")
+
+    _REQUIRED_COLUMNS = ("username", "amount_value", "occurred_at", "fingerprint")
+
+    def verify_schema(self):
+        """Raise RuntimeError unless the typed columns and transaction_fingerprints exist."""
+        def work(conn):
             cur = conn.cursor()
-            
             cur.execute("""
-                INSERT INTO transactions (amount, date, description, type_of_ie)
-                VALUES (%s, %s, %s, %s)
-                RETURNING id;
-            """, (amount, date, description, type_of_ie))
-            
-            txn_id = cur.fetchone()[0]
+                SELECT column_name FROM information_schema.columns
+                WHERE table_schema = current_schema() AND table_name = 'transactions';
+            """)
+            columns = {row[0] for row in cur.fetchall()}
+            cur.execute("SELECT to_regclass('transaction_fingerprints') IS NOT NULL;")
+            has_fingerprints = cur.fetchone()[0]
+            conn.rollback()
+            cur.close()
+            return columns, has_fingerprints
+
+        columns, has_fingerprints = self._run(work)
+        if not columns:
+            missing = ["table transactions"]
+        else:
+            missing = [f"column {name}" for name in self._REQUIRED_COLUMNS if name not in columns]
+        if not has_fingerprints:
+            missing.append("table transaction_fingerprints")
+        if missing:
+            raise RuntimeError(
+                f"Transactions schema is out of date (missing {', '.join(missing)}); "
+                "run python db.py or start with DB_MIGRATE_ON_START=1"
+            )
+
+    def ensure_schema(self, migrate=None):
+        """
+        Create / migrate the schema (unless migrate=False, default
+        DB_MIGRATE_ON_START), then verify it: RuntimeError when it is still
+        out of date, so the server fails at startup instead of on every insert.
+        """
+        if DB_MIGRATE_ON_START if migrate is None else migrate:
+            self.create_table()
+        self.verify_schema()
+
+    def backfill_typed_columns(self, batch_size=1000):
+        """
+        Parse amount / date text of rows written before the typed columns
+        existed into amount_value / occurred_at, batch_size rows per commit.
+        Rows that don't parse ("Not found") stay NULL. Returns rows updated.
+        """
+        def next_batch(after_id):
+            def work(conn):
+                cur = conn.cursor()
+                cur.execute("""
+                    SELECT id, amount, date FROM transactions
+                    WHERE id > %s AND amount_value IS NULL AND occurred_at IS NULL
+                    ORDER BY id LIMIT %s;
+                """, (after_id, batch_size))
+                rows = cur.fetchall()
+                values = [
+                    (row_id, parse_amount(amount), parse_datetime_text(text) or None)
+                    for row_id, amount, text in rows
+                ]
+                values = [v for v in values if v[1] is not None or v[2] is not None]
+                if values:
+                    self._set_local_timezone(cur)
+                    execute_values(cur, """
+                        UPDATE transactions AS t
+                        SET amount_value = v.amount_value::numeric,
+                            occurred_at = v.occurred_at::timestamptz
+                        FROM (VALUES %s) AS v (id, amount_value, occurred_at)
+                        WHERE t.id = v.id;
+                    """, values, template="(%s, %s::text, %s::text)", page_size=batch_size)
+                conn.commit()
+                cur.close()
+                return (rows[-1][0] if rows else None), len(values)
+            return self._run(work)
+
+        updated = 0
+        last_id = 0
+        try:
+            while True:
+                last_id, count = next_batch(last_id)
+                if last_id is None:
+                    break
+                updated += count
+        except Exception as e:
+            print(f"Error backfilling typed columns: {e}")
+        print(f"Backfilled {updated} transactions")
+        return updated
+
+    def _set_local_timezone(self, cur):
+        # Naive ISO strings cast to TIMESTAMPTZ are read in the session zone
+        cur.execute("SET LOCAL TIME ZONE %s;", (self.timezone,))
+
+    def insert_transaction(self, amount, date, description, type_of_ie, username=None, date_iso=None):
+        """Insert one row; returns its id (None on failure)."""
+        txn_id, _ = self.record_transaction(amount, date, description, type_of_ie,
+                                            username=username, date_iso=date_iso)
+        return txn_id
+
+    def record_transaction(self, amount, date, description, type_of_ie, username=None,
+                           date_iso=None, fingerprint=None):
+        """
+        Insert one row unless its fingerprint was already ingested.
+
+        Returns (id, duplicate): (new id, False) when inserted, (id of the
+        earlier row, True) for a duplicate, (None, False) on failure. The
+        fingerprint is claimed and the row inserted in a single statement.
+        """
+        amount_value = parse_amount(amount)
+        occurred_at = date_iso or parse_datetime_text(date) or None
+        values = (amount, date, description, type_of_ie, username, amount_value, occurred_at)
+
+        def work(conn):
+            cur = conn.cursor()
+            self._set_local_timezone(cur)
+            if fingerprint is None:
+                cur.execute("""
+                    INSERT INTO transactions
+                        (amount, date, description, type_of_ie, username, amount_value, occurred_at)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s::timestamptz)
+                    RETURNING id;
+                """, values)
+            else:
+                cur.execute("""
+                    WITH claimed AS (
+                        INSERT INTO transaction_fingerprints (fingerprint) VALUES (%s)
+                        ON CONFLICT DO NOTHING
+                        RETURNING fingerprint
+                    )
+                    INSERT INTO transactions
+                        (amount, date, description, type_of_ie, username, amount_value, occurred_at,
+                         fingerprint)
+                    SELECT %s, %s, %s, %s, %s, %s, %s::timestamptz, fingerprint FROM claimed
+                    RETURNING id;
+                """, (fingerprint,) + values)
+            row = cur.fetchone()
+            if row is None:
+                conn.rollback()
+                cur.execute("SELECT id FROM transactions WHERE fingerprint = %s ORDER BY id LIMIT 1;",
+                            (fingerprint,))
+                existing = cur.fetchone()
+                conn.rollback()
+                cur.close()
+                return (existing[0] if existing else None), True
             conn.commit()
             cur.close()
-            print(f"Transaction inserted with ID: {txn_id}")
-            return txn_id
+            return row[0], False
+
+        try:
+            txn_id, duplicate = self._run(work)
+            if duplicate:
+                print(f"Duplicate transaction skipped (existing ID: {txn_id})")
+            else:
+                print(f"Transaction inserted with ID: {txn_id}")
+            return txn_id, duplicate
         except Exception as e:
             print(f"Error inserting transaction: {e}")
-            if conn:
-                conn.rollback()
-            return None
-        finally:
-            if conn:
-                conn.close()
+            return None, False
+
+    def insert_transactions_bulk(self, statement, page_size=1000, username=None):
+        """
+        Insert the transactions of a parsed BankStatement that were not
+        ingested before, in one DB transaction.
+
+        Each line is keyed by statement_line_fingerprint. Rows go out as
+        multi-row pages (execute_values) that claim their fingerprints with
+        INSERT ... ON CONFLICT DO NOTHING and insert only the rows whose claim
+        succeeded, so re-importing a statement inserts nothing.
+
+        Returns one entry per statement transaction, in order: the new id, or
+        None for a line that was already ingested ([] on failure).
+        """
+        fingerprints = [
+            statement_line_fingerprint(statement.account_number, tx)
+            for tx in statement.transactions
+        ]
+        rows = {}
+        for fp, tx in zip(fingerprints, statement.transactions):
+            # Identical lines within one statement are a single transaction
+            rows.setdefault(fp, (
+                str(tx.withdrawal if tx.withdrawal is not None else tx.deposit),
+                tx.datetime,
+                tx.transaction_type + (" | " + tx.details if tx.details else ""),
+                "STATEMENT_WITHDRAW" if tx.withdrawal is not None else "STATEMENT_DEPOSIT",
+                username,
+                tx.withdrawal if tx.withdrawal is not None else tx.deposit,
+                tx.datetime_iso or None,
+                fp,
+            ))
+        if not rows:
+            return []
+
+        def work(conn):
+            cur = conn.cursor()
+            self._set_local_timezone(cur)
+            result = execute_values(cur, """
+                WITH incoming (amount, date, description, type_of_ie, username,
+                               amount_value, occurred_at, fingerprint) AS (
+                    VALUES %s
+                ), claimed AS (
+                    INSERT INTO transaction_fingerprints (fingerprint)
+                    SELECT fingerprint FROM incoming
+                    ON CONFLICT DO NOTHING
+                    RETURNING fingerprint
+                )
+                INSERT INTO transactions
+                    (amount, date, description, type_of_ie, username, amount_value, occurred_at,
+                     fingerprint)
+                SELECT i.amount, i.date, i.description, i.type_of_ie, i.username,
+                       i.amount_value, i.occurred_at, i.fingerprint
+                FROM incoming i JOIN claimed c ON c.fingerprint = i.fingerprint
+                RETURNING id, fingerprint;
+            """, list(rows.values()),
+                template="(%s, %s, %s, %s, %s, %s::numeric, %s::timestamptz, %s::char(64))",
+                page_size=page_size, fetch=True)
+            conn.commit()
+            cur.close()
+            return dict((fp.strip(), txn_id) for txn_id, fp in result)
+
+        try:
+            inserted = self._run(work)
+            print(f"Inserted {len(inserted)} statement transactions "
+                  f"({len(fingerprints) - len(inserted)} already ingested)")
+            # Only the first of identical lines maps to the new id
+            ids = []
+            for fp in fingerprints:
+                ids.append(inserted.pop(fp, None))
+            return ids
+        except Exception as e:
+            print(f"Error bulk inserting transactions: {e}")
+            return []
+
+    def expense_summary(self, username, start, end):
+        """
+        Totals per type_of_ie for one user over [start, end) (datetimes / ISO
+        strings) — an index range scan on (username, occurred_at).
+        Returns [(type_of_ie, count, total)], or [] on failure.
+        """
+        def work(conn):
+            cur = conn.cursor()
+            cur.execute("""
+                SELECT type_of_ie, COUNT(*), SUM(amount_value)
+                FROM transactions
+                WHERE username = %s AND occurred_at >= %s AND occurred_at < %s
+                GROUP BY type_of_ie
+                ORDER BY type_of_ie;
+            """, (username, start, end))
+            rows = cur.fetchall()
+            conn.rollback()
+            cur.close()
+            return rows
+
+        try:
+            return self._run(work)
+        except Exception as e:
+            print(f"Error reading expense summary: {e}")
+            return []
+
+
+def create_db_service(backend=None):
+    """A new transaction store for DB_BACKEND (or backend)."""
+    backend = backend or DB_BACKEND
+    if backend == "postgres":
+        return DBService()
+    if backend in ("sqlite", "memory"):
+        from db_sqlite import SQLiteDBService
+        return SQLiteDBService(DB_SQLITE_PATH if backend == "sqlite" else ":memory:")
+    raise ValueError(f"Unknown DB_BACKEND {backend!r}; use postgres, sqlite or memory")
+
+
+_default_service = None
+_default_service_lock = threading.Lock()
+
+
+def get_db_service():
+    """
+    Process-wide store shared by every OCRService handler, created (and its
+    schema migrated / verified) on first use. The servers open it at startup.
+    """
+    global _default_service
+    if _default_service is None:
+        with _default_service_lock:
+            if _default_service is None:
+                service = create_db_service()
+                # Inserts into an old schema fail one by one; refuse to start instead
+                service.ensure_schema()
+                _default_service = service
+                print(f"Transaction store: {DB_BACKEND}")
+    return _default_service
+
 
 if __name__ == "__main__":
     db = DBService()
-    db.create_table()
\ No newline at end of file
+    # Creates or migrates the table, then types the rows written before
+    db.create_table()
+    db.backfill_typed_columns()
@@ -0,0 +1,188 @@
+"""
+SQLite transaction store with the DBService interface, for running the
+service without Postgres (laptop, CI, benchmarks).
+
+Same behaviour as DBService where the service depends on it: raw amount /
+date text plus the typed amount_value / occurred_at copies, and
+deduplication by fingerprint through a transaction_fingerprints table.
+occurred_at is stored as the naive local ISO datetime (what DB_TIMEZONE
+means to Postgres), so reports compare it as text.
+
+Selected with DB_BACKEND=sqlite (file at DB_SQLITE_PATH) or DB_BACKEND=memory
+(":memory:", gone with the process); see db.create_db_service.
+"""
+
+import sqlite3
+import threading
+from datetime import datetime
+
+from db import statement_line_fingerprint
+from extractor import parse_amount, parse_datetime_text
+
+
+class SQLiteDBService:
+    def __init__(self, path: str = ":memory:"):
+        self.path = path
+        # One connection shared by every handler thread, serialized by the lock
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        if path != ":memory:":
+            self._db.execute("PRAGMA journal_mode=WAL")
+        self._lock = threading.Lock()
+        self.create_table()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    # -- schema -------------------------------------------------------------
+
+    def create_table(self):
+        with self._lock:
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS transactions (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    amount TEXT,
+                    date TEXT,
+                    description TEXT,
+                    type_of_ie TEXT,
+                    username TEXT,
+                    amount_value REAL,
+                    occurred_at TEXT,
+                    fingerprint TEXT,
+                    created_at TEXT DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS transaction_fingerprints (
+                    fingerprint TEXT PRIMARY KEY,
+                    created_at TEXT DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            self._db.execute("CREATE INDEX IF NOT EXISTS transactions_username_occurred_at_idx "
+                             "ON transactions (username, occurred_at)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS transactions_fingerprint_idx "
+                             "ON transactions (fingerprint)")
+
+    def migrate_schema(self):
+        self.create_table()
+
+    def ensure_schema(self, migrate=None):
+        """DBService.ensure_schema: create_table is idempotent and builds the full schema."""
+        self.create_table()
+
+    # -- writes -------------------------------------------------------------
+
+    def _claim(self, fingerprint) -> bool:
+        """Record a fingerprint; False if it was ingested before."""
+        cur = self._db.execute(
+            "INSERT OR IGNORE INTO transaction_fingerprints (fingerprint) VALUES (?)", (fingerprint,))
+        return cur.rowcount == 1
+
+    def _insert(self, values) -> int:
+        cur = self._db.execute("""
+            INSERT INTO transactions
+                (amount, date, description, type_of_ie, username, amount_value, occurred_at,
+                 fingerprint)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, values)
+        return cur.lastrowid
+
+    def insert_transaction(self, amount, date, description, type_of_ie, username=None, date_iso=None):
+        """Insert one row; returns its id (None on failure)."""
+        txn_id, _ = self.record_transaction(amount, date, description, type_of_ie,
+                                            username=username, date_iso=date_iso)
+        return txn_id
+
+    def record_transaction(self, amount, date, description, type_of_ie, username=None,
+                           date_iso=None, fingerprint=None):
+        """
+        Insert one row unless its fingerprint was already ingested; returns
+        (id, duplicate) like DBService.record_transaction.
+        """
+        values = (amount, date, description, type_of_ie, username, parse_amount(amount),
+                  date_iso or parse_datetime_text(date) or None, fingerprint)
+        try:
+            with self._lock:
+                self._db.execute("BEGIN")
+                try:
+                    if fingerprint is not None and not self._claim(fingerprint):
+                        existing = self._db.execute(
+                            "SELECT id FROM transactions WHERE fingerprint = ? ORDER BY id LIMIT 1",
+                            (fingerprint,)).fetchone()
+                        self._db.execute("ROLLBACK")
+                        txn_id, duplicate = (existing[0] if existing else None), True
+                    else:
+                        txn_id, duplicate = self._insert(values), False
+                        self._db.execute("COMMIT")
+                except BaseException:
+                    self._db.execute("ROLLBACK")
+                    raise
+        except sqlite3.Error as e:
+            print(f"Error inserting transaction: {e}")
+            return None, False
+        if duplicate:
+            print(f"Duplicate transaction skipped (existing ID: {txn_id})")
+        else:
+            print(f"Transaction inserted with ID: {txn_id}")
+        return txn_id, duplicate
+
+    def insert_transactions_bulk(self, statement, page_size=1000, username=None):
+        """
+        Insert the not yet ingested transactions of a BankStatement in one
+        SQLite transaction; returns ids like DBService.insert_transactions_bulk
+        (None for lines ingested before, [] on failure).
+        """
+        if not statement.transactions:
+            return []
+        ids = []
+        seen = set()
+        try:
+            with self._lock:
+                self._db.execute("BEGIN")
+                try:
+                    for tx in statement.transactions:
+                        fp = statement_line_fingerprint(statement.account_number, tx)
+                        # Identical lines within one statement are a single transaction
+                        if fp in seen or not self._claim(fp):
+                            ids.append(None)
+                            continue
+                        seen.add(fp)
+                        amount = tx.withdrawal if tx.withdrawal is not None else tx.deposit
+                        ids.append(self._insert((
+                            str(amount),
+                            tx.datetime,
+                            tx.transaction_type + (" | " + tx.details if tx.details else ""),
+                            "STATEMENT_WITHDRAW" if tx.withdrawal is not None else "STATEMENT_DEPOSIT",
+                            username,
+                            amount,
+                            tx.datetime_iso or None,
+                            fp,
+                        )))
+                    self._db.execute("COMMIT")
+                except BaseException:
+                    self._db.execute("ROLLBACK")
+                    raise
+        except sqlite3.Error as e:
+            print(f"Error bulk inserting transactions: {e}")
+            return []
+        inserted = sum(1 for txn_id in ids if txn_id is not None)
+        print(f"Inserted {inserted} statement transactions ({len(ids) - inserted} already ingested)")
+        return ids
+
+    # -- reads --------------------------------------------------------------
+
+    def expense_summary(self, username, start, end):
+        """Totals per type_of_ie for one user over [start, end); [(type_of_ie, count, total)]."""
+        start, end = (v.isoformat() if isinstance(v, datetime) else v for v in (start, end))
+        try:
+            with self._lock:
+                return self._db.execute("""
+                    SELECT type_of_ie, COUNT(*), ROUND(SUM(amount_value), 2)
+                    FROM transactions
+                    WHERE username = ? AND occurred_at >= ? AND occurred_at < ?
+                    GROUP BY type_of_ie
+                    ORDER BY type_of_ie
+                """, (username, start, end)).fetchall()
+        except sqlite3.Error as e:
+            print(f"Error reading expense summary: {e}")
+            return []
@@ -0,0 +1,253 @@
+"""
+Field extraction from OCR text: amount, date and reference of a transfer slip.
+
+All patterns are compiled once at import and the text is scanned in a single
+pass: one alternation regex walks the text left to right and the first match
+of each field wins.  Dates go through a Thai month table (abbreviated and full
+names, English names, and the OCR misreadings seen in production such as
+"S.A." for ธ.ค.) and Buddhist-era years are converted, so every date also comes
+out as ISO 8601.
+
+Used by the slip OCR pipeline (main), the gRPC service and the statement parser.
+"""
+
+import difflib
+import os
+import re
+from datetime import datetime
+from typing import Optional
+
+
+NOT_FOUND = "Not found"
+FIELDS = ("amount", "date", "ref")
+
+# A field read with at least this word confidence is final: the slip pipeline
+# (main) re-reads weaker ones with targeted crops and later preprocessing
+# passes, and db.slip_fingerprint only keys a slip on a ref this confident
+OCR_FIELD_CONFIDENCE = float(os.environ.get("OCR_FIELD_CONFIDENCE", "0.80"))
+
+
+# ---------------------------------------------------------------------------
+# Patterns
+# ---------------------------------------------------------------------------
+
+_AMOUNT = r"\d{1,3}(?:,\d{3})*\.\d{2}"
+# dd Month yyyy [- HH:MM | HH.MM]; tolerant of OCR noise like "S.A." and of
+# 2-digit Buddhist-era years ("14 ธ.ค. 68"). The month must contain a letter,
+# so "1,250.00" is never read as day 1, month ",2", year 50.
+_DATE = (
+    r"(?P<day>\d{1,2})\s*(?P<month>(?=\S*?[^\W\d_])\S{2,}?)\s*(?P<year>25\d{2}|20\d{2}|\d{2})(?!\d)"
+    r"(?:\s*[-–]?\s*(?P<time>\d{2}[:\.]\d{2}))?"
+)
+# "Ref", "Ref. No.", "Reference Number", "Ref #", "เลขที่อ้างอิง": the label
+# words are skipped so "Ref No. 555" reads 555, not "No"
+_REF_LABEL = (
+    r"(?:(?:Reference|Ref)\b\.?|เลขที่อ้างอิง)\s*"
+    r"(?:(?i:No|Number)\b\.?\s*|#\s*)?[:\-]?\s*"
+)
+_REF = _REF_LABEL + r"(?!(?i:No|Number)\b)(?P<ref_value>\w+)"
+
+# Date first: its time part ("10.22") must not be taken for an amount
+_FIELDS_RE = re.compile(f"(?P<date>{_DATE})|(?P<amount>{_AMOUNT})|(?P<ref>{_REF})")
+
+AMOUNT_RE = re.compile(_AMOUNT)
+DATE_RE = re.compile(_DATE)
+REF_RE = re.compile(_REF)
+# Label at the end of a line: the value is on the next line
+REF_LABEL_RE = re.compile(_REF_LABEL + "$")
+
+# "14/03/2026 08:46:11", "14/03/2569"
+_NUMERIC_DATE_RE = re.compile(
+    r"(?P<day>\d{1,2})/(?P<month>\d{1,2})/(?P<year>\d{4})(?:\s+(?P<time>\d{2}:\d{2}(?::\d{2})?))?"
+)
+
+
+# ---------------------------------------------------------------------------
+# Thai months
+# ---------------------------------------------------------------------------
+
+# month → (abbreviation as printed on slips, spellings it is looked up by)
+_MONTHS = {
+    1: ("ม.ค.", ("มกราคม", "january", "jan")),
+    2: ("ก.พ.", ("กุมภาพันธ์", "february", "feb")),
+    3: ("มี.ค.", ("มีนาคม", "march", "mar")),
+    4: ("เม.ย.", ("เมษายน", "april", "apr")),
+    5: ("พ.ค.", ("พฤษภาคม", "may")),
+    6: ("มิ.ย.", ("มิถุนายน", "june", "jun")),
+    7: ("ก.ค.", ("กรกฎาคม", "july", "jul")),
+    8: ("ส.ค.", ("สิงหาคม", "august", "aug")),
+    9: ("ก.ย.", ("กันยายน", "september", "sep", "sept")),
+    10: ("ต.ค.", ("ตุลาคม", "october", "oct")),
+    11: ("พ.ย.", ("พฤศจิกายน", "november", "nov")),
+    12: ("ธ.ค.", ("ธันวาคม", "december", "dec")),
+}
+
+# Misreadings of the Thai abbreviations by tha+eng Tesseract
+_MONTH_CONFUSIONS = {
+    "sa": 12, "5a": 12, "s4": 12, "54": 12,   # ธ.ค. → "S.A." / "5.A."
+    "na": 1,                                   # ม.ค. → "N.A."
+    "ny": 4,                                   # เม.ย. read without the leading vowel
+}
+
+# Thai glyphs Tesseract mixes up; folded before the second lookup
+_GLYPH_FOLD = str.maketrans({"ด": "ค", "ฅ": "ค", "ฆ": "ค", "ฟ": "พ", "ฝ": "ผ", "บ": "ย", "ร": "ธ"})
+
+_MONTH_NAME_FUZZY_CUTOFF = 0.75
+
+
+def _month_key(token: str) -> str:
+    """Lookup form of a month token: lower case, no dots, spaces or stray punctuation."""
+    return re.sub(r"[\s.,:;'\"`]", "", token).lower()
+
+
+def _build_month_tables() -> tuple:
+    exact = {}
+    for month, (abbr, names) in _MONTHS.items():
+        exact[_month_key(abbr)] = month
+        for name in names:
+            exact[_month_key(name)] = month
+    exact.update(_MONTH_CONFUSIONS)
+
+    folded = {}
+    for key, month in exact.items():
+        folded.setdefault(key.translate(_GLYPH_FOLD), set()).add(month)
+    # Drop folds that would make two months indistinguishable
+    folded = {key: months.pop() for key, months in folded.items() if len(months) == 1}
+
+    full_names = {key: month for key, month in exact.items() if len(key) >= 5}
+    return exact, folded, full_names
+
+
+_MONTH_EXACT, _MONTH_FOLDED, _MONTH_FULL_NAMES = _build_month_tables()
+
+
+def thai_month(token: str) -> Optional[int]:
+    """Month number (1-12) of a Thai / English month token as OCR read it; None if unknown."""
+    key = _month_key(token)
+    if not key:
+        return None
+    month = _MONTH_EXACT.get(key) or _MONTH_FOLDED.get(key.translate(_GLYPH_FOLD))
+    if month:
+        return month
+    # Long tokens are full month names — tolerate a misread glyph or two
+    if len(key) >= 5:
+        close = difflib.get_close_matches(key, _MONTH_FULL_NAMES, n=1, cutoff=_MONTH_NAME_FUZZY_CUTOFF)
+        if close:
+            return _MONTH_FULL_NAMES[close[0]]
+    return None
+
+
+def month_abbreviation(month: int) -> str:
+    return _MONTHS[month][0]
+
+
+# ---------------------------------------------------------------------------
+# Conversions
+# ---------------------------------------------------------------------------
+
+def to_gregorian_year(year: int) -> int:
+    """Buddhist-era years (2400+, or 2-digit as printed on slips) → Gregorian."""
+    if year < 100:
+        year += 2500
+    return year - 543 if year >= 2400 else year
+
+
+def iso_datetime(day: int, month: int, year: int, time: str = "00:00") -> str:
+    """ISO 8601 local datetime ("2025-12-14T10:22:00"); "" if the date is impossible."""
+    parts = time.replace(".", ":").split(":")
+    try:
+        hour, minute = int(parts[0]), int(parts[1])
+        second = int(parts[2]) if len(parts) > 2 else 0
+        # Validates day/month/time ranges, including Feb 29
+        value = datetime(to_gregorian_year(year), month, day, hour, minute, second)
+    except (ValueError, IndexError):
+        return ""
+    return value.isoformat()
+
+
+def parse_numeric_datetime(text: str) -> str:
+    """ISO 8601 of a numeric date like "14/03/2026 08:46:11" (either era); "" when it isn't one."""
+    m = _NUMERIC_DATE_RE.search(text)
+    if not m:
+        return ""
+    return iso_datetime(int(m.group("day")), int(m.group("month")), int(m.group("year")),
+                        m.group("time") or "00:00")
+
+
+def parse_datetime_text(text: str) -> str:
+    """
+    ISO 8601 of a stored date string in any format this service writes:
+    statement "14/03/2026 08:46:11" or slip "14 ธ.ค. 2568 - 10:22"; "" if neither.
+    """
+    if not text:
+        return ""
+    return parse_numeric_datetime(text) or extract_fields(text)["date_iso"]
+
+
+def parse_amount(text: str) -> Optional[float]:
+    """Float value of an amount like "1,250.00"; None when text is not one (e.g. "Not found")."""
+    try:
+        return float(text.replace(",", ""))
+    except (AttributeError, ValueError):
+        return None
+
+
+# ---------------------------------------------------------------------------
+# Slip fields
+# ---------------------------------------------------------------------------
+
+def _span_confidence(word_spans, span) -> float:
+    """Mean confidence of the OCR words overlapping the character range span."""
+    start, end = span
+    confs = [conf for w_start, w_end, conf in word_spans if w_start < end and w_end > start]
+    return sum(confs) / len(confs) if confs else 0.0
+
+
+def _format_date(m) -> tuple:
+    """(display date with the month normalized, ISO datetime or "")."""
+    day, month_raw, year = m.group("day"), m.group("month"), m.group("year")
+    time = m.group("time") or "00:00"
+    month = thai_month(month_raw)
+    month_text = month_abbreviation(month) if month else month_raw
+    year_text = year if len(year) == 4 else f"25{year}"
+    date_iso = iso_datetime(int(day), month, int(year), time) if month else ""
+    return f"{day} {month_text} {year_text} - {time}", date_iso
+
+
+def extract_fields(text: str, word_spans=None) -> dict:
+    """
+    amount / date / ref from OCR text in one scan ("Not found" when missing),
+    plus date_iso (ISO 8601, "" when the date or its month can't be read).
+
+    With the word spans of OCRPool.image_to_data, the result also carries a
+    "confidence" dict: per field, the mean Tesseract confidence (0.0 – 1.0)
+    of the words it was read from; 0.0 when not found.
+    """
+    result = {"amount": NOT_FOUND, "date": NOT_FOUND, "ref": NOT_FOUND, "date_iso": ""}
+    spans = {}
+    for m in _FIELDS_RE.finditer(text):
+        if m.group("date") is not None:
+            # A 2-digit "year" is only believable next to a real month name
+            if "date" in spans or (len(m.group("year")) == 2 and not thai_month(m.group("month"))):
+                continue
+            result["date"], result["date_iso"] = _format_date(m)
+            spans["date"] = m.span()
+        elif m.group("amount") is not None:
+            if "amount" in spans:
+                continue
+            result["amount"] = m.group()
+            spans["amount"] = m.span()
+        else:
+            if "ref" in spans:
+                continue
+            result["ref"] = m.group("ref_value")
+            spans["ref"] = m.span("ref_value")
+        if len(spans) == len(FIELDS):
+            break
+
+    if word_spans is not None:
+        result["confidence"] = {
+            field: _span_confidence(word_spans, spans[field]) if field in spans else 0.0
+            for field in FIELDS
+        }
+    return result
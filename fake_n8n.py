@@ -0,0 +1,158 @@
+"""
+Stand-in for the n8n webhook, for end-to-end runs without a live n8n.
+
+Accepts any POST, answers 200 {"ok": true} after an injected delay, and can
+be made to fail: a share of requests gets an error status, and a share
+hangs long enough to hit the caller's timeout (WEBHOOK_TIMEOUT), so the
+outbox's retry / backoff / dead-letter paths and the effect of a slow n8n
+can be measured.  GET /stats returns what it has seen so far.
+
+Point the service at it with N8N_PRODUCTION_API=http://localhost:5678/webhook/test.
+
+Configuration (environment, or the matching command-line flags):
+  FAKE_N8N_PORT            listen port                               (default: 5678)
+  FAKE_N8N_LATENCY_MS      delay before every response               (default: 0)
+  FAKE_N8N_JITTER_MS       extra random delay, 0..jitter             (default: 0)
+  FAKE_N8N_FAILURE_RATE    share of requests answered with an error  (default: 0)
+  FAKE_N8N_FAILURE_STATUS  status of those errors                    (default: 503)
+  FAKE_N8N_HANG_RATE       share of requests held for HANG_SECONDS   (default: 0)
+  FAKE_N8N_HANG_SECONDS    how long a hung request is held           (default: 30)
+
+    python fake_n8n.py --latency-ms 200 --jitter-ms 300 --failure-rate 0.05
+"""
+
+import argparse
+import json
+import os
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+FAKE_N8N_PORT = int(os.environ.get("FAKE_N8N_PORT", "5678"))
+FAKE_N8N_LATENCY_MS = float(os.environ.get("FAKE_N8N_LATENCY_MS", "0"))
+FAKE_N8N_JITTER_MS = float(os.environ.get("FAKE_N8N_JITTER_MS", "0"))
+FAKE_N8N_FAILURE_RATE = float(os.environ.get("FAKE_N8N_FAILURE_RATE", "0"))
+FAKE_N8N_FAILURE_STATUS = int(os.environ.get("FAKE_N8N_FAILURE_STATUS", "503"))
+FAKE_N8N_HANG_RATE = float(os.environ.get("FAKE_N8N_HANG_RATE", "0"))
+FAKE_N8N_HANG_SECONDS = float(os.environ.get("FAKE_N8N_HANG_SECONDS", "30"))
+
+
+class FakeN8N(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port=FAKE_N8N_PORT, latency_ms=FAKE_N8N_LATENCY_MS,
+                 jitter_ms=FAKE_N8N_JITTER_MS, failure_rate=FAKE_N8N_FAILURE_RATE,
+                 failure_status=FAKE_N8N_FAILURE_STATUS, hang_rate=FAKE_N8N_HANG_RATE,
+                 hang_seconds=FAKE_N8N_HANG_SECONDS, host="127.0.0.1", verbose=False):
+        super().__init__((host, port), _Handler)
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.failure_rate = failure_rate
+        self.failure_status = failure_status
+        self.hang_rate = hang_rate
+        self.hang_seconds = hang_seconds
+        self.verbose = verbose
+        self.outcomes = Counter()
+        self.traced = 0
+        self._lock = threading.Lock()
+        self._rng = random.Random()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/webhook/test"
+
+    def _pick(self):
+        """(delay seconds, status, outcome) for the next request."""
+        with self._lock:
+            roll = self._rng.random()
+            delay = self.latency + self._rng.uniform(0, self.jitter)
+        if roll < self.hang_rate:
+            return self.hang_seconds, 200, "hung"
+        if roll < self.hang_rate + self.failure_rate:
+            return delay, self.failure_status, str(self.failure_status)
+        return delay, 200, "200"
+
+    def record(self, outcome, traced) -> None:
+        with self._lock:
+            self.outcomes[outcome] += 1
+            self.traced += traced
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"requests": sum(self.outcomes.values()), "outcomes": dict(self.outcomes),
+                    "with_traceparent": self.traced}
+
+    def start(self) -> "FakeN8N":
+        """Serve on a daemon thread (for use from benchmarks and tests)."""
+        threading.Thread(target=self.serve_forever, name="fake-n8n", daemon=True).start()
+        return self
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        server = self.server
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        delay, status, outcome = server._pick()
+        if delay:
+            time.sleep(delay)
+        server.record(outcome, "traceparent" in self.headers)
+        self._reply(status, {"ok": True} if status < 400 else {"error": "injected failure"})
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/stats":
+            self._reply(200, self.server.stats())
+        else:
+            self._reply(404, {"error": "not found"})
+
+    def _reply(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        try:
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            # The caller timed out and went away
+            pass
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake n8n webhook with latency and failure injection")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=FAKE_N8N_PORT)
+    parser.add_argument("--latency-ms", type=float, default=FAKE_N8N_LATENCY_MS)
+    parser.add_argument("--jitter-ms", type=float, default=FAKE_N8N_JITTER_MS)
+    parser.add_argument("--failure-rate", type=float, default=FAKE_N8N_FAILURE_RATE)
+    parser.add_argument("--failure-status", type=int, default=FAKE_N8N_FAILURE_STATUS)
+    parser.add_argument("--hang-rate", type=float, default=FAKE_N8N_HANG_RATE)
+    parser.add_argument("--hang-seconds", type=float, default=FAKE_N8N_HANG_SECONDS)
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    args = parser.parse_args()
+
+    server = FakeN8N(port=args.port, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                     failure_rate=args.failure_rate, failure_status=args.failure_status,
+                     hang_rate=args.hang_rate, hang_seconds=args.hang_seconds,
+                     host=args.host, verbose=args.verbose)
+    print(f"Fake n8n on :{server.server_address[1]} (latency {args.latency_ms:.0f}"
+          f"+{args.jitter_ms:.0f} ms, failures {args.failure_rate:.0%} -> {args.failure_status}, "
+          f"hangs {args.hang_rate:.0%})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    print(json.dumps(server.stats()))
+
+
+if __name__ == "__main__":
+    main()
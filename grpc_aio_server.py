@@ -0,0 +1,303 @@
+"""
+asyncio gRPC server (grpc.aio) with bounded admission control.
+
+The threaded server in grpc_server.py runs 10 handler threads and queues
+everything else, and each queued RPC holds its full image bytes.  Under a
+burst, both memory and tail latency grow with the queue.  This variant serves
+the same OCRService from one event loop:
+
+  admission  every RPC takes slots from a budget of GRPC_MAX_IN_FLIGHT before
+             any work starts: one per image it carries (at most the whole
+             budget), a streaming RPC its window.  An RPC never has more
+             images in flight than the slots it holds, so a batch larger
+             than the budget runs through them a slot at a time.  When the
+             budget is spent the RPC is rejected at once with
+             RESOURCE_EXHAUSTED, so the client can back off or retry another
+             replica instead of waiting in a queue
+  CPU        decode / OCR is submitted to the OCR worker processes
+             (ocr_executor) and awaited with asyncio.wrap_future
+  I/O        DB writes and webhook enqueueing (psycopg2 / SQLite, both
+             blocking) run on the loop's thread pool via asyncio.to_thread,
+             and so does statement parsing
+
+Selected with GRPC_ASYNC=1 when starting grpc_server.py, or run directly.
+
+Configuration (environment):
+  GRPC_ASYNC             "1" makes grpc_server.py serve with this module (default: 0)
+  GRPC_MAX_IN_FLIGHT     images admitted at once                        (default: 32)
+  STREAM_MAX_IN_FLIGHT   images a streaming RPC holds in flight         (default: 4)
+"""
+
+import asyncio
+from contextlib import asynccontextmanager
+
+import grpc
+
+import metrics
+import ocr_pb2
+import ocr_pb2_grpc
+import tracing
+from db import get_db_service
+from grpc_server import (
+    GRPC_MAX_IN_FLIGHT,
+    SERVER_OPTIONS,
+    STREAM_MAX_IN_FLIGHT,
+    _image_span,
+    _ocr_result,
+    _process_statement,
+    _record_slip,
+)
+from ocr_executor import get_ocr_executor
+from webhook import get_webhook_dispatcher
+
+
+class Admission:
+    """
+    Slot budget shared by every RPC. try_acquire never waits: it takes all
+    the slots asked for (capped at the limit) or none. Only used from the
+    event loop thread, so it needs no lock.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = max(1, limit)
+        self.in_flight = 0
+        self.rejected = 0
+
+    def try_acquire(self, slots: int = 1) -> int:
+        slots = min(max(1, slots), self.limit)
+        if self.in_flight + slots > self.limit:
+            self.rejected += 1
+            return 0
+        self.in_flight += slots
+        return slots
+
+    def release(self, slots: int) -> None:
+        self.in_flight -= slots
+
+
+class AsyncOCRService(ocr_pb2_grpc.OCRServiceServicer):
+    def __init__(self, ocr_executor=None, max_in_flight=GRPC_MAX_IN_FLIGHT,
+                 stream_window=STREAM_MAX_IN_FLIGHT):
+        self.ocr_executor = ocr_executor or get_ocr_executor()
+        self.admission = Admission(max_in_flight)
+        self.stream_window = stream_window
+
+    @asynccontextmanager
+    async def _admitted(self, context, slots=1):
+        taken = self.admission.try_acquire(slots)
+        if not taken:
+            await context.abort(
+                grpc.StatusCode.RESOURCE_EXHAUSTED,
+                f"Server busy ({self.admission.in_flight}/{self.admission.limit} images in flight)",
+            )
+        try:
+            yield taken
+        finally:
+            self.admission.release(taken)
+
+    async def _ocr(self, image_data):
+        if self.ocr_executor.workers:
+            return await asyncio.wrap_future(self.ocr_executor.submit(image_data))
+        # In-process mode runs OCR inside submit(); keep it off the loop
+        return await asyncio.to_thread(self.ocr_executor.run, image_data)
+
+    async def _process_item(self, image_data, username, type_of_expense):
+        """Decode/OCR, DB and n8n for one image; errors land in OCRResult.error."""
+        try:
+            with _image_span(image_data):
+                result = await self._ocr(image_data)
+                if result is None:
+                    return ocr_pb2.OCRResult(error="Invalid image data")
+                webhook_response = await asyncio.to_thread(
+                    _record_slip, result, image_data, username, type_of_expense)
+                return _ocr_result(result, webhook_response)
+        except Exception as e:
+            return ocr_pb2.OCRResult(error=str(e))
+
+    async def _process_items(self, slots, items):
+        """
+        _process_item over (image_data, username, type_of_expense) items, in
+        order, with at most `slots` (the admitted ones) in flight: each holds
+        a SharedMemory copy of its image once submitted.
+        """
+        limit = asyncio.Semaphore(slots)
+
+        async def process(item):
+            async with limit:
+                return await self._process_item(*item)
+
+        # gather() keeps the original request order
+        return await asyncio.gather(*(process(item) for item in items))
+
+    @metrics.track_rpc
+    @tracing.trace_rpc
+    async def ProcessImage(self, request, context):
+        username = request.username if request.username else "default_user"
+        type_of_expense = request.type_of_expense if request.type_of_expense else "General"
+
+        async with self._admitted(context):
+            result = await self._process_item(request.image_data, username, type_of_expense)
+        if result.error == "Invalid image data":
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details('Invalid image data')
+            return ocr_pb2.OCRResult()
+        if result.error:
+            print(f"Error processing image: {result.error}")
+        return result
+
+    @metrics.track_rpc
+    @tracing.trace_rpc
+    async def ProcessBatch(self, request, context):
+        async with self._admitted(context, len(request.requests)) as taken:
+            results = await self._process_items(taken, (
+                (
+                    img_req.image_data,
+                    img_req.username if img_req.username else "default_user",
+                    img_req.type_of_expense if img_req.type_of_expense else "General",
+                )
+                for img_req in request.requests
+            ))
+        return ocr_pb2.BatchOCRResult(results=results)
+
+    @metrics.track_rpc
+    @tracing.trace_rpc
+    async def ProcessImages(self, request, context):
+        username = request.username if request.username else "default_user"
+        type_of_expense = request.type_of_expense if request.type_of_expense else "General"
+
+        async with self._admitted(context, len(request.image_data)) as taken:
+            results = await self._process_items(taken, (
+                (image_bytes, username, type_of_expense)
+                for image_bytes in request.image_data
+            ))
+        return ocr_pb2.BatchOCRResult(results=results)
+
+    async def _stream_results(self, items):
+        """
+        Async counterpart of OCRService._stream_results: yield an OCRResult per
+        (correlation_id, image_data, username, type_of_expense) item as soon as
+        it is ready, reading from `items` only while fewer than stream_window
+        images are in flight.
+        """
+        window = asyncio.Semaphore(self.stream_window)
+        done = asyncio.Queue()
+        end = object()
+        tasks = set()
+
+        async def feed():
+            submitted = 0
+            try:
+                async for correlation_id, image_data, username, type_of_expense in items:
+                    await window.acquire()
+                    task = asyncio.ensure_future(
+                        self._process_item(image_data, username, type_of_expense))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+                    task.add_done_callback(lambda t, c=correlation_id: done.put_nowait((c, t)))
+                    submitted += 1
+            except Exception as e:
+                print(f"Error reading image stream: {e}")
+            finally:
+                done.put_nowait((end, submitted))
+
+        feeder = asyncio.ensure_future(feed())
+        try:
+            sent, total = 0, None
+            while total is None or sent < total:
+                correlation_id, payload = await done.get()
+                if correlation_id is end:
+                    total = payload
+                    continue
+                window.release()
+                result = payload.result()
+                result.correlation_id = correlation_id
+                sent += 1
+                yield result
+        finally:
+            # Client went away: stop reading its stream
+            feeder.cancel()
+
+    @metrics.track_rpc
+    @tracing.trace_rpc
+    async def ProcessImageStream(self, request_iterator, context):
+        async def items():
+            index = 0
+            async for img_req in request_iterator:
+                yield (
+                    img_req.correlation_id or str(index),
+                    img_req.image_data,
+                    img_req.username if img_req.username else "default_user",
+                    img_req.type_of_expense if img_req.type_of_expense else "General",
+                )
+                index += 1
+
+        async with self._admitted(context, self.stream_window):
+            async for result in self._stream_results(items()):
+                yield result
+
+    @metrics.track_rpc
+    @tracing.trace_rpc
+    async def ProcessBatchStream(self, request, context):
+        async def items():
+            for index, img_req in enumerate(request.requests):
+                yield (
+                    img_req.correlation_id or str(index),
+                    img_req.image_data,
+                    img_req.username if img_req.username else "default_user",
+                    img_req.type_of_expense if img_req.type_of_expense else "General",
+                )
+
+        async with self._admitted(context, min(self.stream_window, len(request.requests))):
+            async for result in self._stream_results(items()):
+                yield result
+
+    @metrics.track_rpc
+    @tracing.trace_rpc
+    async def ProcessStatement(self, request, context):
+        username = request.username if request.username else "default_user"
+        async with self._admitted(context):
+            return await asyncio.to_thread(_process_statement, request.pdf_data, username)
+
+
+async def serve():
+    # Start the OCR workers before the server threads exist
+    ocr_executor = get_ocr_executor()
+    print(f"Starting OCR executor ({ocr_executor.mode})...")
+    ocr_executor.warm_up()
+
+    # Deliver anything left in the webhook outbox by a previous run
+    webhook_dispatcher = get_webhook_dispatcher()
+    webhook_dispatcher.start()
+
+    # Open the transaction store (DB_BACKEND) before taking traffic
+    get_db_service()
+
+    metrics.start_metrics_server(ocr_executor, webhook_dispatcher)
+    tracing.setup()
+
+    server = grpc.aio.server(options=SERVER_OPTIONS)
+    service = AsyncOCRService(ocr_executor)
+    ocr_pb2_grpc.add_OCRServiceServicer_to_server(service, server)
+    server.add_insecure_port('[::]:50051')
+    print(f"gRPC aio server starting on port 50051 "
+          f"(max {service.admission.limit} images in flight)...")
+    await server.start()
+    try:
+        await server.wait_for_termination()
+    finally:
+        await server.stop(5)
+        ocr_executor.shutdown()
+        webhook_dispatcher.stop()
+        get_db_service().close()
+        tracing.shutdown()
+
+
+def main():
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
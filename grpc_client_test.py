@@ -3,12 +3,11 @@ import ocr_pb2
 import ocr_pb2_grpc
 import sys
 
-def run():
+def run(image_path, target='localhost:50051'):
     print("Connecting to gRPC server...")
-    with grpc.insecure_channel('localhost:50051') as channel:
+    with grpc.insecure_channel(target) as channel:
         stub = ocr_pb2_grpc.OCRServiceStub(channel)
         
-        image_path = r"c:\Users\tarch\OneDrive\เดสก์ท็อป\qr\1765679961630.jpg"
         try:
             with open(image_path, "rb") as f:
                 image_bytes = f.read()
@@ -40,5 +39,23 @@ def run():
             if res.error:
                 print(f"  Error: {res.error}")
 
+        print("\n--- Testing Streaming Process (3 images) ---")
+        def image_stream():
+            for i in range(3):
+                yield ocr_pb2.ImageRequest(image_data=image_bytes, filename=f"img{i+1}.jpg", correlation_id=f"img{i+1}")
+
+        # Results arrive as soon as each image is done, not in request order
+        for res in stub.ProcessImageStream(image_stream()):
+            print(f"{res.correlation_id}:")
+            print(f"  Amount: {res.amount}")
+            print(f"  Date: {res.date}")
+            print(f"  Ref: {res.ref}")
+            if res.error:
+                print(f"  Error: {res.error}")
+
 if __name__ == '__main__':
-    run()
+    if len(sys.argv) < 2:
+        # Any slip will do, e.g. one generated by bench_corpus.py
+        print("usage: python grpc_client_test.py SLIP_IMAGE [HOST:PORT]")
+        sys.exit(2)
+    run(*sys.argv[1:3])
@@ -2,233 +2,313 @@
 import grpc
 from concurrent import futures
 import time
-import tempfile
-import numpy as np
-import cv2
+import queue
+import threading
 import ocr_pb2
 import ocr_pb2_grpc
-from main import extract_info_from_image
+from ocr_executor import get_ocr_executor
+from webhook import get_webhook_dispatcher
+import metrics
+import tracing
 from parse_bank_statement import parse_krungsri_statement
-import requests
 import json
 from datetime import datetime
 import os
 # from db_service import DBService
-from db import DBService
-# Initialize DB Service
-db_service = DBService()
+# Transaction store (DB_BACKEND), created on first use and shared by every handler
+from db import get_db_service, slip_fingerprint
+
+# Max images of a batch RPC processed concurrently (across all batch RPCs)
+BATCH_MAX_CONCURRENCY = int(os.environ.get("BATCH_MAX_CONCURRENCY", "8"))
+# Max images a streaming RPC holds in flight before it stops reading the client
+STREAM_MAX_IN_FLIGHT = int(os.environ.get("STREAM_MAX_IN_FLIGHT", "4"))
+# Max RPCs admitted at once; the rest are shed with RESOURCE_EXHAUSTED
+GRPC_MAX_IN_FLIGHT = int(os.environ.get("GRPC_MAX_IN_FLIGHT", "32"))
+# "1" serves with the asyncio server in grpc_aio_server.py
+GRPC_ASYNC = os.environ.get("GRPC_ASYNC", "0") == "1"
 
 class OCRService(ocr_pb2_grpc.OCRServiceServicer):
+    def __init__(self, ocr_executor=None, batch_concurrency=BATCH_MAX_CONCURRENCY,
+                 stream_window=STREAM_MAX_IN_FLIGHT):
+        # Decode/OCR/extraction run in worker processes; handler threads only do I/O
+        self.ocr_executor = ocr_executor or get_ocr_executor()
+        # Images of ProcessBatch / ProcessImages fan out here. Shared by every
+        # RPC, so the number of images in flight stays bounded under load.
+        self.batch_executor = futures.ThreadPoolExecutor(
+            max_workers=batch_concurrency,
+            thread_name_prefix="ocr-batch",
+        )
+        # Images a single streaming RPC may have in flight before it stops
+        # reading from the client
+        self.stream_window = stream_window
+
+    @metrics.track_rpc
+    @tracing.trace_rpc
     def ProcessImage(self, request, context):
         try:
-            # Convert bytes to numpy array for cv2
-            nparr = np.frombuffer(request.image_data, np.uint8)
-            img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-            
-            if img is None:
-                context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
-                context.set_details('Invalid image data')
-                return ocr_pb2.OCRResult()
-
-            # Process image
-            result = extract_info_from_image(img)
-
-            # Get extra fields
-            username = request.username if request.username else "default_user"
-            type_of_expense = request.type_of_expense if request.type_of_expense else "General"
-
-            # Call n8n
-            webhook_response = create_expenses(
-                username=username,
-                type_of_expense=type_of_expense,
-                amount=result['amount'],
-                date=result['date'],
-                expense_description=result['ref'],
-                note=result['raw_text']
-            )
+            with _image_span(request.image_data):
+                # Decode + OCR in the worker pool
+                result = self.ocr_executor.run(request.image_data)
 
-            # Save to Database
-            db_service.insert_transaction(
-                amount=str(result.get("amount", "")),
-                date=str(result.get("date", "")),
-                description=str(result.get("ref", "")),
-                type_of_ie=type_of_expense
-            )
-            
-            return ocr_pb2.OCRResult(
-                amount=str(result.get("amount", "")),
-                date=str(result.get("date", "")),
-                ref=str(result.get("ref", "")),
-                raw_text=str(result.get("raw_text", "")),
-                error="",
-                webhook_result=json.dumps(webhook_response)
-            )
+                if result is None:
+                    context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+                    context.set_details('Invalid image data')
+                    return ocr_pb2.OCRResult()
+
+                # Get extra fields
+                username = request.username if request.username else "default_user"
+                type_of_expense = request.type_of_expense if request.type_of_expense else "General"
+
+                webhook_response = _record_slip(result, request.image_data, username, type_of_expense)
+
+                return _ocr_result(result, webhook_response)
         except Exception as e:
             print(f"Error processing image: {e}")
             return ocr_pb2.OCRResult(error=str(e))
 
+    def _process_batch_item(self, image_data, username, type_of_expense):
+        """Decode/OCR, n8n and DB for one image of a batch; errors land in OCRResult.error."""
+        try:
+            with _image_span(image_data):
+                result = self.ocr_executor.run(image_data)
+
+                if result is None:
+                    return ocr_pb2.OCRResult(error="Invalid image data")
+
+                webhook_response = _record_slip(result, image_data, username, type_of_expense)
+
+                return _ocr_result(result, webhook_response)
+
+        except Exception as e:
+            return ocr_pb2.OCRResult(error=str(e))
+
+    @metrics.track_rpc
+    @tracing.trace_rpc
     def ProcessBatch(self, request, context):
-        response = ocr_pb2.BatchOCRResult()
-        for img_req in request.requests:
-            try:
-                nparr = np.frombuffer(img_req.image_data, np.uint8)
-                img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-                
-                if img is None:
-                    response.results.append(ocr_pb2.OCRResult(error="Invalid image data"))
-                    continue
-
-                result = extract_info_from_image(img)
-
-                username = img_req.username if img_req.username else "default_user"
-                type_of_expense = img_req.type_of_expense if img_req.type_of_expense else "General"
-
-                webhook_response = create_expenses(
-                        username=username,
-                        type_of_expense=type_of_expense,
-                        amount=result['amount'],
-                        date=result['date'],
-                        expense_description=result['ref'],
-                        note=result['raw_text']
-                    )
-
-                # Save to Database
-                db_service.insert_transaction(
-                    amount=str(result.get("amount", "")),
-                    date=str(result.get("date", "")),
-                    description=str(result.get("ref", "")),
-                    type_of_ie=type_of_expense
-                )
+        def process(img_req):
+            username = img_req.username if img_req.username else "default_user"
+            type_of_expense = img_req.type_of_expense if img_req.type_of_expense else "General"
+            return self._process_batch_item(img_req.image_data, username, type_of_expense)
 
-                response.results.append(ocr_pb2.OCRResult(
-                    amount=str(result.get("amount", "")),
-                    date=str(result.get("date", "")),
-                    ref=str(result.get("ref", "")),
-                    raw_text=str(result.get("raw_text", "")),
-                    error="",
-                    webhook_result=json.dumps(webhook_response)
-                ))
-                
-            except Exception as e:
-                response.results.append(ocr_pb2.OCRResult(error=str(e)))
-        
-        return response
+        # map() keeps the original request order
+        results = self.batch_executor.map(tracing.bind_context(process), request.requests)
+        return ocr_pb2.BatchOCRResult(results=list(results))
 
+    @metrics.track_rpc
+    @tracing.trace_rpc
     def ProcessImages(self, request, context):
-        response = ocr_pb2.BatchOCRResult()
         username = request.username if request.username else "default_user"
         type_of_expense = request.type_of_expense if request.type_of_expense else "General"
-        
-        for image_bytes in request.image_data:
+
+        results = self.batch_executor.map(
+            tracing.bind_context(
+                lambda image_bytes: self._process_batch_item(image_bytes, username, type_of_expense)),
+            request.image_data,
+        )
+        return ocr_pb2.BatchOCRResult(results=list(results))
+    
+    def _stream_results(self, items, context):
+        """
+        Yield an OCRResult per (correlation_id, image_data, username, type_of_expense)
+        item as soon as it is ready.
+
+        Items are pulled from `items` only while fewer than stream_window images
+        are in flight, so a long upload never holds more than a window of image
+        bytes in server memory; gRPC flow control pushes back on the client.
+        """
+        window = threading.BoundedSemaphore(self.stream_window)
+        done = queue.Queue()
+        end = object()
+
+        def feed():
+            submitted = 0
             try:
-                nparr = np.frombuffer(image_bytes, np.uint8)
-                img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-                
-                if img is None:
-                    response.results.append(ocr_pb2.OCRResult(error="Invalid image data"))
-                    continue
-
-                result = extract_info_from_image(img)
-
-                webhook_response = create_expenses(
-                        username=username,
-                        type_of_expense=type_of_expense,
-                        amount=result['amount'],
-                        date=result['date'],
-                        expense_description=result['ref'],
-                        note=result['raw_text']
-                    )
-
-                # Save to Database
-                db_service.insert_transaction(
-                    amount=str(result.get("amount", "")),
-                    date=str(result.get("date", "")),
-                    description=str(result.get("ref", "")),
-                    type_of_ie=type_of_expense
+                for correlation_id, image_data, username, type_of_expense in items:
+                    while not window.acquire(timeout=1):
+                        if not context.is_active():
+                            return
+                    fut = self.batch_executor.submit(
+                        tracing.bind_context(self._process_batch_item),
+                        image_data, username, type_of_expense)
+                    fut.add_done_callback(lambda f, c=correlation_id: done.put((c, f)))
+                    submitted += 1
+            except Exception as e:
+                print(f"Error reading image stream: {e}")
+            finally:
+                done.put((end, submitted))
+
+        threading.Thread(target=tracing.bind_context(feed), name="ocr-stream-feed",
+                         daemon=True).start()
+
+        sent, total = 0, None
+        while total is None or sent < total:
+            correlation_id, payload = done.get()
+            if correlation_id is end:
+                total = payload
+                continue
+            window.release()
+            result = payload.result()
+            result.correlation_id = correlation_id
+            sent += 1
+            yield result
+
+    @metrics.track_rpc
+    @tracing.trace_rpc
+    def ProcessImageStream(self, request_iterator, context):
+        def items():
+            for index, img_req in enumerate(request_iterator):
+                yield (
+                    img_req.correlation_id or str(index),
+                    img_req.image_data,
+                    img_req.username if img_req.username else "default_user",
+                    img_req.type_of_expense if img_req.type_of_expense else "General",
                 )
 
-                response.results.append(ocr_pb2.OCRResult(
-                    amount=str(result.get("amount", "")),
-                    date=str(result.get("date", "")),
-                    ref=str(result.get("ref", "")),
-                    raw_text=str(result.get("raw_text", "")),
-                    error="",
-                    webhook_result=json.dumps(webhook_response)
-                ))
-                
-            except Exception as e:
-                response.results.append(ocr_pb2.OCRResult(error=str(e)))
-        
-        return response
-    
+        return self._stream_results(items(), context)
+
+    @metrics.track_rpc
+    @tracing.trace_rpc
+    def ProcessBatchStream(self, request, context):
+        items = (
+            (
+                img_req.correlation_id or str(index),
+                img_req.image_data,
+                img_req.username if img_req.username else "default_user",
+                img_req.type_of_expense if img_req.type_of_expense else "General",
+            )
+            for index, img_req in enumerate(request.requests)
+        )
+        return self._stream_results(items, context)
+
+    @metrics.track_rpc
+    @tracing.trace_rpc
     def ProcessStatement(self, request, context):
         username = request.username if request.username else "default_user"
+        return _process_statement(request.pdf_data, username)
 
-        try:
-            # Write PDF bytes to a temp file so pdfplumber can open it
-            with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
-                tmp.write(request.pdf_data)
-                tmp_path = tmp.name
-
-            stmt = parse_krungsri_statement(tmp_path)
-            os.unlink(tmp_path)
-
-            proto_txns = []
-            for tx in stmt.transactions:
-                # Insert every transaction into DB
-                db_service.insert_transaction(
-                    amount=str(tx.withdrawal if tx.withdrawal is not None else tx.deposit),
+
+def _process_statement(pdf_data, username):
+    """Parse a statement PDF, save its new lines and notify n8n of new withdrawals."""
+    try:
+        # Parsed straight from the request bytes — no temp file to leak
+        with tracing.span("parse_statement", **{"statement.bytes": len(pdf_data)}):
+            stmt = parse_krungsri_statement(pdf_data)
+
+        # Insert every new transaction into DB in one round trip / one commit;
+        # lines of an earlier import of the same statement come back as None
+        with metrics.stage("db_insert"), tracing.span("db_insert"):
+            ids = get_db_service().insert_transactions_bulk(stmt, username=username)
+        if stmt.transactions and not ids:
+            # [] means the insert failed: nothing saved, so notify n8n of nothing
+            raise RuntimeError("Statement transactions could not be saved")
+
+        proto_txns = []
+        for i, tx in enumerate(stmt.transactions):
+            # Call n8n webhook only for new withdrawals (expenses)
+            if tx.withdrawal is not None and ids[i] is not None:
+                create_expenses(
+                    username=username,
+                    type_of_expense="BANK_STATEMENT",
+                    amount=tx.withdrawal,
                     date=tx.datetime,
-                    description=tx.transaction_type + (" | " + tx.details if tx.details else ""),
-                    type_of_ie="STATEMENT_WITHDRAW" if tx.withdrawal is not None else "STATEMENT_DEPOSIT",
+                    expense_description=tx.transaction_type,
+                    note=tx.details,
                 )
 
-                # Call n8n webhook only for withdrawals (expenses)
-                if tx.withdrawal is not None:
-                    create_expenses(
-                        username=username,
-                        type_of_expense="BANK_STATEMENT",
-                        amount=tx.withdrawal,
-                        date=tx.datetime,
-                        expense_description=tx.transaction_type,
-                        note=tx.details,
-                    )
-
-                proto_txns.append(ocr_pb2.StatementTransaction(
-                    datetime=tx.datetime,
-                    transaction_type=tx.transaction_type,
-                    withdrawal=str(tx.withdrawal) if tx.withdrawal is not None else "",
-                    deposit=str(tx.deposit) if tx.deposit is not None else "",
-                    balance=str(tx.balance),
-                    channel=tx.channel,
-                    details=tx.details,
-                ))
-
-            return ocr_pb2.StatementResult(
-                account_name=stmt.account_name,
-                account_number=stmt.account_number,
-                branch=stmt.branch,
-                period_start=stmt.period_start,
-                period_end=stmt.period_end,
-                transactions=proto_txns,
-                withdrawal_total=str(stmt.summary.withdrawal_total) if stmt.summary else "",
-                deposit_total=str(stmt.summary.deposit_total) if stmt.summary else "",
-                error="",
-            )
+            proto_txns.append(ocr_pb2.StatementTransaction(
+                datetime=tx.datetime,
+                transaction_type=tx.transaction_type,
+                withdrawal=str(tx.withdrawal) if tx.withdrawal is not None else "",
+                deposit=str(tx.deposit) if tx.deposit is not None else "",
+                balance=str(tx.balance),
+                channel=tx.channel,
+                details=tx.details,
+            ))
+
+        return ocr_pb2.StatementResult(
+            account_name=stmt.account_name,
+            account_number=stmt.account_number,
+            branch=stmt.branch,
+            period_start=stmt.period_start,
+            period_end=stmt.period_end,
+            transactions=proto_txns,
+            withdrawal_total=str(stmt.summary.withdrawal_total) if stmt.summary else "",
+            deposit_total=str(stmt.summary.deposit_total) if stmt.summary else "",
+            error="",
+        )
+
+    except Exception as e:
+        print(f"Error processing statement: {e}")
+        return ocr_pb2.StatementResult(error=str(e))
+
+
+def _record_slip(result, image_data, username, type_of_expense):
+    """
+    Save an OCR'd slip and queue its n8n call, unless the same slip was
+    ingested before: duplicates are rejected by the DB before any webhook
+    call. Returns the webhook_result payload; raises RuntimeError when the
+    slip could not be saved.
+    """
+    metrics.record_fields(result)
+    with metrics.stage("db_insert"), tracing.span("db_insert") as span:
+        txn_id, duplicate = get_db_service().record_transaction(
+            amount=str(result.get("amount", "")),
+            date=str(result.get("date", "")),
+            description=str(result.get("ref", "")),
+            type_of_ie=type_of_expense,
+            username=username,
+            date_iso=result.get("date_iso") or None,
+            fingerprint=slip_fingerprint(result, image_data),
+        )
+        span.set_attribute("db.duplicate", duplicate)
+    if duplicate:
+        return {"status": "duplicate", "transaction_id": txn_id}
+    if txn_id is None:
+        # Not saved, so not deduplicated either: n8n must not hear about it.
+        # The client gets the error and can retry
+        raise RuntimeError("Transaction could not be saved")
+
+    with tracing.span("webhook_enqueue"):
+        return create_expenses(
+            username=username,
+            type_of_expense=type_of_expense,
+            amount=result['amount'],
+            date=result['date'],
+            expense_description=result['ref'],
+            note=result['raw_text']
+        )
 
-        except Exception as e:
-            print(f"Error processing statement: {e}")
-            return ocr_pb2.StatementResult(error=str(e))
+
+def _image_span(image_data):
+    return tracing.span("image", **{"image.bytes": len(image_data)})
+
+
+def _ocr_result(result, webhook_response):
+    return ocr_pb2.OCRResult(
+        amount=str(result.get("amount", "")),
+        date=str(result.get("date", "")),
+        ref=str(result.get("ref", "")),
+        raw_text=str(result.get("raw_text", "")),
+        date_iso=str(result.get("date_iso", "")),
+        error="",
+        webhook_result=json.dumps(webhook_response),
+        **_confidence_fields(result)
+    )
+
+
+def _confidence_fields(result):
+    """OCRResult *_confidence fields from an extract_info_from_image result."""
+    confidence = result.get("confidence", {})
+    return {
+        f"{field}_confidence": float(confidence.get(field, 0.0))
+        for field in ("amount", "date", "ref")
+    }
 
 
 def create_expenses(username, type_of_expense, amount, date, expense_description, note):
+        """Queue the n8n webhook call; delivery happens on the dispatcher thread."""
         production_api = os.environ.get('N8N_PRODUCTION_API', "http://n8n.n8n.svc.cluster.local:443/webhook/d3b132c4-8380-4b0d-96a6-ea11d2f040a9")
         
-        headers = {
-            "Content-Type": "application/json",
-            "x-AUTH": "",
-        }
-        
         payload = {
             "username": username,
             "typeOfExpense": 'BY MOBILE APP',
@@ -239,46 +319,58 @@ def create_expenses(username, type_of_expense, amount, date, expense_description
         }
         
         try:
-            response = requests.post(production_api, headers=headers, json=payload)
-            print("Status:", response.status_code)
-            print("Headers:", response.headers)
-            
-            try:
-                return response.json()
-            except ValueError:
-                return {"error": "Not JSON", "raw": response.text}
-                
+            return get_webhook_dispatcher().enqueue(production_api, payload)
         except Exception as err:
-            print("Fetch error:", err)
+            print("Webhook enqueue error:", err)
             return {"error": str(err)}
     
     
+SERVER_OPTIONS = [
+    # Send keepalive ping every 30 seconds to keep connection alive
+    ('grpc.keepalive_time_ms', 30000),
+    # Wait 10 seconds for keepalive ping ack before considering connection dead
+    ('grpc.keepalive_timeout_ms', 10000),
+    # Allow keepalive pings even when there are no active RPCs
+    ('grpc.keepalive_permit_without_calls', True),
+    # Allow unlimited keepalive pings without data
+    ('grpc.http2.max_pings_without_data', 0),
+    # Minimum time between pings from clients (5 seconds)
+    ('grpc.http2.min_ping_interval_without_data_ms', 5000),
+    # Allow clients to send keepalive pings
+    ('grpc.http2.min_recv_ping_interval_without_data_ms', 5000),
+    # Max connection idle time (5 minutes) - server will close idle connections gracefully
+    ('grpc.max_connection_idle_ms', 300000),
+    # Max connection age (30 minutes) - force reconnection periodically
+    ('grpc.max_connection_age_ms', 1800000),
+    # Grace period for max connection age (5 seconds)
+    ('grpc.max_connection_age_grace_ms', 5000),
+]
+
+
 def serve():
-    server_options = [
-        # Send keepalive ping every 30 seconds to keep connection alive
-        ('grpc.keepalive_time_ms', 30000),
-        # Wait 10 seconds for keepalive ping ack before considering connection dead
-        ('grpc.keepalive_timeout_ms', 10000),
-        # Allow keepalive pings even when there are no active RPCs
-        ('grpc.keepalive_permit_without_calls', True),
-        # Allow unlimited keepalive pings without data
-        ('grpc.http2.max_pings_without_data', 0),
-        # Minimum time between pings from clients (5 seconds)
-        ('grpc.http2.min_ping_interval_without_data_ms', 5000),
-        # Allow clients to send keepalive pings
-        ('grpc.http2.min_recv_ping_interval_without_data_ms', 5000),
-        # Max connection idle time (5 minutes) - server will close idle connections gracefully
-        ('grpc.max_connection_idle_ms', 300000),
-        # Max connection age (30 minutes) - force reconnection periodically
-        ('grpc.max_connection_age_ms', 1800000),
-        # Grace period for max connection age (5 seconds)
-        ('grpc.max_connection_age_grace_ms', 5000),
-    ]
+    # Start the OCR workers before the server threads exist
+    ocr_executor = get_ocr_executor()
+    print(f"Starting OCR executor ({ocr_executor.mode})...")
+    ocr_executor.warm_up()
+
+    # Deliver anything left in the webhook outbox by a previous run
+    webhook_dispatcher = get_webhook_dispatcher()
+    webhook_dispatcher.start()
+
+    # Open the transaction store (DB_BACKEND) before taking traffic
+    get_db_service()
+
+    metrics.start_metrics_server(ocr_executor, webhook_dispatcher)
+    tracing.setup()
+
     server = grpc.server(
         futures.ThreadPoolExecutor(max_workers=10),
-        options=server_options,
+        options=SERVER_OPTIONS,
+        # Further RPCs are rejected with RESOURCE_EXHAUSTED instead of queueing
+        # (each queued request holds its full image bytes)
+        maximum_concurrent_rpcs=GRPC_MAX_IN_FLIGHT,
     )
-    ocr_pb2_grpc.add_OCRServiceServicer_to_server(OCRService(), server)
+    ocr_pb2_grpc.add_OCRServiceServicer_to_server(OCRService(ocr_executor), server)
     server.add_insecure_port('[::]:50051')
     print("gRPC Server starting on port 50051...")
     server.start()
@@ -287,6 +379,14 @@ def serve():
             time.sleep(86400)
     except KeyboardInterrupt:
         server.stop(0)
+        ocr_executor.shutdown()
+        webhook_dispatcher.stop()
+        get_db_service().close()
+        tracing.shutdown()
 
 if __name__ == '__main__':
-    serve()
+    if GRPC_ASYNC:
+        import grpc_aio_server
+        grpc_aio_server.main()
+    else:
+        serve()
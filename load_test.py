@@ -0,0 +1,376 @@
+"""
+Load generator for a running OCRService (OCRServiceStub over gRPC).
+
+Sends a weighted mix of RPCs from a payload corpus for a fixed duration and
+reports, per RPC, a latency histogram, percentiles and the errors by status
+code, for sizing replicas, handler threads and OCR worker processes.
+
+RPC mix (--mix, weights):
+  single     ProcessImage, one slip
+  batch      ProcessBatch, --batch-size slips
+  multi      ProcessImages, --batch-size slips sharing username / type
+  stream     ProcessImageStream, --batch-size slips streamed in
+  statement  ProcessStatement, one statement PDF
+
+Load shape:
+  closed loop  (default) --concurrency callers, each sending its next
+               request as soon as the previous one returns
+  open loop    --rate requests per second overall, sent by up to
+               --concurrency callers.  Latency is measured from when a
+               request was due, not when it went out, so a server that
+               falls behind shows it in the percentiles instead of
+               silently lowering the offered load.
+
+Requests started during the first --warmup seconds are sent but not
+reported.  Errors are counted by gRPC status code (RESOURCE_EXHAUSTED is
+the server shedding load), plus image_error / statement_error for results
+that came back with their error field set.
+
+The corpus is a bench_corpus.py directory, or any directory of slip images
+(.jpg / .jpeg / .png) and statement PDFs.  The server caches OCR results
+and deduplicates slips, so a small corpus soon measures the cache and the
+duplicate path: run the server with OCR_CACHE_ENABLED=0 to measure OCR,
+and point it at a test database.
+
+    python load_test.py --target localhost:50051 --corpus bench-corpus \\
+        --mix single=6,batch=2,statement=1 --concurrency 16 --duration 120 --warmup 15
+    python load_test.py --rate 20 --concurrency 64 --channels 4 --out load.json
+"""
+
+import argparse
+import bisect
+import glob
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
+import grpc
+
+import ocr_pb2
+import ocr_pb2_grpc
+
+
+RPCS = {
+    "single": "ProcessImage",
+    "batch": "ProcessBatch",
+    "multi": "ProcessImages",
+    "stream": "ProcessImageStream",
+    "statement": "ProcessStatement",
+}
+
+# Histogram bucket upper bounds, ms
+BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+
+_IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+
+# ---------------------------------------------------------------------------
+# Corpus
+# ---------------------------------------------------------------------------
+
+def load_corpus(path):
+    """(slip images, statement PDFs) as bytes, from a bench_corpus directory or any directory."""
+    manifest = os.path.join(path, "manifest.json")
+    if os.path.exists(manifest):
+        with open(manifest, encoding="utf-8") as f:
+            entries = json.load(f)
+        slip_files = [os.path.join(path, e["file"]) for e in entries["slips"]]
+        pdf_files = [os.path.join(path, e["file"]) for e in entries["statements"]]
+    else:
+        files = sorted(glob.glob(os.path.join(path, "**", "*"), recursive=True))
+        slip_files = [f for f in files if f.lower().endswith(_IMAGE_EXTENSIONS)]
+        pdf_files = [f for f in files if f.lower().endswith(".pdf")]
+
+    def read(name):
+        with open(name, "rb") as f:
+            return f.read()
+    return [read(f) for f in slip_files], [read(f) for f in pdf_files]
+
+
+def parse_mix(text):
+    """"single=6,batch=2,statement=1" → {"single": 6.0, "batch": 2.0, "statement": 1.0}."""
+    mix = {}
+    for part in text.split(","):
+        if not part.strip():
+            continue
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in RPCS:
+            raise argparse.ArgumentTypeError(f"unknown RPC {name!r}; choose from {', '.join(RPCS)}")
+        try:
+            mix[name] = float(weight) if weight else 1.0
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"bad weight for {name}: {weight!r}")
+    if not mix or sum(mix.values()) <= 0:
+        raise argparse.ArgumentTypeError("the mix needs at least one RPC with a positive weight")
+    return mix
+
+
+# ---------------------------------------------------------------------------
+# Results
+# ---------------------------------------------------------------------------
+
+class Stats:
+    """Latencies and errors of one RPC kind (thread-safe)."""
+
+    def __init__(self):
+        self.latencies = []
+        self.errors = Counter()
+        self.images = 0
+        self._lock = threading.Lock()
+
+    def add(self, seconds, error=None, images=0):
+        with self._lock:
+            if error:
+                self.errors[error] += 1
+            else:
+                self.latencies.append(seconds)
+                self.images += images
+
+    def report(self, seconds) -> dict:
+        ordered = sorted(self.latencies)
+        count = len(ordered) + sum(self.errors.values())
+        counts = [0] * (len(BUCKETS_MS) + 1)
+        for latency in ordered:
+            counts[bisect.bisect_left(BUCKETS_MS, latency * 1000)] += 1
+
+        latency = {}
+        if ordered:
+            for p in (50, 90, 95, 99):
+                # Nearest rank
+                latency[f"p{p}"] = round(ordered[max(0, int(round(p / 100 * len(ordered))) - 1)] * 1000, 2)
+            latency["max"] = round(ordered[-1] * 1000, 2)
+
+        return {
+            "requests": count,
+            "ok": len(ordered),
+            "errors": dict(self.errors),
+            "requests_per_second": round(count / seconds, 3) if seconds else None,
+            "images_per_second": round(self.images / seconds, 3) if seconds and self.images else None,
+            "latency_ms": latency,
+            "histogram_ms": {
+                (f"<={bound}" if i < len(BUCKETS_MS) else f">{BUCKETS_MS[-1]}"): n
+                for i, (bound, n) in enumerate(zip(BUCKETS_MS + (None,), counts))
+            },
+        }
+
+
+def _status(error: grpc.RpcError) -> str:
+    return error.code().name if error.code() else "UNKNOWN"
+
+
+# ---------------------------------------------------------------------------
+# Load generation
+# ---------------------------------------------------------------------------
+
+class LoadTest:
+    def __init__(self, args, slips, statements):
+        self.args = args
+        self.slips = slips
+        self.statements = statements
+        self.kinds = list(args.mix)
+        self.weights = [args.mix[k] for k in self.kinds]
+        self.stats = {kind: Stats() for kind in self.kinds}
+        self.channels = [grpc.insecure_channel(args.target, options=[
+            ("grpc.max_send_message_length", 64 * 1024 * 1024),
+            ("grpc.max_receive_message_length", 64 * 1024 * 1024),
+            # Separate connections, so several replicas behind one Service all get traffic
+            ("grpc.use_local_subchannel_pool", 1),
+        ]) for _ in range(max(1, args.channels))]
+        self.stubs = [ocr_pb2_grpc.OCRServiceStub(channel) for channel in self.channels]
+        self._next = 0
+        self._next_lock = threading.Lock()
+
+    def _images(self, rng):
+        return [rng.choice(self.slips) for _ in range(self.args.batch_size)]
+
+    def call(self, stub, kind, rng):
+        """Send one RPC; returns (images in it, error or None)."""
+        args = self.args
+        timeout = args.timeout
+        if kind == "single":
+            result = stub.ProcessImage(ocr_pb2.ImageRequest(
+                image_data=rng.choice(self.slips), username=args.username), timeout=timeout)
+            return 1, "image_error" if result.error else None
+        if kind == "batch":
+            request = ocr_pb2.BatchImageRequest(requests=[
+                ocr_pb2.ImageRequest(image_data=data, username=args.username)
+                for data in self._images(rng)])
+            results = stub.ProcessBatch(request, timeout=timeout).results
+        elif kind == "multi":
+            results = stub.ProcessImages(ocr_pb2.MultiImageRequest(
+                image_data=self._images(rng), username=args.username), timeout=timeout).results
+        elif kind == "stream":
+            requests = (ocr_pb2.ImageRequest(image_data=data, username=args.username,
+                                             correlation_id=str(i))
+                        for i, data in enumerate(self._images(rng)))
+            results = list(stub.ProcessImageStream(requests, timeout=timeout))
+        else:
+            result = stub.ProcessStatement(ocr_pb2.PDFStatementRequest(
+                pdf_data=rng.choice(self.statements), username=args.username), timeout=timeout)
+            return 0, "statement_error" if result.error else None
+        return len(results), "image_error" if any(r.error for r in results) else None
+
+    def _due(self, start):
+        """Open loop: when the next request overall is due (None: closed loop, send now)."""
+        if not self.args.rate:
+            return None
+        with self._next_lock:
+            i = self._next
+            self._next += 1
+        return start + i / self.args.rate
+
+    def caller(self, index, start, measure_from, stop_at):
+        rng = random.Random(self.args.seed * 1000 + index)
+        stub = self.stubs[index % len(self.stubs)]
+        while True:
+            due = self._due(start)
+            if due is not None:
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            sent = time.perf_counter()
+            if sent >= stop_at:
+                return
+            kind = rng.choices(self.kinds, self.weights)[0]
+            try:
+                images, error = self.call(stub, kind, rng)
+            except grpc.RpcError as e:
+                images, error = 0, _status(e)
+            ended = time.perf_counter()
+            began = sent if due is None else due
+            if began >= measure_from:
+                self.stats[kind].add(ended - began, error, images)
+
+    def run(self) -> dict:
+        args = self.args
+        for channel in self.channels:
+            grpc.channel_ready_future(channel).result(timeout=args.connect_timeout)
+
+        start = time.perf_counter()
+        measure_from = start + args.warmup
+        stop_at = measure_from + args.duration
+        callers = [threading.Thread(target=self.caller, args=(i, start, measure_from, stop_at),
+                                    daemon=True)
+                   for i in range(args.concurrency)]
+        for thread in callers:
+            thread.start()
+        next_progress = start + args.progress_every
+        while any(thread.is_alive() for thread in callers):
+            time.sleep(0.2)
+            if time.perf_counter() >= next_progress:
+                self._progress(start, measure_from, stop_at)
+                next_progress += args.progress_every
+        # Requests are reported by start time: rates are over the window they started in
+        seconds = args.duration
+        for channel in self.channels:
+            channel.close()
+
+        total = Stats()
+        for stats in self.stats.values():
+            total.latencies += stats.latencies
+            total.errors.update(stats.errors)
+            total.images += stats.images
+        return {
+            "target": args.target,
+            "mix": args.mix,
+            "concurrency": args.concurrency,
+            "offered_rate": args.rate or None,
+            "duration": round(seconds, 3),
+            "total": total.report(seconds),
+            # Open loop: requests due in the window that no caller was free to send
+            "not_sent": max(0, int(args.rate * seconds) - len(total.latencies)
+                            - sum(total.errors.values())) if args.rate else 0,
+            "rpcs": {RPCS[kind]: stats.report(seconds) for kind, stats in self.stats.items()},
+        }
+
+    def _progress(self, start, measure_from, stop_at):
+        now = time.perf_counter()
+        if now < measure_from:
+            print(f"  warming up ({now - start:.0f}s)")
+            return
+        done = sum(len(s.latencies) for s in self.stats.values())
+        failed = sum(sum(s.errors.values()) for s in self.stats.values())
+        elapsed = min(now, stop_at) - measure_from
+        print(f"  {now - measure_from:.0f}s: {done} ok, {failed} errors, "
+              f"{(done + failed) / max(elapsed, 1e-9):.1f} req/s")
+
+
+# ---------------------------------------------------------------------------
+# Output
+# ---------------------------------------------------------------------------
+
+def print_report(report) -> None:
+    print(f"\n{report['target']}: {report['duration']:.0f}s, concurrency {report['concurrency']}, "
+          f"offered rate {report['offered_rate'] or 'unbounded'}")
+    if report["not_sent"]:
+        print(f"{report['not_sent']} requests due were never sent: every caller was waiting "
+              f"on the server (raise --concurrency to keep offering the rate)")
+    for name, stats in [("all", report["total"])] + list(report["rpcs"].items()):
+        if not stats["requests"]:
+            continue
+        latency = stats["latency_ms"]
+        print(f"\n{name}: {stats['requests']} requests, {stats['requests_per_second']} req/s"
+              + (f", {stats['images_per_second']} images/s" if stats["images_per_second"] else ""))
+        if latency:
+            print("  latency ms  " + "  ".join(f"{k} {v}" for k, v in latency.items()))
+        if stats["errors"]:
+            print("  errors      " + "  ".join(f"{k} {v}" for k, v in
+                                                sorted(stats["errors"].items(), key=lambda kv: -kv[1])))
+        if name == "all" and stats["ok"]:
+            peak = max(stats["histogram_ms"].values())
+            for bucket, n in stats["histogram_ms"].items():
+                if n:
+                    print(f"  {bucket:>9} ms {n:>7}  {'#' * max(1, round(40 * n / peak))}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test a running OCRService")
+    parser.add_argument("--target", default="localhost:50051", help="server host:port")
+    parser.add_argument("--corpus", default="bench-corpus",
+                        help="bench_corpus.py directory, or any directory of slips and PDFs")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("single=1"),
+                        help="weighted RPCs, e.g. single=6,batch=2,multi=1,stream=1,statement=1")
+    parser.add_argument("--concurrency", type=int, default=8, help="concurrent callers")
+    parser.add_argument("--rate", type=float, default=0,
+                        help="requests per second overall (default: closed loop, as fast as "
+                             "the callers get responses)")
+    parser.add_argument("--duration", type=float, default=60, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=10, help="unreported seconds first")
+    parser.add_argument("--batch-size", type=int, default=4,
+                        help="images per batch / multi / stream request")
+    parser.add_argument("--channels", type=int, default=1,
+                        help="gRPC connections the callers are spread over")
+    parser.add_argument("--timeout", type=float, default=120, help="per-RPC deadline, seconds")
+    parser.add_argument("--connect-timeout", type=float, default=10)
+    parser.add_argument("--username", default="loadtest", help="username sent with every request")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--progress-every", type=float, default=10, help="progress line interval")
+    parser.add_argument("--out", help="also write the report as JSON here")
+    args = parser.parse_args()
+
+    slips, statements = load_corpus(args.corpus)
+    if not slips and set(args.mix) - {"statement"}:
+        sys.exit(f"No slip images in {args.corpus} (generate some with bench_corpus.py)")
+    if not statements and "statement" in args.mix:
+        sys.exit(f"No statement PDFs in {args.corpus} (generate some with bench_corpus.py)")
+
+    print(f"{len(slips)} slips, {len(statements)} statements; "
+          f"{args.warmup:.0f}s warmup + {args.duration:.0f}s against {args.target}")
+    try:
+        report = LoadTest(args, slips, statements).run()
+    except grpc.FutureTimeoutError:
+        sys.exit(f"Could not connect to {args.target}")
+    print_report(report)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
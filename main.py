@@ -1,14 +1,21 @@
 from flask import Flask, request, jsonify
-from PIL import Image
 import cv2
 import numpy as np
 import base64
-import io
 import pytesseract
-import re
 import requests
 import json
+import threading
 from datetime import datetime
+from ocr_pool import OCRPool, get_ocr_pool
+from ocr_cache import get_ocr_cache, image_key
+from layout import find_text_lines
+from preprocess import (decode_flag, normalization_scale, pipeline_name, resample, run_pipeline,
+                        scale_boxes)
+import preprocess
+from verify import decode_qr, slip_qr_info
+from extractor import FIELDS, NOT_FOUND, OCR_FIELD_CONFIDENCE, REF_LABEL_RE, extract_fields
+from metrics import event, stage
 
 app = Flask(__name__)
 
@@ -18,86 +25,369 @@ import os
 if os.name == 'nt':
     pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
 
-def extract_info_from_image(img):
-   
-    # Convert to grayscale
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+# Bump whenever the preprocessing below changes so cached OCR results are not reused
+PREPROCESS_VERSION = "graydecode-xheight-blur3x3-v9"
 
-    # เพิ่มความคม
-    gray = cv2.GaussianBlur(gray, (3,3), 0)
+def ocr_cache_config(ocr_pool: OCRPool) -> str:
+    """Everything besides the image that changes the OCR output — part of the cache key."""
+    roi = "roi" if _roi_enabled(ocr_pool) else "full"
+    qr = "qr" if QR_FAST_PATH else "noqr"
+    return (f"{ocr_pool.lang}|oem{ocr_pool.oem}|psm{ocr_pool.psm}|{roi}|{qr}|"
+            f"{preprocess.config_tag()}|{PREPROCESS_VERSION}")
 
-    # Adaptive Thresholding looks too aggressive for some images causing noise
-    # Let's try passing the grayscale image directly first, strictly as the original commented out code suggested
-    # or use a simple threshold if needed. Tesseract does its own binarization internally usually.
-    
-    # Using grayscale directly for now to avoid 'frying' the image
-    processed_img = gray
-    
-    # Debug: Uncomment to save image to check what tesseract sees
-    # cv2.imwrite("debug_ocr_input.jpg", processed_img)
-
-    # eng_text = pytesseract.image_to_string(
-    #     processed_img,
-    #     lang="eng",
-    #     config="--psm 6"
-    # )
-    # print('eng_text',eng_text)
-    
-    
-    ocr_text = pytesseract.image_to_string(
-       processed_img, 
-       lang="tha+eng",
-        config="--oem 1 --psm 11"
-    )
-
-    # Extract Amount
-    amount = re.search(r"\d{1,3}(,\d{3})*(\.\d{2})", ocr_text)
-    amount_val = amount.group() if amount else "Not found"
-
-    # Extract Date
-    # Extract Date
-    # Flexible pattern to handle OCR errors like "S.A." and time separators like ":"
-    # Matches: dd Month yyyy - HH:MM or HH.MM (time optional)
-    date_match = re.search(
-        r"(\d{1,2})\s*(\S{2,})\s*(25\d{2}|20\d{2})(?:\s*[-–]?\s*(\d{2}[:\.]\d{2}))?",
-        ocr_text
-    )
-    
-    date_val = "Not found"
-    if date_match:
-        # Check if we need to fix the month part (group 2)
-        day = date_match.group(1)
-        month_raw = date_match.group(2)
-        year = date_match.group(3)
-        time = date_match.group(4) if date_match.group(4) else "00:00"
-        
-        # OCR Error Mapping
-        # Map incorrect OCR readings to correct Thai months
-        month_corrections = {
-            "S.A.": "ธ.ค.",  # User reported S.A. -> ธ.ค.
-            "5.A.": "ธ.ค.",  # Likely similar error
-            "S.A": "ธ.ค.",   # Variant without dot
-            "5.A": "ธ.ค.",
-            "s.a.": "ธ.ค.",
-            "s.a": "ธ.ค.",
-        }
-        
-        month_fixed = month_corrections.get(month_raw, month_raw)
-        
-        # Reconstruct date string with fixed month
-        date_val = f"{day} {month_fixed} {year} - {time}"
+def extract_info_from_image(img, ocr_pool: OCRPool = None, in_place: bool = False):
+    """
+    OCR a decoded slip — grayscale (preferred, see decode_image_bytes) or BGR/BGRA.
+    in_place=True lets the pipeline overwrite img instead of copying it.
+    """
+    if ocr_pool is None:
+        ocr_pool = get_ocr_pool()
+
+    # Same pixels + same OCR config → same answer
+    cache = get_ocr_cache()
+    cache_key = image_key(img, ocr_cache_config(ocr_pool))
+    cached = cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    # Convert to grayscale (decode_image_bytes already hands over gray)
+    if img.ndim == 2:
+        gray = img
+    else:
+        code = cv2.COLOR_BGRA2GRAY if img.shape[2] == 4 else cv2.COLOR_BGR2GRAY
+        gray = cv2.cvtColor(img, code)
+        in_place = True
+
+    # QR fast path: a CRC-valid bank slip-verification QR with amount and ref
+    # makes Tesseract unnecessary; otherwise its fields still seed the result.
+    # A PromptPay payment-request QR only offers hints (see _read_slip_qr)
+    if QR_FAST_PATH:
+        with stage("qr"):
+            qr = _read_slip_qr(gray)
+    else:
+        qr = None
+    if qr is not None and _accepted(qr, "amount") and _accepted(qr, "ref"):
+        cache.put(cache_key, qr)
+        return qr
+
+    # Resample so the text lands at Tesseract's preferred x-height: big
+    # screenshots shrink (fewer pixels to OCR), thumbnails grow
+    use_roi = _roi_enabled(ocr_pool)
+    with stage("preprocess"):
+        boxes = find_text_lines(gray) if (preprocess.OCR_NORMALIZE or use_roi) else None
+        if boxes:
+            scale = normalization_scale(boxes)
+            if scale != 1.0:
+                gray = resample(gray, scale)
+                boxes = scale_boxes(boxes, scale)
+                in_place = True
+
+    # Preprocessing variants, cheapest first (blur by default). Tesseract
+    # binarizes internally and thresholding tends to 'fry' clean screenshots,
+    # so upscale / erode / threshold variants only run while too few of the
+    # fields found so far were read confidently (escalation_score)
+    roi_boxes = boxes if use_roi else None
+    result = qr
+    # Line indices each field was found on, carried across passes so later
+    # passes re-read only the lines of fields that are still weak
+    field_lines = {}
+    pipelines = preprocess.PIPELINES
+    for i, stages in enumerate(pipelines):
+        # Earlier variants must leave the normalized image intact for the next
+        last = i == len(pipelines) - 1
+        with stage("preprocess"):
+            processed_img = run_pipeline(gray, stages, in_place=in_place and last)
+
+        # Debug: Uncomment to save image to check what tesseract sees
+        # cv2.imwrite(f"debug_ocr_input_{pipeline_name(stages)}.jpg", processed_img)
+
+        result = _ocr_pass(processed_img, ocr_pool, result,
+                           _boxes_for(roi_boxes, gray, processed_img), field_lines, first=i == 0)
+        if escalation_score(result) >= preprocess.OCR_MIN_CONFIDENCE:
+            _record_pipeline(pipeline_name(stages), i + 1)
+            break
+    else:
+        _record_pipeline("exhausted", len(pipelines))
+
+    cache.put(cache_key, result)
+    return result
+
+def _ocr_pass(img, ocr_pool: OCRPool, result, boxes, field_lines, first=True):
+    """
+    One OCR pass over a preprocessed image: the detected lines first (when
+    boxes is given), then the full image. A field keeps whichever reading
+    was most confident, and accepted fields are carried forward untouched.
+
+    The first pass reads every line, and the full image while any field is
+    missing or below OCR_FIELD_CONFIDENCE. Escalation passes only exist for
+    weak readings (escalation_score), so they re-read just the lines those
+    fields were found on (field_lines) and the full image while one of them
+    is still weak; fields never found are taken not to be on the slip.
+    """
+    if boxes is not None:
+        only = None if first else sorted({
+            line for field in FIELDS if not _accepted(result, field)
+            for line in field_lines.get(field, ())
+        })
+        if first or only:
+            result = _merge_fields(result, _extract_info_roi(img, ocr_pool, boxes, result,
+                                                             field_lines, only))
+
+    if first:
+        needs_full = field_confidence(result) < 1.0
+    else:
+        needs_full = any(result[field] != NOT_FOUND and not _accepted(result, field)
+                         for field in FIELDS)
+    if needs_full:
+        # Full-image sparse-text pass: tha+eng, --oem 1 --psm 11 — engines keep
+        # the models loaded between calls
+        result = _merge_fields(result, read_fields(*ocr_pool.image_to_data(img)))
+    return result
+
+def _boxes_for(boxes, gray, processed_img):
+    """Line boxes of gray, rescaled when a stage (upscale2x) changed the geometry."""
+    if boxes is None or processed_img.shape[1] == gray.shape[1]:
+        return boxes
+    return scale_boxes(boxes, processed_img.shape[1] / gray.shape[1])
+
+def read_fields(ocr_text, word_spans):
+    """extract_fields with confidences, plus the raw_text."""
+    with stage("extract"):
+        result = extract_fields(ocr_text, word_spans)
+    result["raw_text"] = ocr_text
+    return result
+
+def _confidence(result, field):
+    return result.get("confidence", {}).get(field, 0.0)
+
+def _accepted(result, field):
+    """Found with enough confidence that no further pass needs to re-read it."""
+    return result[field] != NOT_FOUND and _confidence(result, field) >= OCR_FIELD_CONFIDENCE
+
+def _merge_fields(primary, secondary):
+    """
+    Fields of primary, each replaced by secondary's reading when primary's is
+    "Not found" or secondary read it with higher confidence; raw_text from secondary.
+    """
+    if primary is None:
+        return secondary
+    if secondary is None:
+        return primary
+    merged = dict(primary)
+    confidence = dict(primary.get("confidence", {}))
+    for field in FIELDS:
+        if secondary[field] == NOT_FOUND:
+            continue
+        if merged[field] == NOT_FOUND or _confidence(secondary, field) > confidence.get(field, 0.0):
+            merged[field] = secondary[field]
+            confidence[field] = _confidence(secondary, field)
+            if field == "date":
+                merged["date_iso"] = secondary.get("date_iso", "")
+    merged["confidence"] = confidence
+    merged["raw_text"] = secondary["raw_text"]
+    return merged
+
+def field_confidence(result):
+    """Share of amount / date / ref read with at least OCR_FIELD_CONFIDENCE (0.0 – 1.0)."""
+    if result is None:
+        return 0.0
+    return sum(_accepted(result, field) for field in FIELDS) / len(FIELDS)
+
+def escalation_score(result):
+    """
+    Share of the fields found so far that were read with at least
+    OCR_FIELD_CONFIDENCE; 1.0 when none was found. A field the slip doesn't
+    have (no "Ref" label) can't be read by any preprocessing variant, so only
+    weak readings of fields that are there justify another pass.
+    """
+    found = [field for field in FIELDS if result is not None and result[field] != NOT_FOUND]
+    if not found:
+        return 1.0
+    return sum(_accepted(result, field) for field in found) / len(found)
 
-    # Extract Ref
-    ref = re.search(r"(Ref|Reference|เลขที่อ้างอิง)\s*[:\-]?\s*(\w+)", ocr_text)
-    ref_val = ref.group(2) if ref else "Not found"
+# Which preprocessing pipeline ended each extraction (this process)
+_pipeline_stats = {"images": 0, "passes": 0, "accepted_by": {}}
+_pipeline_stats_lock = threading.Lock()
 
+def pipeline_stats():
+    """Images, OCR passes and the pipeline that reached OCR_MIN_CONFIDENCE ("exhausted": none did)."""
+    with _pipeline_stats_lock:
+        stats = dict(_pipeline_stats)
+        stats["accepted_by"] = dict(stats["accepted_by"])
+        return stats
+
+def _record_pipeline(name, passes):
+    with _pipeline_stats_lock:
+        _pipeline_stats["images"] += 1
+        _pipeline_stats["passes"] += passes
+        accepted_by = _pipeline_stats["accepted_by"]
+        accepted_by[name] = accepted_by.get(name, 0) + 1
+    event("pipeline", name)
+
+# ---------------------------------------------------------------------------
+# QR fast path
+# ---------------------------------------------------------------------------
+
+QR_FAST_PATH = os.environ.get("QR_FAST_PATH", "1") != "0"
+
+_qr_stats = {"attempts": 0, "decoded": 0, "complete": 0, "partial": 0, "hint": 0}
+_qr_stats_lock = threading.Lock()
+
+def qr_fast_path_stats():
+    """How often the QR fast path ran, decoded a valid payload, and skipped OCR (this process)."""
+    with _qr_stats_lock:
+        return dict(_qr_stats)
+
+def _qr_outcome(info):
+    if not info:
+        return "none"
+    if info["kind"] != "slip":
+        return "hint"
+    return "complete" if "amount" in info and "ref" in info else "partial"
+
+def _read_slip_qr(gray):
+    """
+    Fields from a CRC-valid QR (date is never in the QR), or None.
+
+    A bank slip-verification QR vouches for a completed transfer: its fields
+    are certain (confidence 1.0). A PromptPay payment-request QR only says
+    what someone asked to be paid, so its fields are hints with confidence
+    0.0: OCR always runs, any reading of the field replaces them, and they
+    only survive for a field OCR could not find at all.
+    """
+    payload = decode_qr(gray)
+    info = slip_qr_info(payload) if payload else None
+
+    outcome = _qr_outcome(info)
+    with _qr_stats_lock:
+        _qr_stats["attempts"] += 1
+        if info:
+            _qr_stats["decoded"] += 1
+            _qr_stats[outcome] += 1
+    event("qr", outcome)
+
+    if not info:
+        return None
+    certain = 1.0 if info["kind"] == "slip" else 0.0
     return {
-        "amount": amount_val,
-        "date": date_val,
-        "ref": ref_val,
-        "raw_text": ocr_text
+        "amount": info.get("amount", NOT_FOUND),
+        "date": NOT_FOUND,
+        "ref": info.get("ref", NOT_FOUND),
+        "date_iso": "",
+        "raw_text": payload,
+        "confidence": {
+            "amount": certain if "amount" in info else 0.0,
+            "date": 0.0,
+            "ref": certain if "ref" in info else 0.0,
+        },
     }
 
+# ---------------------------------------------------------------------------
+# Region-of-interest OCR
+# ---------------------------------------------------------------------------
+
+# "auto": only with in-process (tesserocr) engines, where reading many small
+# regions is cheap. "1" / "0" force it on / off.
+OCR_ROI = os.environ.get("OCR_ROI", "auto")
+
+# Per-field PSM and character whitelists for the targeted re-reads
+_LINE_PSM = 7  # single text line
+_AMOUNT_WHITELIST = "0123456789,."
+_REF_WHITELIST = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789"
+
+def _roi_enabled(ocr_pool: OCRPool) -> bool:
+    if OCR_ROI == "auto":
+        return ocr_pool.backend == "tesserocr"
+    return OCR_ROI == "1"
+
+def _extract_info_roi(gray, ocr_pool: OCRPool, boxes=None, known=None, field_lines=None,
+                      only=None):
+    """
+    OCR only the detected text lines (one line per read, --psm 7), then re-read
+    low-confidence amount and ref lines with a character whitelist. Logos, QR
+    codes and whitespace are never handed to Tesseract. Fields already accepted
+    in known are not re-read. None when no lines are found.
+
+    only limits the reads to those line indices (raw_text then stays known's);
+    field_lines, when given, collects the indices each field was found on.
+    """
+    if boxes is None:
+        boxes = find_text_lines(gray)
+    if not boxes:
+        return None
+
+    indices = range(len(boxes)) if only is None else only
+    lines = ocr_pool.read_regions_data(gray, [boxes[i] for i in indices], psm=_LINE_PSM)
+    result = {field: NOT_FOUND for field in FIELDS}
+    result["date_iso"] = ""
+    result["confidence"] = {field: 0.0 for field in FIELDS}
+    if known is not None:
+        result = _merge_fields(result, known)
+    if field_lines is None:
+        field_lines = {}
+
+    def take(fields):
+        nonlocal result
+        fields["raw_text"] = ""
+        result = _merge_fields(result, fields)
+
+    for i, (text, spans) in zip(indices, lines):
+        with stage("extract"):
+            fields = extract_fields(text, spans)
+        for field in FIELDS:
+            if fields[field] != NOT_FOUND:
+                field_lines.setdefault(field, set()).add(i)
+
+        if not _accepted(result, "amount") and fields["amount"] != NOT_FOUND:
+            take({**fields, "date": NOT_FOUND, "ref": NOT_FOUND})
+            if not _accepted(result, "amount"):
+                refined = extract_fields(*ocr_pool.read_regions_data(
+                    gray, [boxes[i]], psm=_LINE_PSM, whitelist=_AMOUNT_WHITELIST)[0])
+                take({**refined, "date": NOT_FOUND, "ref": NOT_FOUND})
+
+        if not _accepted(result, "date") and fields["date"] != NOT_FOUND:
+            take({**fields, "amount": NOT_FOUND, "ref": NOT_FOUND})
+
+        if not _accepted(result, "ref"):
+            if fields["ref"] != NOT_FOUND:
+                take({**fields, "amount": NOT_FOUND, "date": NOT_FOUND})
+            elif REF_LABEL_RE.search(text.strip()) and i + 1 < len(boxes):
+                # Label at the end of the line — the value is the next line
+                field_lines.setdefault("ref", set()).add(i)
+                value, value_spans = ocr_pool.read_regions_data(
+                    gray, [boxes[i + 1]], psm=_LINE_PSM, whitelist=_REF_WHITELIST)[0]
+                if value_spans:
+                    start, end, conf = value_spans[0]
+                    take({"amount": NOT_FOUND, "date": NOT_FOUND, "ref": value[start:end],
+                          "confidence": {"ref": conf}})
+
+    if only is None or known is None:
+        result["raw_text"] = "\n".join(text.strip() for text, _ in lines if text.strip())
+    else:
+        result["raw_text"] = known.get("raw_text", "")
+    return result
+
+def decode_image_bytes(image_data):
+    """
+    Decode encoded image bytes (bytes / memoryview, not copied) straight to a
+    grayscale ndarray; None if they aren't an image. Oversized images come out
+    already reduced (IMREAD_REDUCED_GRAYSCALE_*, see preprocess).
+    """
+    with stage("decode"):
+        nparr = np.frombuffer(image_data, np.uint8)
+        return cv2.imdecode(nparr, decode_flag(image_data))
+
+def process_image_bytes(image_data, ocr_pool: OCRPool = None):
+    """
+    The one ingest path for every entry point (Flask, base64, gRPC, OCR
+    workers): encoded bytes → grayscale → OCR fields. None if they aren't an image.
+    """
+    img = decode_image_bytes(image_data)
+    if img is None:
+        return None
+    # Freshly decoded and owned by nobody else — preprocess it in place
+    return extract_info_from_image(img, ocr_pool, in_place=True)
+
 @app.route('/process_image', methods=['POST'])
 def process_image_endpoint():
     if 'file' not in request.files:
@@ -111,19 +401,10 @@ def process_image_endpoint():
         return jsonify({"error": "No selected file"}), 400
 
     if file:
-        # Read file into numpy array for cv2
-        in_memory_file = io.BytesIO(file.read())
-        file_bytes = np.asarray(bytearray(in_memory_file.read()), dtype=np.uint8)
-        # Note: io.BytesIO read cursor is at end, need to seek 0 or just use file.read() directly to bytes
-        # Let's fix reading:
-        in_memory_file.seek(0)
-        file_bytes = np.frombuffer(in_memory_file.read(), np.uint8)
-        img = cv2.imdecode(file_bytes, cv2.IMREAD_COLOR)
-
-        if img is None:
-             return jsonify({"error": "Invalid image file"}), 400
+        result = process_image_bytes(file.read(), get_ocr_pool())
 
-        result = extract_info_from_image(img)
+        if result is None:
+             return jsonify({"error": "Invalid image file"}), 400
 
         # Extract extra fields from form data if available
         username = request.form.get('username', 'default_user')
@@ -152,12 +433,10 @@ def ocr_from_base64_logic(base64_str: str) -> str:
         base64_str = base64_str.split(",")[1]
 
     image_bytes = base64.b64decode(base64_str)
-    image = Image.open(io.BytesIO(image_bytes))
-    # Convert PIL to CV2 if we want to use the same pipeline, 
-    # or just use Tesseract on PIL image as in original code.
-    # For consistency let's stick to the requested extraction logic which used cv2 processing.
-    img_np = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
-    return extract_info_from_image(img_np)
+    result = process_image_bytes(image_bytes)
+    if result is None:
+        raise ValueError("Invalid image data")
+    return result
 
 
 
@@ -0,0 +1,265 @@
+"""
+Prometheus metrics for the OCR service.
+
+  ocr_stage_seconds{stage}             per-image time in decode, preprocess,
+                                       ocr, extract, db_insert and webhook
+  ocr_rpc_seconds{method}              RPC latency
+  ocr_rpcs_in_flight{method}           RPCs being handled
+  ocr_executor_busy / _capacity        images in the OCR worker processes
+                                       (or engines of the in-process pool)
+  ocr_executor_restarts_total          worker pools replaced after a worker died
+  ocr_cache_upload_lookups_total{result}
+                                       OCR cache by encoded upload bytes, looked
+                                       up by the server: memory_hit / disk_hit /
+                                       miss
+  ocr_cache_pixel_lookups_total{result}
+                                       OCR cache by decoded pixels, looked up
+                                       where OCR runs (the workers' own LRUs)
+  ocr_fields_total{field, outcome}     amount / date / ref found or "Not found"
+  ocr_qr_fast_path_total{outcome}      complete / partial / hint / none
+  ocr_pipeline_accepted_total{pipeline}
+  webhook_*                            outbox depth, oldest pending age,
+                                       deliveries, failed attempts, dead rows
+
+OCR runs in worker processes (ocr_executor), where no registry is scraped.
+Code there wraps its work in recording(): stage() and event() calls append
+to the recording instead of touching the metrics, the worker returns it with
+the result, and the server replays it with observe().  Each entry keeps its
+wall-clock start, so the same recording also describes the request's timeline.
+
+Configuration (environment):
+  METRICS_PORT   HTTP port /metrics is served on; 0 disables it   (default: 9100)
+"""
+
+import functools
+import inspect
+import os
+import threading
+import time
+import types
+from contextlib import contextmanager
+
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+from prometheus_client.core import REGISTRY, CounterMetricFamily, GaugeMetricFamily
+
+
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "9100"))
+
+# 1 ms … 60 s: a cached lookup up to a slow multi-pass OCR
+_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+STAGE_SECONDS = Histogram("ocr_stage_seconds", "Time spent per image in each processing stage",
+                          ["stage"], buckets=_BUCKETS)
+RPC_SECONDS = Histogram("ocr_rpc_seconds", "gRPC handler latency", ["method"], buckets=_BUCKETS)
+RPCS_IN_FLIGHT = Gauge("ocr_rpcs_in_flight", "gRPC calls being handled", ["method"])
+FIELDS = Counter("ocr_fields_total", "Slip fields extracted, by outcome", ["field", "outcome"])
+QR_FAST_PATH = Counter("ocr_qr_fast_path_total", "QR fast path attempts, by outcome", ["outcome"])
+PIPELINE_ACCEPTED = Counter("ocr_pipeline_accepted_total",
+                            "Images by the preprocessing pipeline that ended OCR "
+                            "(\"exhausted\": none reached OCR_MIN_CONFIDENCE)", ["pipeline"])
+
+CACHE_UPLOAD_LOOKUPS = Counter("ocr_cache_upload_lookups_total",
+                               "OCR cache lookups by encoded upload bytes, by result", ["result"])
+CACHE_PIXEL_LOOKUPS = Counter("ocr_cache_pixel_lookups_total",
+                              "OCR cache lookups by decoded pixels, by result", ["result"])
+
+_EVENTS = {"qr": QR_FAST_PATH, "pipeline": PIPELINE_ACCEPTED,
+           "cache_upload": CACHE_UPLOAD_LOOKUPS, "cache_pixels": CACHE_PIXEL_LOOKUPS}
+
+
+# ---------------------------------------------------------------------------
+# Stage timings and events
+# ---------------------------------------------------------------------------
+
+class Recording:
+    """Stage timings [(stage, start, seconds)] and events [(name, label)] of one image."""
+
+    def __init__(self):
+        self.timings = []
+        self.events = []
+
+
+_local = threading.local()
+
+
+@contextmanager
+def recording():
+    """Collect this thread's stage() / event() calls instead of observing them."""
+    rec = Recording()
+    outer = getattr(_local, "recording", None)
+    _local.recording = rec
+    try:
+        yield rec
+    finally:
+        _local.recording = outer
+
+
+@contextmanager
+def stage(name):
+    """Time a block as part of stage `name`."""
+    start = time.time()
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - t0
+        rec = getattr(_local, "recording", None)
+        if rec is not None:
+            rec.timings.append((name, start, seconds))
+        else:
+            STAGE_SECONDS.labels(name).observe(seconds)
+
+
+def event(name, label):
+    """Count an occurrence (e.g. event("qr", "complete")); recorded like stage()."""
+    rec = getattr(_local, "recording", None)
+    if rec is not None:
+        rec.events.append((name, label))
+    else:
+        _EVENTS[name].labels(label).inc()
+
+
+def observe(rec):
+    """
+    Replay a Recording: one histogram observation per stage with the image's
+    total time in it (a stage can run several times per image, e.g. one OCR
+    call per text line), then its events.
+    """
+    totals = {}
+    for name, _, seconds in rec.timings:
+        totals[name] = totals.get(name, 0.0) + seconds
+    for name, seconds in totals.items():
+        STAGE_SECONDS.labels(name).observe(seconds)
+    for name, label in rec.events:
+        _EVENTS[name].labels(label).inc()
+
+
+def record_fields(result):
+    """Count found / "Not found" per slip field of an extraction result."""
+    for field in ("amount", "date", "ref"):
+        outcome = "not_found" if result.get(field, "Not found") == "Not found" else "found"
+        FIELDS.labels(field, outcome).inc()
+
+
+# ---------------------------------------------------------------------------
+# RPCs
+# ---------------------------------------------------------------------------
+
+def track_rpc(method):
+    """
+    Decorator for servicer methods (threaded or asyncio): in-flight gauge and
+    latency histogram, covering the whole response stream of streaming RPCs.
+    """
+    name = method.__name__
+    in_flight = RPCS_IN_FLIGHT.labels(name)
+    latency = RPC_SECONDS.labels(name)
+
+    if inspect.isasyncgenfunction(method):
+        @functools.wraps(method)
+        async def wrapper(*args, **kwargs):
+            in_flight.inc()
+            t0 = time.perf_counter()
+            try:
+                async for item in method(*args, **kwargs):
+                    yield item
+            finally:
+                in_flight.dec()
+                latency.observe(time.perf_counter() - t0)
+        return wrapper
+
+    if inspect.iscoroutinefunction(method):
+        @functools.wraps(method)
+        async def wrapper(*args, **kwargs):
+            in_flight.inc()
+            t0 = time.perf_counter()
+            try:
+                return await method(*args, **kwargs)
+            finally:
+                in_flight.dec()
+                latency.observe(time.perf_counter() - t0)
+        return wrapper
+
+    def finish(t0):
+        in_flight.dec()
+        latency.observe(time.perf_counter() - t0)
+
+    def stream(results, t0):
+        try:
+            yield from results
+        finally:
+            finish(t0)
+
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        in_flight.inc()
+        t0 = time.perf_counter()
+        try:
+            result = method(*args, **kwargs)
+        except BaseException:
+            finish(t0)
+            raise
+        if isinstance(result, types.GeneratorType):
+            # Streaming response: done when the generator is
+            return stream(result, t0)
+        finish(t0)
+        return result
+    return wrapper
+
+
+# ---------------------------------------------------------------------------
+# Scrape-time collectors and the HTTP endpoint
+# ---------------------------------------------------------------------------
+
+class _ServiceCollector:
+    """Reads executor / cache / webhook state when Prometheus scrapes."""
+
+    def __init__(self, ocr_executor=None, webhook_dispatcher=None):
+        self.ocr_executor = ocr_executor
+        self.webhook_dispatcher = webhook_dispatcher
+
+    def collect(self):
+        executor = self.ocr_executor
+        if executor is not None:
+            busy, capacity = executor.utilization()
+            yield GaugeMetricFamily("ocr_executor_busy", "Images being OCR'd right now", value=busy)
+            yield GaugeMetricFamily("ocr_executor_capacity", "Images that can be OCR'd at once",
+                                    value=capacity)
+            yield CounterMetricFamily("ocr_executor_restarts",
+                                      "OCR worker pools replaced after a worker process died",
+                                      value=getattr(executor, "restarts", 0))
+
+            # Lookups are counted as they happen (cache_* events)
+            yield GaugeMetricFamily("ocr_cache_entries", "Entries in the server's in-memory OCR cache",
+                                    value=executor.cache.stats()["entries"])
+
+        dispatcher = self.webhook_dispatcher
+        if dispatcher is not None:
+            stats = dispatcher.stats()
+            yield GaugeMetricFamily("webhook_queue_depth", "Webhook calls waiting in the outbox",
+                                    value=stats["queue_depth"])
+            yield GaugeMetricFamily("webhook_oldest_pending_seconds",
+                                    "Age of the oldest undelivered webhook call",
+                                    value=stats["oldest_pending_age"])
+            yield GaugeMetricFamily("webhook_last_delivery_lag_seconds",
+                                    "Enqueue-to-delivery time of the last delivered call",
+                                    value=stats["last_delivery_lag"])
+            yield CounterMetricFamily("webhook_delivered", "Webhook calls delivered",
+                                      value=stats["delivered"])
+            yield CounterMetricFamily("webhook_failed_attempts", "Failed webhook POSTs",
+                                      value=stats["failed_attempts"])
+            yield CounterMetricFamily("webhook_dead", "Webhook calls given up on",
+                                      value=stats["dead"])
+
+
+_server_started = False
+
+
+def start_metrics_server(ocr_executor=None, webhook_dispatcher=None, port=METRICS_PORT):
+    """Register the scrape-time collectors and serve /metrics on port (once per process)."""
+    global _server_started
+    if _server_started or port <= 0:
+        return
+    REGISTRY.register(_ServiceCollector(ocr_executor, webhook_dispatcher))
+    start_http_server(port)
+    _server_started = True
+    print(f"Metrics on :{port}/metrics")
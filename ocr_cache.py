@@ -0,0 +1,200 @@
+"""
+Content-addressed cache for OCR results.
+
+Users re-upload the same slip and client retries resubmit identical bytes, so
+results are cached under a hash of the image content plus the OCR config
+(lang, --oem, --psm, preprocessing version):
+
+  1. in-process LRU      bounded by OCR_CACHE_MAX_ENTRIES, entries expire
+                         after OCR_CACHE_TTL seconds
+  2. on-disk (optional)  one JSON file per key under OCR_CACHE_DIR; shared by
+                         the OCR worker processes and survives restarts
+
+Two kinds of key share the cache: bytes_key for the encoded upload, looked up
+by the server before it hands an image to a worker, and image_key for the
+decoded pixels, looked up where OCR runs (usually a worker process, whose LRU
+is its own).  A new upload misses both, so lookups are counted per key kind
+with metrics.event(): "cache_upload" and "cache_pixels".  In a worker the
+event lands in the image's metrics.Recording and is counted by the server.
+
+Configuration (environment):
+  OCR_CACHE_ENABLED      "0" disables caching            (default: 1)
+  OCR_CACHE_MAX_ENTRIES  LRU size                        (default: 1024)
+  OCR_CACHE_TTL          seconds an entry stays valid    (default: 86400)
+  OCR_CACHE_DIR          directory for the disk tier     (default: off)
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Optional
+
+from metrics import event
+
+
+OCR_CACHE_ENABLED = os.environ.get("OCR_CACHE_ENABLED", "1") != "0"
+OCR_CACHE_MAX_ENTRIES = int(os.environ.get("OCR_CACHE_MAX_ENTRIES", "1024"))
+OCR_CACHE_TTL = float(os.environ.get("OCR_CACHE_TTL", "86400"))
+OCR_CACHE_DIR = os.environ.get("OCR_CACHE_DIR", "")
+
+
+def image_key(img, config: str) -> str:
+    """Key for a decoded image (ndarray): hash of its pixels, shape and the OCR config."""
+    h = hashlib.blake2b(digest_size=20)
+    h.update(repr((img.shape, str(img.dtype))).encode())
+    h.update(img.data if img.flags["C_CONTIGUOUS"] else img.tobytes())
+    h.update(config.encode())
+    return "px-" + h.hexdigest()
+
+
+def bytes_key(image_data, config: str) -> str:
+    """Key for still-encoded upload bytes — lets identical retries skip decoding too."""
+    h = hashlib.blake2b(image_data, digest_size=20)
+    h.update(config.encode())
+    return "raw-" + h.hexdigest()
+
+
+# Key prefix -> metrics event of its lookups
+_TIER_EVENTS = {"raw-": "cache_upload", "px-": "cache_pixels"}
+
+
+def _tier(key: str) -> str:
+    return _TIER_EVENTS[key[:key.index("-") + 1]]
+
+
+class OCRCache:
+    def __init__(self, max_entries: int = OCR_CACHE_MAX_ENTRIES, ttl: float = OCR_CACHE_TTL,
+                 cache_dir: str = OCR_CACHE_DIR, enabled: bool = OCR_CACHE_ENABLED):
+        self.enabled = enabled and max_entries > 0
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.cache_dir = cache_dir
+
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (expires_at, result)
+        self._lock = threading.Lock()
+
+        # (tier event, "memory_hit" / "disk_hit" / "miss") -> lookups in this process
+        self._lookups = Counter()
+
+        if self.enabled and self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+    # -- public API ---------------------------------------------------------
+
+    def get(self, key: str) -> Optional[dict]:
+        if not self.enabled:
+            return None
+
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, result = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self._count(key, "memory_hit")
+                    return dict(result)
+                del self._entries[key]
+
+        result = self._disk_get(key, now)
+        with self._lock:
+            if result is None:
+                self._count(key, "miss")
+                return None
+            self._count(key, "disk_hit")
+            self._remember(key, result, now)
+        return dict(result)
+
+    def put(self, key: str, result: dict) -> None:
+        if not self.enabled:
+            return
+        now = time.time()
+        with self._lock:
+            self._remember(key, dict(result), now)
+        self._disk_put(key, result, now)
+
+    def stats(self) -> dict:
+        """Entries, and lookups of this process per key kind ("upload" / "pixels")."""
+        with self._lock:
+            stats = {"entries": len(self._entries)}
+            for tier in _TIER_EVENTS.values():
+                hits = self._lookups[tier, "memory_hit"]
+                disk_hits = self._lookups[tier, "disk_hit"]
+                misses = self._lookups[tier, "miss"]
+                lookups = hits + disk_hits + misses
+                stats[tier[len("cache_"):]] = {
+                    "hits": hits,
+                    "disk_hits": disk_hits,
+                    "misses": misses,
+                    "hit_rate": (hits + disk_hits) / lookups if lookups else 0.0,
+                }
+            return stats
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    # -- internals ----------------------------------------------------------
+
+    def _count(self, key: str, result: str) -> None:
+        tier = _tier(key)
+        self._lookups[tier, result] += 1
+        event(tier, result)
+
+    def _remember(self, key: str, result: dict, now: float) -> None:
+        self._entries[key] = (now + self.ttl, result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[-2:], key + ".json")
+
+    def _disk_get(self, key: str, now: float) -> Optional[dict]:
+        if not self.cache_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry.get("created", 0) + self.ttl <= now:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+            return None
+        return entry.get("result")
+
+    def _disk_put(self, key: str, result: dict, now: float) -> None:
+        if not self.cache_dir:
+            return
+        path = self._disk_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write-then-rename so concurrent workers never read a partial file
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"created": now, "result": result}, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"OCR cache write failed: {e}")
+
+
+_default_cache: Optional[OCRCache] = None
+_default_cache_lock = threading.Lock()
+
+
+def get_ocr_cache() -> OCRCache:
+    """Process-wide cache (each OCR worker process has its own LRU tier)."""
+    global _default_cache
+    if _default_cache is None:
+        with _default_cache_lock:
+            if _default_cache is None:
+                _default_cache = OCRCache()
+    return _default_cache
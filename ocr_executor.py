@@ -0,0 +1,246 @@
+"""
+CPU-bound execution tier for the OCR pipeline.
+
+gRPC handler threads only do I/O.  Decode → preprocess → Tesseract → field
+extraction run in a pool of worker processes so they don't serialize on the
+GIL.  Image bytes are copied once into a multiprocessing.shared_memory block
+and the worker attaches to it by name — no pickled `bytes` over the pipe.
+
+Each worker process owns a single-engine OCRPool, so the tha+eng models are
+loaded once per process and reused for every image it handles.
+
+A worker that dies (OOM kill, a tesseract segfault) breaks the whole
+ProcessPoolExecutor.  The broken pool is replaced with a fresh one and the
+images that were in flight are retried once; an image that takes the new
+worker down as well fails with BrokenProcessPool.
+
+Configuration (environment):
+  OCR_PROCESS_WORKERS  worker processes (default: available CPUs, see
+                       cpu_budget; 0 runs in-process on the shared OCR pool
+                       instead)
+"""
+
+import multiprocessing
+import os
+import threading
+from concurrent import futures
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+from typing import Optional
+
+import metrics
+import tracing
+from cpu_budget import available_cpus
+from main import decode_image_bytes, extract_info_from_image, ocr_cache_config, process_image_bytes
+from ocr_cache import OCRCache, bytes_key, get_ocr_cache
+from ocr_pool import OCRPool, get_ocr_pool
+
+
+OCR_PROCESS_WORKERS = int(os.environ.get("OCR_PROCESS_WORKERS", available_cpus()))
+
+
+# ---------------------------------------------------------------------------
+# Worker process side
+# ---------------------------------------------------------------------------
+
+_worker_pool: Optional[OCRPool] = None
+
+
+def _worker_init() -> None:
+    global _worker_pool
+    _worker_pool = OCRPool(size=1)
+    _worker_pool.warm_up()
+
+
+def _worker_ping() -> int:
+    return os.getpid()
+
+
+def _process_shared(shm_name: str, size: int):
+    """(extract_info_from_image result or None, metrics.Recording of its stages)."""
+    with metrics.recording() as rec:
+        shm = shared_memory.SharedMemory(name=shm_name)
+        try:
+            # imdecode copies the (grayscale) pixels out, so the block can be detached before OCR
+            img = decode_image_bytes(shm.buf[:size])
+        finally:
+            shm.close()
+        if img is None:
+            return None, rec
+        try:
+            return extract_info_from_image(img, _worker_pool, in_place=True), rec
+        except Exception as e:
+            # pytesseract errors don't all survive unpickling in the parent, and a
+            # failed unpickle marks the whole pool as broken
+            raise RuntimeError(str(e)) from None
+
+
+# ---------------------------------------------------------------------------
+# Server side
+# ---------------------------------------------------------------------------
+
+def _release(shm: shared_memory.SharedMemory) -> None:
+    shm.close()
+    shm.unlink()
+
+
+class OCRExecutor:
+    def __init__(self, workers: int = OCR_PROCESS_WORKERS, ocr_pool: Optional[OCRPool] = None,
+                 cache: Optional[OCRCache] = None):
+        self.workers = max(0, int(workers))
+        self.ocr_pool = ocr_pool or get_ocr_pool()
+        # Front tier keyed on the encoded upload: identical resubmits never
+        # reach a worker. Re-encoded duplicates still hit the pixel-keyed
+        # cache inside extract_info_from_image.
+        self.cache = cache or get_ocr_cache()
+        self._pool: Optional[futures.ProcessPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+        self.restarts = 0
+        self._busy = 0
+        self._busy_lock = threading.Lock()
+        if self.workers:
+            self._pool = self._new_pool()
+
+    def _new_pool(self) -> futures.ProcessPoolExecutor:
+        # spawn: never fork a process that already has gRPC threads running
+        return futures.ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_worker_init,
+        )
+
+    def _replace_pool(self, broken: futures.ProcessPoolExecutor) -> futures.ProcessPoolExecutor:
+        """Swap a pool broken by a dead worker for a fresh one (once, however many callers notice)."""
+        with self._pool_lock:
+            if self._pool is broken:
+                print("OCR worker process died; restarting the worker pool")
+                broken.shutdown(wait=False, cancel_futures=True)
+                self._pool = self._new_pool()
+                self.restarts += 1
+            return self._pool
+
+    @property
+    def mode(self) -> str:
+        return f"{self.workers} process(es)" if self._pool else "in-process"
+
+    def utilization(self) -> tuple:
+        """(images being OCR'd, how many can be at once)."""
+        if self._pool is None:
+            return self.ocr_pool.busy(), self.ocr_pool.size
+        return self._busy, self.workers
+
+    def submit(self, image_data) -> futures.Future:
+        """
+        Run the OCR pipeline on encoded image bytes.
+
+        The future resolves to the extract_info_from_image dict, or None when
+        the bytes can't be decoded as an image.
+        """
+        cache_key = bytes_key(image_data, ocr_cache_config(self.ocr_pool))
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            tracing.current_span_attribute("ocr.cache", "hit")
+            fut: futures.Future = futures.Future()
+            fut.set_result(cached)
+            return fut
+
+        if self._pool is None:
+            fut = futures.Future()
+            try:
+                with metrics.recording() as rec:
+                    result = process_image_bytes(image_data, self.ocr_pool)
+                metrics.observe(rec)
+                tracing.replay(rec, tracing.current_context())
+            except Exception as e:
+                fut.set_exception(e)
+                return fut
+            if result is not None:
+                self.cache.put(cache_key, result)
+            fut.set_result(result)
+            return fut
+
+        fut = futures.Future()
+        # The callbacks run on the pool's management thread: pass the trace parent along
+        self._submit_worker(image_data, cache_key, fut, tracing.current_context(), retry=True)
+        return fut
+
+    def _submit_worker(self, image_data, cache_key: str, fut: futures.Future, parent,
+                       retry: bool) -> None:
+        """Hand image_data to a worker through shared memory; fut gets the outcome."""
+        size = len(image_data)
+        shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        try:
+            shm.buf[:size] = image_data
+            pool = self._pool
+            try:
+                worker_fut = pool.submit(_process_shared, shm.name, size)
+            except BrokenProcessPool:
+                pool = self._replace_pool(pool)
+                worker_fut = pool.submit(_process_shared, shm.name, size)
+        except Exception:
+            _release(shm)
+            raise
+        with self._busy_lock:
+            self._busy += 1
+        worker_fut.add_done_callback(lambda _: _release(shm))
+        worker_fut.add_done_callback(
+            lambda f: self._finish(cache_key, f, fut, parent, image_data if retry else None, pool))
+
+    def _finish(self, cache_key: str, worker_fut: futures.Future, fut: futures.Future,
+                parent, retry_data=None, pool=None) -> None:
+        """Replay the worker's stage metrics and spans, cache its result and hand it to fut."""
+        with self._busy_lock:
+            self._busy -= 1
+        try:
+            result, rec = worker_fut.result()
+        except BrokenProcessPool as e:
+            # A worker died mid-flight (maybe another image's); retry once on a fresh pool
+            if retry_data is not None:
+                self._replace_pool(pool)
+                try:
+                    self._submit_worker(retry_data, cache_key, fut, parent, retry=False)
+                    return
+                except Exception as resubmit_error:
+                    e = resubmit_error
+            if fut.set_running_or_notify_cancel():
+                fut.set_exception(e)
+            return
+        except BaseException as e:
+            if fut.set_running_or_notify_cancel():
+                fut.set_exception(e)
+            return
+        metrics.observe(rec)
+        tracing.replay(rec, parent)
+        if result is not None:
+            self.cache.put(cache_key, result)
+        if fut.set_running_or_notify_cancel():
+            fut.set_result(result)
+
+    def run(self, image_data):
+        return self.submit(image_data).result()
+
+    def warm_up(self) -> None:
+        """Start every worker process and load its engine before serving traffic."""
+        if self._pool is None:
+            self.ocr_pool.warm_up()
+            return
+        pings = [self._pool.submit(_worker_ping) for _ in range(self.workers)]
+        futures.wait(pings)
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+
+
+_default_executor: Optional[OCRExecutor] = None
+_default_executor_lock = threading.Lock()
+
+
+def get_ocr_executor() -> OCRExecutor:
+    """Process-wide executor shared by every OCRService handler."""
+    global _default_executor
+    if _default_executor is None:
+        with _default_executor_lock:
+            if _default_executor is None:
+                _default_executor = OCRExecutor()
+    return _default_executor
@@ -24,7 +24,7 @@ _sym_db = _symbol_database.Default()
 
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\tocr.proto\x12\x03ocr\"_\n\x0cImageRequest\x12\x12\n\nimage_data\x18\x01 \x01(\x0c\x12\x10\n\x08\x66ilename\x18\x02 \x01(\t\x12\x10\n\x08username\x18\x03 \x01(\t\x12\x17\n\x0ftype_of_expense\x18\x04 \x01(\t\"8\n\x11\x42\x61tchImageRequest\x12#\n\x08requests\x18\x01 \x03(\x0b\x32\x11.ocr.ImageRequest\"R\n\x11MultiImageRequest\x12\x12\n\nimage_data\x18\x01 \x03(\x0c\x12\x10\n\x08username\x18\x02 \x01(\t\x12\x17\n\x0ftype_of_expense\x18\x03 \x01(\t\"o\n\tOCRResult\x12\x0e\n\x06\x61mount\x18\x01 \x01(\t\x12\x0c\n\x04\x64\x61te\x18\x02 \x01(\t\x12\x0b\n\x03ref\x18\x03 \x01(\t\x12\x10\n\x08raw_text\x18\x04 \x01(\t\x12\r\n\x05\x65rror\x18\x05 \x01(\t\x12\x16\n\x0ewebhook_result\x18\x06 \x01(\t\"1\n\x0e\x42\x61tchOCRResult\x12\x1f\n\x07results\x18\x01 \x03(\x0b\x32\x0e.ocr.OCRResult\"9\n\x13PDFStatementRequest\x12\x10\n\x08pdf_data\x18\x01 \x01(\x0c\x12\x10\n\x08username\x18\x02 \x01(\t\"\x9a\x01\n\x14StatementTransaction\x12\x10\n\x08\x64\x61tetime\x18\x01 \x01(\t\x12\x18\n\x10transaction_type\x18\x02 \x01(\t\x12\x12\n\nwithdrawal\x18\x03 \x01(\t\x12\x0f\n\x07\x64\x65posit\x18\x04 \x01(\t\x12\x0f\n\x07\x62\x61lance\x18\x05 \x01(\t\x12\x0f\n\x07\x63hannel\x18\x06 \x01(\t\x12\x0f\n\x07\x64\x65tails\x18\x07 \x01(\t\"\xea\x01\n\x0fStatementResult\x12\x14\n\x0c\x61\x63\x63ount_name\x18\x01 \x01(\t\x12\x16\n\x0e\x61\x63\x63ount_number\x18\x02 \x01(\t\x12\x0e\n\x06\x62ranch\x18\x03 \x01(\t\x12\x14\n\x0cperiod_start\x18\x04 \x01(\t\x12\x12\n\nperiod_end\x18\x05 \x01(\t\x12/\n\x0ctransactions\x18\x06 \x03(\x0b\x32\x19.ocr.StatementTransaction\x12\x18\n\x10withdrawal_total\x18\x07 \x01(\t\x12\x15\n\rdeposit_total\x18\x08 \x01(\t\x12\r\n\x05\x65rror\x18\t \x01(\t2\x86\x02\n\nOCRService\x12\x33\n\x0cProcessImage\x12\x11.ocr.ImageRequest\x1a\x0e.ocr.OCRResult\"\x00\x12=\n\x0cProcessBatch\x12\x16.ocr.BatchImageRequest\x1a\x13.ocr.BatchOCRResult\"\x00\x12>\n\rProcessImages\x12\x16.ocr.MultiImageRequest\x1a\x13.ocr.BatchOCRResult\"\x00\x12\x44\n\x10ProcessStatement\x12\x18.ocr.PDFStatementRequest\x1a\x14.ocr.StatementResult\"\x00\x62\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\tocr.proto\x12\x03ocr\"w\n\x0cImageRequest\x12\x12\n\nimage_data\x18\x01 \x01(\x0c\x12\x10\n\x08\x66ilename\x18\x02 \x01(\t\x12\x10\n\x08username\x18\x03 \x01(\t\x12\x17\n\x0ftype_of_expense\x18\x04 \x01(\t\x12\x16\n\x0e\x63orrelation_id\x18\x05 \x01(\t\"8\n\x11\x42\x61tchImageRequest\x12#\n\x08requests\x18\x01 \x03(\x0b\x32\x11.ocr.ImageRequest\"R\n\x11MultiImageRequest\x12\x12\n\nimage_data\x18\x01 \x03(\x0c\x12\x10\n\x08username\x18\x02 \x01(\t\x12\x17\n\x0ftype_of_expense\x18\x03 \x01(\t\"\xe5\x01\n\tOCRResult\x12\x0e\n\x06\x61mount\x18\x01 \x01(\t\x12\x0c\n\x04\x64\x61te\x18\x02 \x01(\t\x12\x0b\n\x03ref\x18\x03 \x01(\t\x12\x10\n\x08raw_text\x18\x04 \x01(\t\x12\r\n\x05\x65rror\x18\x05 \x01(\t\x12\x16\n\x0ewebhook_result\x18\x06 \x01(\t\x12\x16\n\x0e\x63orrelation_id\x18\x07 \x01(\t\x12\x19\n\x11\x61mount_confidence\x18\x08 \x01(\x02\x12\x17\n\x0f\x64\x61te_confidence\x18\t \x01(\x02\x12\x16\n\x0eref_confidence\x18\n \x01(\x02\x12\x10\n\x08\x64\x61te_iso\x18\x0b \x01(\t\"1\n\x0e\x42\x61tchOCRResult\x12\x1f\n\x07results\x18\x01 \x03(\x0b\x32\x0e.ocr.OCRResult\"9\n\x13PDFStatementRequest\x12\x10\n\x08pdf_data\x18\x01 \x01(\x0c\x12\x10\n\x08username\x18\x02 \x01(\t\"\x9a\x01\n\x14StatementTransaction\x12\x10\n\x08\x64\x61tetime\x18\x01 \x01(\t\x12\x18\n\x10transaction_type\x18\x02 \x01(\t\x12\x12\n\nwithdrawal\x18\x03 \x01(\t\x12\x0f\n\x07\x64\x65posit\x18\x04 \x01(\t\x12\x0f\n\x07\x62\x61lance\x18\x05 \x01(\t\x12\x0f\n\x07\x63hannel\x18\x06 \x01(\t\x12\x0f\n\x07\x64\x65tails\x18\x07 \x01(\t\"\xea\x01\n\x0fStatementResult\x12\x14\n\x0c\x61\x63\x63ount_name\x18\x01 \x01(\t\x12\x16\n\x0e\x61\x63\x63ount_number\x18\x02 \x01(\t\x12\x0e\n\x06\x62ranch\x18\x03 \x01(\t\x12\x14\n\x0cperiod_start\x18\x04 \x01(\t\x12\x12\n\nperiod_end\x18\x05 \x01(\t\x12/\n\x0ctransactions\x18\x06 \x03(\x0b\x32\x19.ocr.StatementTransaction\x12\x18\n\x10withdrawal_total\x18\x07 \x01(\t\x12\x15\n\rdeposit_total\x18\x08 \x01(\t\x12\r\n\x05\x65rror\x18\t \x01(\t2\x87\x03\n\nOCRService\x12\x33\n\x0cProcessImage\x12\x11.ocr.ImageRequest\x1a\x0e.ocr.OCRResult\"\x00\x12=\n\x0cProcessBatch\x12\x16.ocr.BatchImageRequest\x1a\x13.ocr.BatchOCRResult\"\x00\x12>\n\rProcessImages\x12\x16.ocr.MultiImageRequest\x1a\x13.ocr.BatchOCRResult\"\x00\x12\x44\n\x10ProcessStatement\x12\x18.ocr.PDFStatementRequest\x1a\x14.ocr.StatementResult\"\x00\x12=\n\x12ProcessImageStream\x12\x11.ocr.ImageRequest\x1a\x0e.ocr.OCRResult\"\x00(\x01\x30\x01\x12@\n\x12ProcessBatchStream\x12\x16.ocr.BatchImageRequest\x1a\x0e.ocr.OCRResult\"\x00\x30\x01\x62\x06proto3')
 
 _globals = globals()
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
@@ -32,21 +32,21 @@ _builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'ocr_pb2', _globals)
 if not _descriptor._USE_C_DESCRIPTORS:
   DESCRIPTOR._loaded_options = None
   _globals['_IMAGEREQUEST']._serialized_start=18
-  _globals['_IMAGEREQUEST']._serialized_end=113
-  _globals['_BATCHIMAGEREQUEST']._serialized_start=115
-  _globals['_BATCHIMAGEREQUEST']._serialized_end=171
-  _globals['_MULTIIMAGEREQUEST']._serialized_start=173
-  _globals['_MULTIIMAGEREQUEST']._serialized_end=255
-  _globals['_OCRRESULT']._serialized_start=257
-  _globals['_OCRRESULT']._serialized_end=368
-  _globals['_BATCHOCRRESULT']._serialized_start=370
-  _globals['_BATCHOCRRESULT']._serialized_end=419
-  _globals['_PDFSTATEMENTREQUEST']._serialized_start=421
-  _globals['_PDFSTATEMENTREQUEST']._serialized_end=478
-  _globals['_STATEMENTTRANSACTION']._serialized_start=481
-  _globals['_STATEMENTTRANSACTION']._serialized_end=635
-  _globals['_STATEMENTRESULT']._serialized_start=638
-  _globals['_STATEMENTRESULT']._serialized_end=872
-  _globals['_OCRSERVICE']._serialized_start=875
-  _globals['_OCRSERVICE']._serialized_end=1137
+  _globals['_IMAGEREQUEST']._serialized_end=137
+  _globals['_BATCHIMAGEREQUEST']._serialized_start=139
+  _globals['_BATCHIMAGEREQUEST']._serialized_end=195
+  _globals['_MULTIIMAGEREQUEST']._serialized_start=197
+  _globals['_MULTIIMAGEREQUEST']._serialized_end=279
+  _globals['_OCRRESULT']._serialized_start=282
+  _globals['_OCRRESULT']._serialized_end=511
+  _globals['_BATCHOCRRESULT']._serialized_start=513
+  _globals['_BATCHOCRRESULT']._serialized_end=562
+  _globals['_PDFSTATEMENTREQUEST']._serialized_start=564
+  _globals['_PDFSTATEMENTREQUEST']._serialized_end=621
+  _globals['_STATEMENTTRANSACTION']._serialized_start=624
+  _globals['_STATEMENTTRANSACTION']._serialized_end=778
+  _globals['_STATEMENTRESULT']._serialized_start=781
+  _globals['_STATEMENTRESULT']._serialized_end=1015
+  _globals['_OCRSERVICE']._serialized_start=1018
+  _globals['_OCRSERVICE']._serialized_end=1409
 # @@protoc_insertion_point(module_scope)
@@ -54,6 +54,16 @@ class OCRServiceStub(object):
                 request_serializer=ocr__pb2.PDFStatementRequest.SerializeToString,
                 response_deserializer=ocr__pb2.StatementResult.FromString,
                 _registered_method=True)
+        self.ProcessImageStream = channel.stream_stream(
+                '/ocr.OCRService/ProcessImageStream',
+                request_serializer=ocr__pb2.ImageRequest.SerializeToString,
+                response_deserializer=ocr__pb2.OCRResult.FromString,
+                _registered_method=True)
+        self.ProcessBatchStream = channel.unary_stream(
+                '/ocr.OCRService/ProcessBatchStream',
+                request_serializer=ocr__pb2.BatchImageRequest.SerializeToString,
+                response_deserializer=ocr__pb2.OCRResult.FromString,
+                _registered_method=True)
 
 
 class OCRServiceServicer(object):
@@ -87,6 +97,21 @@ class OCRServiceServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def ProcessImageStream(self, request_iterator, context):
+        """Stream images in, get each result back as soon as it is ready.
+        Results arrive in completion order; match them with correlation_id.
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def ProcessBatchStream(self, request, context):
+        """Same as ProcessBatch, but results are streamed back as they complete
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
 
 def add_OCRServiceServicer_to_server(servicer, server):
     rpc_method_handlers = {
@@ -110,6 +135,16 @@ def add_OCRServiceServicer_to_server(servicer, server):
                     request_deserializer=ocr__pb2.PDFStatementRequest.FromString,
                     response_serializer=ocr__pb2.StatementResult.SerializeToString,
             ),
+            'ProcessImageStream': grpc.stream_stream_rpc_method_handler(
+                    servicer.ProcessImageStream,
+                    request_deserializer=ocr__pb2.ImageRequest.FromString,
+                    response_serializer=ocr__pb2.OCRResult.SerializeToString,
+            ),
+            'ProcessBatchStream': grpc.unary_stream_rpc_method_handler(
+                    servicer.ProcessBatchStream,
+                    request_deserializer=ocr__pb2.BatchImageRequest.FromString,
+                    response_serializer=ocr__pb2.OCRResult.SerializeToString,
+            ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
             'ocr.OCRService', rpc_method_handlers)
@@ -228,3 +263,57 @@ class OCRService(object):
             timeout,
             metadata,
             _registered_method=True)
+
+    @staticmethod
+    def ProcessImageStream(request_iterator,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.stream_stream(
+            request_iterator,
+            target,
+            '/ocr.OCRService/ProcessImageStream',
+            ocr__pb2.ImageRequest.SerializeToString,
+            ocr__pb2.OCRResult.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def ProcessBatchStream(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_stream(
+            request,
+            target,
+            '/ocr.OCRService/ProcessBatchStream',
+            ocr__pb2.BatchImageRequest.SerializeToString,
+            ocr__pb2.OCRResult.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
@@ -0,0 +1,343 @@
+"""
+Pool of long-lived Tesseract engines.
+
+pytesseract forks a fresh `tesseract` process for every image and reloads the
+tha+eng LSTM models each time.  OCRPool keeps up to OCR_POOL_SIZE engines alive
+and hands them out one caller at a time:
+
+  - tesserocr installed  →  in-process PyTessBaseAPI per engine (C-API, models
+                            loaded once, GIL released while recognising)
+  - otherwise            →  pytesseract fallback, still capped at pool size
+
+Configuration (environment):
+  OCR_POOL_SIZE    number of engines (default: available CPUs, see cpu_budget)
+  OCR_LANG         Tesseract languages       (default: tha+eng)
+  OCR_OEM          OCR engine mode           (default: 1, LSTM only)
+  OCR_PSM          page segmentation mode    (default: 11, sparse text)
+  TESSDATA_PREFIX  tessdata directory used by tesserocr
+"""
+
+import os
+import queue
+import threading
+from contextlib import contextmanager
+from typing import Optional
+
+import cv2
+import numpy as np
+import pytesseract
+from PIL import Image
+
+try:
+    import tesserocr
+except ImportError:
+    tesserocr = None
+
+from cpu_budget import available_cpus
+from metrics import stage
+
+
+OCR_POOL_SIZE = int(os.environ.get("OCR_POOL_SIZE", available_cpus()))
+OCR_LANG = os.environ.get("OCR_LANG", "tha+eng")
+OCR_OEM = int(os.environ.get("OCR_OEM", "1"))
+OCR_PSM = int(os.environ.get("OCR_PSM", "11"))
+
+# Where distro packages put traineddata when TESSDATA_PREFIX is not set
+_TESSDATA_CANDIDATES = (
+    "/usr/share/tesseract-ocr/5/tessdata",
+    "/usr/share/tesseract-ocr/4.00/tessdata",
+    "/usr/share/tessdata",
+    "/usr/local/share/tessdata",
+    r"C:\Program Files\Tesseract-OCR\tessdata",
+)
+
+
+def _join_words(rows) -> tuple:
+    """
+    (line_key, word, conf 0-100) rows in reading order → (text, spans): words
+    joined by spaces, lines by newlines; spans are (start, end, conf 0.0-1.0)
+    character ranges of each word in text.
+    """
+    parts = []
+    spans = []
+    pos = 0
+    prev_line = None
+    for line, word, conf in rows:
+        if prev_line is not None:
+            sep = " " if line == prev_line else "\n"
+            parts.append(sep)
+            pos += 1
+        prev_line = line
+        parts.append(word)
+        spans.append((pos, pos + len(word), max(0.0, float(conf)) / 100))
+        pos += len(word)
+    return "".join(parts), spans
+
+
+def _tessdata_path() -> str:
+    prefix = os.environ.get("TESSDATA_PREFIX", "")
+    if prefix:
+        return prefix
+    for candidate in _TESSDATA_CANDIDATES:
+        if os.path.isdir(candidate):
+            return candidate
+    return ""
+
+
+# ---------------------------------------------------------------------------
+# Engines
+# ---------------------------------------------------------------------------
+
+class _TesserocrEngine:
+    """One PyTessBaseAPI with its models loaded for the lifetime of the pool."""
+
+    def __init__(self, lang: str, oem: int, psm: int):
+        kwargs = {"lang": lang, "oem": oem, "psm": psm}
+        path = _tessdata_path()
+        if path:
+            kwargs["path"] = path
+        self.psm = psm
+        self.api = tesserocr.PyTessBaseAPI(**kwargs)
+
+    def _set_image(self, img) -> None:
+        # Raw pixels, no encode round-trip; grayscale needs no conversion at all
+        if img.ndim == 3:
+            img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+        height, width = img.shape[:2]
+        channels = 1 if img.ndim == 2 else img.shape[2]
+        self.api.SetImageBytes(img.tobytes(), width, height, channels, width * channels)
+
+    @contextmanager
+    def _options(self, psm: Optional[int], whitelist: Optional[str]):
+        if psm is not None:
+            self.api.SetPageSegMode(psm)
+        if whitelist:
+            self.api.SetVariable("tessedit_char_whitelist", whitelist)
+        try:
+            yield
+        finally:
+            if psm is not None:
+                self.api.SetPageSegMode(self.psm)
+            if whitelist:
+                self.api.SetVariable("tessedit_char_whitelist", "")
+
+    def image_to_string(self, img, psm: Optional[int] = None, whitelist: Optional[str] = None) -> str:
+        with self._options(psm, whitelist):
+            self._set_image(img)
+            return self.api.GetUTF8Text()
+
+    def read_regions(self, img, boxes, psm: Optional[int] = None,
+                     whitelist: Optional[str] = None) -> list[str]:
+        # Image is set once; each region only re-runs recognition inside its rectangle
+        with self._options(psm, whitelist):
+            self._set_image(img)
+            texts = []
+            for x, y, w, h in boxes:
+                self.api.SetRectangle(x, y, w, h)
+                texts.append(self.api.GetUTF8Text())
+            return texts
+
+    def _words(self) -> tuple:
+        self.api.Recognize()
+        iterator = self.api.GetIterator()
+        rows = []
+        if iterator is None:
+            return _join_words(rows)
+        word_level = tesserocr.RIL.WORD
+        line = 0
+        for word in tesserocr.iterate_level(iterator, word_level):
+            if word.IsAtBeginningOf(tesserocr.RIL.TEXTLINE):
+                line += 1
+            text = word.GetUTF8Text(word_level)
+            if text:
+                rows.append((line, text, word.Confidence(word_level)))
+        return _join_words(rows)
+
+    def image_to_data(self, img, psm: Optional[int] = None, whitelist: Optional[str] = None) -> tuple:
+        with self._options(psm, whitelist):
+            self._set_image(img)
+            return self._words()
+
+    def read_regions_data(self, img, boxes, psm: Optional[int] = None,
+                          whitelist: Optional[str] = None) -> list:
+        with self._options(psm, whitelist):
+            self._set_image(img)
+            results = []
+            for x, y, w, h in boxes:
+                self.api.SetRectangle(x, y, w, h)
+                results.append(self._words())
+            return results
+
+    def close(self) -> None:
+        self.api.End()
+
+
+class _SubprocessEngine:
+    """Fallback when tesserocr is not installed: one tesseract process per call."""
+
+    def __init__(self, lang: str, oem: int, psm: int):
+        self.lang = lang
+        self.oem = oem
+        self.psm = psm
+
+    def _config(self, psm: Optional[int], whitelist: Optional[str]) -> str:
+        config = f"--oem {self.oem} --psm {self.psm if psm is None else psm}"
+        if whitelist:
+            config += f" -c tessedit_char_whitelist={whitelist}"
+        return config
+
+    @staticmethod
+    def _to_pil(img) -> Image.Image:
+        # pytesseract writes its input to a temp file, as PNG unless told
+        # otherwise; PNM is written raw, roughly 30x faster than PNG's zlib
+        if img.ndim == 3:
+            img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+        image = Image.fromarray(np.ascontiguousarray(img))
+        image.format = "PPM"
+        return image
+
+    def image_to_string(self, img, psm: Optional[int] = None, whitelist: Optional[str] = None) -> str:
+        return pytesseract.image_to_string(self._to_pil(img), lang=self.lang,
+                                           config=self._config(psm, whitelist))
+
+    def read_regions(self, img, boxes, psm: Optional[int] = None,
+                     whitelist: Optional[str] = None) -> list[str]:
+        config = self._config(psm, whitelist)
+        return [
+            pytesseract.image_to_string(self._to_pil(img[y:y + h, x:x + w]), lang=self.lang, config=config)
+            for x, y, w, h in boxes
+        ]
+
+    def image_to_data(self, img, psm: Optional[int] = None, whitelist: Optional[str] = None) -> tuple:
+        data = pytesseract.image_to_data(self._to_pil(img), lang=self.lang,
+                                         config=self._config(psm, whitelist),
+                                         output_type=pytesseract.Output.DICT)
+        rows = [
+            ((data["block_num"][i], data["par_num"][i], data["line_num"][i]), word, data["conf"][i])
+            for i, word in enumerate(data["text"])
+            if data["level"][i] == 5 and word.strip()
+        ]
+        return _join_words(rows)
+
+    def read_regions_data(self, img, boxes, psm: Optional[int] = None,
+                          whitelist: Optional[str] = None) -> list:
+        return [self.image_to_data(img[y:y + h, x:x + w], psm, whitelist) for x, y, w, h in boxes]
+
+    def close(self) -> None:
+        pass
+
+
+# ---------------------------------------------------------------------------
+# Pool
+# ---------------------------------------------------------------------------
+
+class OCRPool:
+    def __init__(self, size: int = OCR_POOL_SIZE, lang: str = OCR_LANG,
+                 oem: int = OCR_OEM, psm: int = OCR_PSM):
+        self.size = max(1, int(size))
+        self.lang = lang
+        self.oem = oem
+        self.psm = psm
+        self.backend = "tesserocr" if tesserocr is not None else "pytesseract"
+
+        # LIFO so the most recently used (hot) engine is handed out first
+        self._idle: "queue.LifoQueue" = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _new_engine(self):
+        if tesserocr is not None:
+            return _TesserocrEngine(self.lang, self.oem, self.psm)
+        return _SubprocessEngine(self.lang, self.oem, self.psm)
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            can_create = self._created < self.size
+            if can_create:
+                self._created += 1
+
+        if not can_create:
+            # Every engine is busy — wait for one to come back
+            return self._idle.get()
+
+        try:
+            return self._new_engine()
+        except Exception:
+            with self._lock:
+                self._created -= 1
+            raise
+
+    @contextmanager
+    def engine(self):
+        eng = self._acquire()
+        try:
+            yield eng
+        finally:
+            self._idle.put(eng)
+
+    def image_to_string(self, img, psm: Optional[int] = None, whitelist: Optional[str] = None) -> str:
+        """OCR a whole image; psm / whitelist override the pool defaults for this call."""
+        with self.engine() as eng, stage("ocr"):
+            return eng.image_to_string(img, psm, whitelist)
+
+    def read_regions(self, img, boxes, psm: Optional[int] = None,
+                     whitelist: Optional[str] = None) -> list[str]:
+        """OCR each (x, y, w, h) box of img; one text per box."""
+        if not boxes:
+            return []
+        with self.engine() as eng, stage("ocr"):
+            return eng.read_regions(img, boxes, psm, whitelist)
+
+    def image_to_data(self, img, psm: Optional[int] = None, whitelist: Optional[str] = None) -> tuple:
+        """
+        OCR a whole image with word confidences: (text, spans), where spans
+        are (start, end, conf) per word in text and conf is 0.0 – 1.0.
+        """
+        with self.engine() as eng, stage("ocr"):
+            return eng.image_to_data(img, psm, whitelist)
+
+    def read_regions_data(self, img, boxes, psm: Optional[int] = None,
+                          whitelist: Optional[str] = None) -> list:
+        """image_to_data for each (x, y, w, h) box of img."""
+        if not boxes:
+            return []
+        with self.engine() as eng, stage("ocr"):
+            return eng.read_regions_data(img, boxes, psm, whitelist)
+
+    def busy(self) -> int:
+        """Engines currently checked out."""
+        return max(0, self._created - self._idle.qsize())
+
+    def warm_up(self) -> None:
+        """Load every engine up front so the first requests don't pay model loading."""
+        engines = [self._acquire() for _ in range(self.size)]
+        for eng in engines:
+            self._idle.put(eng)
+
+    def close(self) -> None:
+        with self._lock:
+            while True:
+                try:
+                    self._idle.get_nowait().close()
+                except queue.Empty:
+                    break
+            self._created = 0
+
+
+_default_pool: Optional[OCRPool] = None
+_default_pool_lock = threading.Lock()
+
+
+def get_ocr_pool() -> OCRPool:
+    """Process-wide pool shared by the Flask app and the gRPC service."""
+    global _default_pool
+    if _default_pool is None:
+        with _default_pool_lock:
+            if _default_pool is None:
+                _default_pool = OCRPool()
+    return _default_pool
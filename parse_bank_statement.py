@@ -14,10 +14,22 @@ Deposit vs Withdrawal is determined by transaction type:
   - otherwise            →  withdrawal (ถอน)
 """
 
+import io
+import multiprocessing
+import os
 import re
+import threading
 import pdfplumber
+from collections import deque
+from concurrent import futures
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
 from dataclasses import dataclass, field
-from typing import Optional
+from multiprocessing import shared_memory
+from typing import Iterator, Optional, Union
+
+from cpu_budget import available_cpus
+from extractor import parse_numeric_datetime
 
 
 # ---------------------------------------------------------------------------
@@ -34,6 +46,11 @@ class Transaction:
     channel: str            # "MOBILE" | "ATM" | "OTHERS"
     details: str            # รายละเอียด + continuation lines joined by \n
 
+    @property
+    def datetime_iso(self) -> str:
+        """The datetime column as ISO 8601, e.g. "2026-03-14T08:46:11" ("" if it didn't parse)."""
+        return parse_numeric_datetime(self.datetime)
+
 
 @dataclass
 class StatementSummary:
@@ -141,18 +158,234 @@ def _parse_summary(text: str) -> Optional[StatementSummary]:
     return None
 
 
+# ---------------------------------------------------------------------------
+# Page text extraction
+# ---------------------------------------------------------------------------
+
+# Worker processes used to extract page text (1 = serial, in-process). The
+# OCR worker processes already size themselves to the pod's CPUs; statement
+# pages get half of them, so an import slows slip OCR instead of swamping it
+STATEMENT_PARSE_WORKERS = int(os.environ.get("STATEMENT_PARSE_WORKERS",
+                                             max(1, available_cpus() // 2)))
+
+# Pages each worker task extracts (one pdfplumber.open per task)
+_PAGES_PER_TASK = 4
+
+# The summary block sits on the last page; keep one more in case it wraps
+_SUMMARY_PAGES = 2
+
+_page_pools: dict = {}
+_page_pools_lock = threading.Lock()
+
+# A PDF given as a path, or in memory as bytes / bytearray / memoryview / BytesIO
+PDFSource = Union[str, os.PathLike, bytes, bytearray, memoryview, io.BytesIO]
+
+
+class _MemoryViewReader(io.RawIOBase):
+    """Read-only, seekable file over a buffer — lets pdfplumber parse it without a copy."""
+
+    def __init__(self, buf):
+        super().__init__()
+        self._view = memoryview(buf).cast("B")
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            self._pos = offset
+        elif whence == io.SEEK_CUR:
+            self._pos += offset
+        else:
+            self._pos = len(self._view) + offset
+        self._pos = max(0, self._pos)
+        return self._pos
+
+    def read(self, size: int = -1) -> bytes:
+        end = len(self._view) if size is None or size < 0 else min(len(self._view), self._pos + size)
+        data = self._view[self._pos:end].tobytes()
+        self._pos = max(self._pos, end)
+        return data
+
+    def readinto(self, b) -> int:
+        data = self.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+    def close(self) -> None:
+        if not self.closed:
+            self._view.release()
+        super().close()
+
+
+@contextmanager
+def _open_pdf(source: PDFSource, pages: Optional[list[int]] = None):
+    if isinstance(source, (str, os.PathLike)):
+        with pdfplumber.open(source, pages=pages) as pdf:
+            yield pdf
+    elif isinstance(source, (bytearray, memoryview)):
+        with _MemoryViewReader(source) as fp, pdfplumber.open(fp, pages=pages) as pdf:
+            yield pdf
+    elif isinstance(source, bytes):
+        # BytesIO shares an immutable bytes object's buffer instead of copying it
+        with pdfplumber.open(io.BytesIO(source), pages=pages) as pdf:
+            yield pdf
+    else:
+        with pdfplumber.open(source, pages=pages) as pdf:
+            yield pdf
+
+
+@contextmanager
+def _worker_source(source: PDFSource):
+    """
+    What worker tasks get handed: the path itself, or the name of a shared
+    memory block holding an in-memory PDF (copied once, never pickled per task).
+    """
+    if isinstance(source, (str, os.PathLike)):
+        yield os.fspath(source)
+        return
+
+    if isinstance(source, io.BytesIO):
+        view = source.getbuffer()
+    elif hasattr(source, "read"):
+        source.seek(0)
+        view = memoryview(source.read())
+    else:
+        view = memoryview(source).cast("B")
+
+    shm = shared_memory.SharedMemory(create=True, size=max(view.nbytes, 1))
+    try:
+        shm.buf[:view.nbytes] = view
+        yield (shm.name, view.nbytes)
+    finally:
+        view.release()
+        shm.close()
+        shm.unlink()
+
+
+def _get_page_pool(workers: int) -> futures.ProcessPoolExecutor:
+    with _page_pools_lock:
+        pool = _page_pools.get(workers)
+        if pool is None:
+            # spawn: callers may be gRPC handler threads, which must not be forked
+            pool = futures.ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            _page_pools[workers] = pool
+        return pool
+
+
+def _discard_page_pool(workers: int, broken: futures.ProcessPoolExecutor) -> None:
+    """Drop a pool whose worker died, so the next _get_page_pool starts a fresh one."""
+    with _page_pools_lock:
+        if _page_pools.get(workers) is broken:
+            print("Statement page worker died; restarting the page pool")
+            del _page_pools[workers]
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+def _page_text(page) -> str:
+    text = page.extract_text(x_tolerance=3, y_tolerance=3) or ""
+    page.close()  # drop pdfplumber's per-page object cache
+    return text
+
+
+def _extract_page_range(source, start: int, stop: int) -> list[str]:
+    """Worker task: text of pages [start, stop) of a path or (shm name, size) source."""
+    pages = list(range(start + 1, stop + 1))
+    if isinstance(source, str):
+        with _open_pdf(source, pages) as pdf:
+            return [_page_text(page) for page in pdf.pages]
+
+    shm_name, size = source
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        with _open_pdf(shm.buf[:size], pages) as pdf:
+            texts = [_page_text(page) for page in pdf.pages]
+        error = None
+    except Exception as e:
+        # Don't hold the traceback (and its views into the block) past here,
+        # or the block can't be closed
+        texts, error = None, f"{type(e).__name__}: {e}"
+    shm.close()
+    if error is not None:
+        raise ValueError(error)
+    return texts
+
+
+def _iter_page_texts(source: PDFSource, workers: int) -> Iterator[tuple[int, str]]:
+    """Yield (page_idx, text) in page order."""
+    with _open_pdf(source) as pdf:
+        page_count = len(pdf.pages)
+        if workers <= 1 or page_count <= _PAGES_PER_TASK:
+            for page_idx, page in enumerate(pdf.pages):
+                yield page_idx, _page_text(page)
+            return
+
+    pool = _get_page_pool(workers)
+    ranges = deque(
+        (start, min(start + _PAGES_PER_TASK, page_count))
+        for start in range(0, page_count, _PAGES_PER_TASK)
+    )
+
+    # Keep only a couple of chunks per worker in flight so memory stays
+    # bounded no matter how many pages the statement has
+    in_flight: deque = deque()
+    retried = False
+    with _worker_source(source) as task_source:
+        try:
+            while ranges or in_flight:
+                try:
+                    while ranges and len(in_flight) < workers * 2:
+                        start, stop = ranges[0]
+                        in_flight.append((start, stop,
+                                          pool.submit(_extract_page_range, task_source, start, stop)))
+                        ranges.popleft()
+                    texts = in_flight[0][2].result()
+                except BrokenProcessPool:
+                    # A worker died (OOM kill, crash): the whole pool is unusable.
+                    # Redo the unfinished chunks once on a fresh pool
+                    if retried:
+                        raise
+                    retried = True
+                    _discard_page_pool(workers, pool)
+                    pool = _get_page_pool(workers)
+                    ranges.extendleft(reversed([(start, stop) for start, stop, _ in in_flight]))
+                    in_flight.clear()
+                    continue
+                start, _, _ = in_flight.popleft()
+                for offset, text in enumerate(texts):
+                    yield start + offset, text
+        finally:
+            # Workers may still be reading the shared block; let them finish
+            for _, _, fut in in_flight:
+                fut.cancel()
+            futures.wait([fut for _, _, fut in in_flight])
+
+
 # ---------------------------------------------------------------------------
 # Main parser
 # ---------------------------------------------------------------------------
 
-def parse_krungsri_statement(pdf_path: str) -> BankStatement:
+def parse_krungsri_statement(source: PDFSource, workers: Optional[int] = None) -> BankStatement:
     """
     Parse a Krungsri savings-account PDF statement.
 
     Parameters
     ----------
-    pdf_path : str
-        Absolute or relative path to the unlocked PDF file.
+    source : str | PathLike | bytes | bytearray | memoryview | BytesIO
+        Path to the unlocked PDF file, or the PDF itself in memory (parsed
+        in place, no temp file).
+    workers : int, optional
+        Processes used to extract page text (default STATEMENT_PARSE_WORKERS).
 
     Returns
     -------
@@ -163,78 +396,124 @@ def parse_krungsri_statement(pdf_path: str) -> BankStatement:
         account_name="", account_number="", branch="",
         period_start="", period_end="",
     )
+    stmt.transactions.extend(iter_krungsri_transactions(source, stmt, workers))
+    return stmt
 
-    all_text: list[str] = []
 
-    with pdfplumber.open(pdf_path) as pdf:
-        for page_idx, page in enumerate(pdf.pages):
-            text = page.extract_text(x_tolerance=3, y_tolerance=3) or ""
-            all_text.append(text)
+def iter_krungsri_transactions(source: PDFSource, stmt: BankStatement,
+                               workers: Optional[int] = None) -> Iterator[Transaction]:
+    """
+    Stream transactions of a Krungsri statement in page order.
 
-            # Extract header info from page 1
-            if page_idx == 0:
-                h = _parse_header(text)
-                stmt.account_name   = h["account_name"]
-                stmt.account_number = h["account_number"]
-                stmt.branch         = h["branch"]
-                stmt.period_start   = h["period_start"]
-                stmt.period_end     = h["period_end"]
+    Page text is extracted in parallel across `workers` processes, but only a
+    few pages are held at a time.  A transaction is yielded once its
+    continuation lines are complete, even when they continue on the next page.
 
-            # Parse transactions line-by-line
-            _parse_lines(text.splitlines(), stmt.transactions)
+    Parameters
+    ----------
+    source : str | PathLike | bytes | bytearray | memoryview | BytesIO
+        Path to the unlocked PDF file, or the PDF itself in memory.
+    stmt : BankStatement
+        Receives the header fields once page 1 is parsed and the summary after
+        the last page.  Transactions are yielded, not appended.
+    workers : int, optional
+        Processes used to extract page text (default STATEMENT_PARSE_WORKERS).
+    """
+    if workers is None:
+        workers = STATEMENT_PARSE_WORKERS
 
-    # Summary from the combined text
-    stmt.summary = _parse_summary("\n".join(all_text))
-    return stmt
+    parser = _LineParser()
+    last_pages: deque = deque(maxlen=_SUMMARY_PAGES)
 
+    for page_idx, text in _iter_page_texts(source, workers):
+        # Extract header info from page 1
+        if page_idx == 0:
+            h = _parse_header(text)
+            stmt.account_name   = h["account_name"]
+            stmt.account_number = h["account_number"]
+            stmt.branch         = h["branch"]
+            stmt.period_start   = h["period_start"]
+            stmt.period_end     = h["period_end"]
 
-def _parse_lines(lines: list[str], transactions: list[Transaction]) -> None:
-    current: Optional[Transaction] = None
-
-    for raw_line in lines:
-        line = raw_line.strip()
-        if not line:
-            continue
-
-        # --- Transaction line -----------------------------------------------
-        m = _TX_RE.match(line)
-        if m:
-            dt        = m.group(1)
-            tx_type   = m.group(2).strip()
-            amount    = _to_float(m.group(3))
-            balance   = _to_float(m.group(4))
-            channel   = m.group(5)
-            details   = (m.group(6) or "").strip()
-
-            if _is_deposit(tx_type):
-                withdrawal, deposit = None, amount
-            else:
-                withdrawal, deposit = amount, None
-
-            current = Transaction(
-                datetime         = dt,
-                transaction_type = tx_type,
-                withdrawal       = withdrawal,
-                deposit          = deposit,
-                balance          = balance,
-                channel          = channel,
-                details          = details,
-            )
-            transactions.append(current)
-            continue
+        last_pages.append(text)
+
+        # Parse transactions line-by-line
+        yield from parser.feed(text.splitlines())
+
+    yield from parser.finish()
+
+    # Summary only lives on the final page(s)
+    stmt.summary = _parse_summary("\n".join(last_pages))
 
-        # --- Continuation line (account / promptpay reference) --------------
-        mc = _CONTINUATION_RE.match(line)
-        if mc and current is not None:
-            label = mc.group(1)
-            value = mc.group(2).strip()
-            extra = f"{label} : {value}"
-            current.details = (current.details + "\n" + extra).strip() if current.details else extra
-            continue
 
-        # --- Anything else resets continuation context ----------------------
-        # (header, footer, address lines — skip)
-        current = None
+class _LineParser:
+    """
+    Line-by-line transaction parser that keeps its continuation context across
+    calls, so a transaction's continuation lines may start on the next page.
+    """
+
+    def __init__(self):
+        self.current: Optional[Transaction] = None
+
+    def _complete(self) -> Iterator[Transaction]:
+        if self.current is not None:
+            yield self.current
+            self.current = None
+
+    def finish(self) -> Iterator[Transaction]:
+        yield from self._complete()
+
+    def feed(self, lines: list[str]) -> Iterator[Transaction]:
+        for raw_line in lines:
+            line = raw_line.strip()
+            if not line:
+                continue
+
+            # --- Transaction line -------------------------------------------
+            m = _TX_RE.match(line)
+            if m:
+                yield from self._complete()
+
+                dt        = m.group(1)
+                tx_type   = m.group(2).strip()
+                amount    = _to_float(m.group(3))
+                balance   = _to_float(m.group(4))
+                channel   = m.group(5)
+                details   = (m.group(6) or "").strip()
+
+                if _is_deposit(tx_type):
+                    withdrawal, deposit = None, amount
+                else:
+                    withdrawal, deposit = amount, None
+
+                self.current = Transaction(
+                    datetime         = dt,
+                    transaction_type = tx_type,
+                    withdrawal       = withdrawal,
+                    deposit          = deposit,
+                    balance          = balance,
+                    channel          = channel,
+                    details          = details,
+                )
+                continue
+
+            # --- Continuation line (account / promptpay reference) ----------
+            mc = _CONTINUATION_RE.match(line)
+            if mc and self.current is not None:
+                label = mc.group(1)
+                value = mc.group(2).strip()
+                extra = f"{label} : {value}"
+                cur = self.current
+                cur.details = (cur.details + "\n" + extra).strip() if cur.details else extra
+                continue
+
+            # --- Page furniture between a row and its continuation ----------
+            # (page number, bank footer, repeated header rows)
+            if _SKIP_RE.match(line) or _HEADER_ROW_RE.search(line):
+                continue
+
+            # --- Anything else resets continuation context ------------------
+            yield from self._complete()
 
 
 # ---------------------------------------------------------------------------
@@ -246,6 +525,7 @@ def statement_to_dicts(statement: BankStatement) -> list[dict]:
     return [
         {
             "datetime":         tx.datetime,
+            "datetime_iso":     tx.datetime_iso,
             "transaction_type": tx.transaction_type,
             "withdrawal":       tx.withdrawal,
             "deposit":          tx.deposit,
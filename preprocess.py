@@ -0,0 +1,225 @@
+"""
+Resolution normalization ahead of OCR.
+
+Tesseract time grows with pixel count, yet its accuracy depends on text size
+rather than image size: it reads best when the x-height is roughly 20-30 px,
+and falls apart below ~10 px.  Phone screenshots (1080x2400 and up) and camera
+photos carry far more pixels than that needs; small thumbnails carry too few.
+
+  1. decode      the upload's header is read first (PIL, no pixel decode);
+                 images are decoded straight to grayscale, and ones much
+                 larger than OCR ever needs with IMREAD_REDUCED_GRAYSCALE_* —
+                 for JPEG, libjpeg scales in the DCT so the full-size bitmap
+                 is never built
+  2. normalize   the median text-line height (layout.find_text_lines) gives
+                 an x-height estimate; images whose estimate is outside the
+                 tolerance band are resampled to OCR_TARGET_XHEIGHT
+                 (INTER_AREA down, INTER_CUBIC up)
+  3. pipelines   preprocessing is a chain of named stages ("blur",
+                 "upscale2x+erode", ...).  OCR_PIPELINES lists chains from
+                 cheapest to most expensive; extract_info_from_image runs the
+                 first and only escalates to the next while fewer than
+                 OCR_MIN_CONFIDENCE of the fields it found were read with
+                 OCR_FIELD_CONFIDENCE.  Fields that aren't on the slip at all
+                 never cause escalation, so the slow variants are paid for on
+                 weak readings only
+
+Configuration (environment):
+  OCR_NORMALIZE          "0" disables resampling                 (default: 1)
+  OCR_TARGET_XHEIGHT     x-height (px) to resample towards       (default: 24)
+  OCR_XHEIGHT_TOLERANCE  leave images within ±this fraction      (default: 0.35)
+  OCR_DECODE_MIN_SIDE    reduced decode keeps the short side at
+                         least this many px; 0 disables it       (default: 1000)
+  OCR_PIPELINES          ";"-separated stage chains, cheapest first
+                         (default: blur;clahe+blur;upscale2x+erode;otsu+erode)
+  OCR_MIN_CONFIDENCE     share of the found fields read confidently
+                         at which escalation stops; 0.66 lets one
+                         weak field of three through              (default: 0.66)
+"""
+
+import io
+import os
+from typing import Optional
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from layout import median_line_height
+
+
+OCR_NORMALIZE = os.environ.get("OCR_NORMALIZE", "1") != "0"
+OCR_TARGET_XHEIGHT = float(os.environ.get("OCR_TARGET_XHEIGHT", "24"))
+OCR_XHEIGHT_TOLERANCE = float(os.environ.get("OCR_XHEIGHT_TOLERANCE", "0.35"))
+OCR_DECODE_MIN_SIDE = int(os.environ.get("OCR_DECODE_MIN_SIDE", "1000"))
+OCR_PIPELINES = os.environ.get("OCR_PIPELINES", "blur;clahe+blur;upscale2x+erode;otsu+erode")
+OCR_MIN_CONFIDENCE = float(os.environ.get("OCR_MIN_CONFIDENCE", "0.66"))
+
+# A detected line box spans ascenders, descenders and Thai above/below marks;
+# the x-height is a bit over half of it
+_LINE_TO_XHEIGHT = 1.8
+
+# Never resample by more than this in either direction
+_MIN_SCALE = 0.25
+_MAX_SCALE = 3.0
+
+# JPEG markers before SOF (EXIF, ICC profile) are rarely larger than this
+_HEADER_BYTES = 1 << 16
+
+_REDUCED_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_GRAYSCALE_8),
+    (4, cv2.IMREAD_REDUCED_GRAYSCALE_4),
+    (2, cv2.IMREAD_REDUCED_GRAYSCALE_2),
+)
+
+
+def image_size(image_data) -> Optional[tuple]:
+    """(width, height) from the encoded header without decoding pixels; None if unknown."""
+    try:
+        with Image.open(io.BytesIO(image_data[:_HEADER_BYTES])) as im:
+            return im.size
+    except Exception:
+        return None
+
+
+def decode_flag(image_data) -> int:
+    """cv2.imdecode flag: grayscale, reduced by the largest factor that keeps the short side >= OCR_DECODE_MIN_SIDE."""
+    if OCR_DECODE_MIN_SIDE <= 0:
+        return cv2.IMREAD_GRAYSCALE
+    size = image_size(image_data)
+    if size is None:
+        return cv2.IMREAD_GRAYSCALE
+    short_side = min(size)
+    for factor, flag in _REDUCED_FLAGS:
+        if short_side // factor >= OCR_DECODE_MIN_SIDE:
+            return flag
+    return cv2.IMREAD_GRAYSCALE
+
+
+def estimate_x_height(boxes) -> float:
+    """Rough x-height (px) from find_text_lines boxes; 0.0 when there is no text."""
+    return median_line_height(boxes) / _LINE_TO_XHEIGHT
+
+
+def normalization_scale(boxes) -> float:
+    """Resample factor that brings the estimated x-height to OCR_TARGET_XHEIGHT (1.0 = leave as is)."""
+    if not OCR_NORMALIZE:
+        return 1.0
+    x_height = estimate_x_height(boxes)
+    if x_height <= 0:
+        return 1.0
+    scale = OCR_TARGET_XHEIGHT / x_height
+    if abs(scale - 1.0) <= OCR_XHEIGHT_TOLERANCE:
+        return 1.0
+    return min(_MAX_SCALE, max(_MIN_SCALE, scale))
+
+
+def resample(gray, scale: float):
+    if scale == 1.0:
+        return gray
+    interpolation = cv2.INTER_AREA if scale < 1.0 else cv2.INTER_CUBIC
+    return cv2.resize(gray, None, fx=scale, fy=scale, interpolation=interpolation)
+
+
+def scale_boxes(boxes, scale: float) -> list:
+    if scale == 1.0:
+        return boxes
+    return [
+        (int(x * scale), int(y * scale), max(1, int(w * scale)), max(1, int(h * scale)))
+        for x, y, w, h in boxes
+    ]
+
+
+# ---------------------------------------------------------------------------
+# Preprocessing pipelines
+# ---------------------------------------------------------------------------
+
+# Each stage takes a grayscale uint8 image and returns one. dst is the input
+# itself when the stage may overwrite it, None when it must allocate.
+
+_ERODE_KERNEL = np.ones((2, 2), np.uint8)
+
+
+def _stage_gray(img, dst):
+    return img
+
+
+def _stage_blur(img, dst):
+    return cv2.GaussianBlur(img, (3, 3), 0, dst=dst)
+
+
+def _stage_erode(img, dst):
+    # Erosion grows the dark pixels: thickens black text on a light background
+    return cv2.erode(img, _ERODE_KERNEL, dst=dst, iterations=1)
+
+
+def _stage_upscale2x(img, dst):
+    return cv2.resize(img, None, fx=2, fy=2, interpolation=cv2.INTER_CUBIC)
+
+
+def _stage_otsu(img, dst):
+    return cv2.threshold(img, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU, dst=dst)[1]
+
+
+def _stage_adaptive(img, dst):
+    return cv2.adaptiveThreshold(img, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+                                 cv2.THRESH_BINARY, 31, 11, dst=dst)
+
+
+def _stage_clahe(img, dst):
+    return cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8)).apply(img, dst=dst)
+
+
+STAGES = {
+    "gray": _stage_gray,
+    "blur": _stage_blur,
+    "erode": _stage_erode,
+    "upscale2x": _stage_upscale2x,
+    "otsu": _stage_otsu,
+    "adaptive": _stage_adaptive,
+    "clahe": _stage_clahe,
+}
+
+
+def parse_pipeline(spec: str) -> tuple:
+    """Split a spec like "upscale2x+erode" into stage names; ValueError on unknown stages."""
+    stages = tuple(name.strip() for name in spec.split("+") if name.strip())
+    if not stages:
+        raise ValueError(f"Empty preprocessing pipeline: {spec!r}")
+    unknown = [name for name in stages if name not in STAGES]
+    if unknown:
+        raise ValueError(f"Unknown preprocessing stage(s) {unknown} in {spec!r}; "
+                         f"known: {', '.join(STAGES)}")
+    return stages
+
+
+def parse_pipelines(specs: str) -> list:
+    return [parse_pipeline(spec) for spec in specs.split(";") if spec.strip()]
+
+
+PIPELINES = parse_pipelines(OCR_PIPELINES)
+
+
+def pipeline_name(stages) -> str:
+    return "+".join(stages)
+
+
+def run_pipeline(gray, stages, in_place: bool = False):
+    """
+    Apply stages in order. The input is only overwritten when in_place=True;
+    every stage after the first allocation works in the pipeline's own buffer.
+    """
+    img = gray
+    owned = in_place
+    for name in stages:
+        out = STAGES[name](img, img if owned else None)
+        owned = owned or out is not gray
+        img = out
+    return img
+
+
+def config_tag() -> str:
+    """Preprocessing settings as they affect OCR output — part of the OCR cache key."""
+    norm = f"xh{OCR_TARGET_XHEIGHT:g}~{OCR_XHEIGHT_TOLERANCE:g}" if OCR_NORMALIZE else "nonorm"
+    pipelines = ";".join(pipeline_name(stages) for stages in PIPELINES)
+    return f"{norm}|dec{OCR_DECODE_MIN_SIDE}|{pipelines}@{OCR_MIN_CONFIDENCE:g}"
@@ -5,16 +5,23 @@ import re
 import numpy as np
 import os
 import sys
+import time
 sys.stdout.reconfigure(encoding='utf-8')
 
 # Setup
-pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
-image_path = r'c:\Users\tarch\OneDrive\เดสก์ท็อป\qr\1765679961630.jpg'
+if os.name == "nt":
+    pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
+if len(sys.argv) < 2:
+    # Any slip will do, e.g. one generated by bench_corpus.py
+    print("usage: python reproduce_issue.py SLIP_IMAGE")
+    sys.exit(2)
+image_path = sys.argv[1]
 
 # Import from main.py to test the ACTUAL logic
 try:
     sys.path.append(os.path.dirname(os.path.abspath(__file__)))
     from main import extract_info_from_image
+    from preprocess import parse_pipeline, run_pipeline
 except ImportError as e:
     print(f"Failed to import main.py: {e}")
     sys.exit(1)
@@ -67,37 +74,29 @@ def test_ocr(img_path):
     # Base Grayscale
     gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
 
-    # 1. Morphological Dilation (Thicken text)
-    kernel = np.ones((2,2), np.uint8)
-    # Note: Erosion on white text/black bg makes it thinner. Dilation makes it thicker. 
-    # But usually OCR images are black text on white bg.
-    # So Erosion makes black text THICKER (erodes the white).
-    eroded = cv2.erode(gray, kernel, iterations=1)
-    dry_run_ocr(eroded, "Erosion (Thicken Black Text)")
-
-    # 2. Scale 2x + Erosion
-    scale = 2
-    resized = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_CUBIC)
-    eroded_2x = cv2.erode(resized, kernel, iterations=1)
-    dry_run_ocr(eroded_2x, "Upscale 2x + Erosion")
-
-    # 3. Adaptive Thresholding
-    # adaptiveThreshold expects single channel
-    file_bytes_again = np.asarray(bytearray(open(img_path, "rb").read()), dtype=np.uint8)
-    img_fresh = cv2.imdecode(file_bytes_again, cv2.IMREAD_GRAYSCALE)
-    
-    adaptive = cv2.adaptiveThreshold(img_fresh, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 31, 11)
-    dry_run_ocr(adaptive, "Adaptive Threshold")
-
-    # 4. Otsu Threshold + Erosion (High Contrast + Thick)
-    _, otsu = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-    otsu_eroded = cv2.erode(otsu, kernel, iterations=1)
-    dry_run_ocr(otsu_eroded, "Otsu + Erosion")
-
-    # 5. Contrast Limited Adaptive Histogram Equalization (CLAHE) - enhance details
-    clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
-    cl1 = clahe.apply(gray)
-    dry_run_ocr(cl1, "CLAHE (Contrast Polish)")
+    # Every candidate preprocessing pipeline (see preprocess.STAGES), timed.
+    # Whatever works best here can go into OCR_PIPELINES, cheapest first.
+    candidates = [
+        "gray",
+        "blur",
+        "erode",                 # thicken black text
+        "upscale2x+erode",
+        "adaptive",
+        "otsu+erode",            # high contrast + thick
+        "clahe",                 # contrast polish
+    ]
+    variants = {}
+    for spec in candidates:
+        stages = parse_pipeline(spec)
+        start = time.perf_counter()
+        variants[spec] = run_pipeline(gray, stages)
+        prep_ms = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        dry_run_ocr(variants[spec], spec)
+        ocr_ms = (time.perf_counter() - start) * 1000
+        print(f"    preprocess {prep_ms:.1f} ms, OCR {ocr_ms:.0f} ms")
+    resized = run_pipeline(gray, parse_pipeline("upscale2x"))
+    otsu = run_pipeline(gray, parse_pipeline("otsu"))
     
     # 7. Force Thai Language ONLY (No English)
     # This forces Tesseract to match against Thai dictionary/glyphs only
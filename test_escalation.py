@@ -0,0 +1,127 @@
+"""
+Preprocessing escalation in main.extract_info_from_image.
+
+A stub OCR pool returns fixed text with per-word confidences, so these run
+without Tesseract:  python -m pytest test_escalation.py
+"""
+
+import cv2
+import numpy as np
+import pytest
+
+import main
+import preprocess
+from ocr_cache import OCRCache
+
+
+def _spans(text, confidences):
+    spans = []
+    pos = 0
+    for line in text.split("\n"):
+        for word in line.split(" "):
+            spans.append((pos, pos + len(word), confidences.get(word, 0.95)))
+            pos += len(word) + 1
+    return spans
+
+
+class StubPool:
+    """OCRPool stand-in: every pass reads the same words, line regions by position."""
+
+    backend = "stub"
+    lang = "tha+eng"
+    oem = 1
+    psm = 11
+
+    def __init__(self, text, confidences=None):
+        self.text = text
+        self.confidences = confidences or {}
+        self.passes = 0
+        self.region_reads = 0
+
+    def image_to_data(self, img, psm=None, whitelist=None):
+        self.passes += 1
+        return self.text, _spans(self.text, self.confidences)
+
+    def read_regions_data(self, img, boxes, psm=None, whitelist=None):
+        # Lines are drawn evenly down the image (see _slip_with_lines)
+        lines = self.text.split("\n")
+        self.region_reads += len(boxes)
+        results = []
+        for x, y, w, h in boxes:
+            line = lines[int((y + h / 2) / img.shape[0] * len(lines))]
+            results.append((line, _spans(line, self.confidences)))
+        return results
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache(monkeypatch):
+    monkeypatch.setattr(main, "get_ocr_cache", lambda: OCRCache(enabled=False))
+    monkeypatch.setattr(main, "OCR_ROI", "0")
+
+
+def _slip():
+    return np.full((400, 300), 255, np.uint8)
+
+
+def _slip_with_lines(count):
+    img = _slip()
+    for i in range(count):
+        y = (i + 1) * img.shape[0] // (count + 1)
+        cv2.putText(img, "Amount 1,250.00 x", (20, y), cv2.FONT_HERSHEY_SIMPLEX, 0.7, 0, 2)
+    return img
+
+
+def _accepted_by(before, after):
+    return {name: after["accepted_by"].get(name, 0) - before["accepted_by"].get(name, 0)
+            for name in after["accepted_by"]
+            if after["accepted_by"].get(name, 0) != before["accepted_by"].get(name, 0)}
+
+
+def test_absent_field_does_not_escalate():
+    # No "Ref" label on this slip: amount and date are confident, ref is simply not there
+    pool = StubPool("14 ธ.ค. 2568 - 10:22\n1,250.00 บาท")
+    before = main.pipeline_stats()
+
+    result = main.extract_info_from_image(_slip(), pool)
+
+    assert result["amount"] == "1,250.00"
+    assert result["ref"] == main.NOT_FOUND
+    assert pool.passes == 1
+    assert _accepted_by(before, main.pipeline_stats()) == {
+        preprocess.pipeline_name(preprocess.PIPELINES[0]): 1}
+
+
+def test_nothing_found_does_not_escalate():
+    pool = StubPool("โอนเงินสำเร็จ")
+
+    main.extract_info_from_image(_slip(), pool)
+
+    assert pool.passes == 1
+
+
+def test_weak_field_escalates():
+    # Amount present but read with low confidence: worth the slower variants
+    pool = StubPool("14 ธ.ค. 2568 - 10:22\n1,250.00 บาท", {"1,250.00": 0.40})
+    before = main.pipeline_stats()
+
+    result = main.extract_info_from_image(_slip(), pool)
+
+    assert result["amount"] == "1,250.00"
+    assert pool.passes == len(preprocess.PIPELINES)
+    assert _accepted_by(before, main.pipeline_stats()) == {"exhausted": 1}
+
+
+def test_escalation_rereads_only_weak_field_lines(monkeypatch):
+    monkeypatch.setattr(main, "OCR_ROI", "1")
+    monkeypatch.setattr(preprocess, "OCR_NORMALIZE", False)
+    pool = StubPool("โอนเงินสำเร็จ\n14 ธ.ค. 2568 - 10:22\n1,250.00 บาท", {"1,250.00": 0.40})
+
+    result = main.extract_info_from_image(_slip_with_lines(3), pool)
+
+    assert result["date"] == "14 ธ.ค. 2568 - 10:22"
+    assert result["raw_text"].startswith("โอนเงินสำเร็จ")
+    later_passes = len(preprocess.PIPELINES) - 1
+    # First pass: all 3 lines + the whitelisted amount re-read; after that
+    # only the amount line and its re-read, the date is carried forward
+    assert pool.region_reads == 3 + 1 + later_passes * 2
+    assert pool.passes == len(preprocess.PIPELINES)
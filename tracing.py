@@ -0,0 +1,255 @@
+"""
+OpenTelemetry tracing for the OCR service.
+
+Every OCRService RPC gets a server span whose parent comes from the caller's
+gRPC metadata (W3C traceparent / tracestate), so a traced client can follow
+its request into this service.  Under it:
+
+  image                 one per image of the RPC
+    decode, qr, preprocess, ocr, extract
+                        rebuilt from the metrics.Recording the OCR worker
+                        returns with its result: workers export nothing
+                        themselves, the server turns their stage timings into
+                        spans with the original start times (one ocr span
+                        per Tesseract call)
+    db_insert           DBService insert
+    webhook_enqueue     create_expenses writing the outbox row
+  webhook               the n8n POST, made later by the dispatcher thread.
+                        The outbox row keeps the trace context, so the POST
+                        joins the request's trace, and n8n receives a
+                        traceparent header
+
+Without an exporter the spans are never recorded, but the context still
+propagates to n8n.
+
+Configuration (environment):
+  TRACING_EXPORTER   none | file | otlp | console                 (default: none)
+  TRACING_FILE       JSON-lines output of the file exporter       (default: traces.jsonl)
+  OTEL_SERVICE_NAME  service.name of the exported spans           (default: ocr-service)
+  otlp also needs opentelemetry-exporter-otlp-proto-grpc and reads the
+  standard OTEL_EXPORTER_OTLP_* variables (endpoint, headers, ...).
+"""
+
+import contextvars
+import functools
+import inspect
+import os
+import threading
+import types
+
+from opentelemetry import context as otel_context
+from opentelemetry import propagate, trace
+from opentelemetry.trace import SpanKind, Status, StatusCode
+
+
+TRACING_EXPORTER = os.environ.get("TRACING_EXPORTER", "none").lower()
+TRACING_FILE = os.environ.get("TRACING_FILE", "traces.jsonl")
+OTEL_SERVICE_NAME = os.environ.get("OTEL_SERVICE_NAME", "ocr-service")
+
+# Resolves to the real provider once setup() installed one; a no-op until then
+_tracer = trace.get_tracer("ocr-service")
+
+_setup_lock = threading.Lock()
+_setup_done = False
+
+
+def _exporter():
+    if TRACING_EXPORTER == "otlp":
+        from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+        return OTLPSpanExporter()
+    from opentelemetry.sdk.trace.export import ConsoleSpanExporter
+    if TRACING_EXPORTER == "file":
+        # One span per line, appended; the file stays open for the process lifetime
+        out = open(TRACING_FILE, "a", encoding="utf-8")
+        return ConsoleSpanExporter(out=out, formatter=lambda span: span.to_json(indent=None) + "\n")
+    if TRACING_EXPORTER == "console":
+        return ConsoleSpanExporter()
+    raise ValueError(f"Unknown TRACING_EXPORTER {TRACING_EXPORTER!r}; use none, file, otlp or console")
+
+
+def setup() -> None:
+    """Install the tracer provider and exporter (servers call this once at startup)."""
+    global _setup_done
+    if TRACING_EXPORTER in ("", "none"):
+        return
+    with _setup_lock:
+        if _setup_done:
+            return
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+
+        provider = TracerProvider(resource=Resource.create({"service.name": OTEL_SERVICE_NAME}))
+        # Batched: exporting never sits on the request path
+        provider.add_span_processor(BatchSpanProcessor(_exporter()))
+        trace.set_tracer_provider(provider)
+        _setup_done = True
+        print(f"Tracing: exporting spans ({TRACING_EXPORTER})")
+
+
+def shutdown() -> None:
+    """Flush spans still buffered in the batch processor."""
+    provider = trace.get_tracer_provider()
+    if hasattr(provider, "shutdown"):
+        provider.shutdown()
+
+
+# ---------------------------------------------------------------------------
+# Spans and context
+# ---------------------------------------------------------------------------
+
+def span(name, context=None, kind=SpanKind.INTERNAL, **attributes):
+    """Context manager: a span made current for the block, child of the current span (or context)."""
+    return _tracer.start_as_current_span(name, context=context, kind=kind, attributes=attributes)
+
+
+def current_context():
+    return otel_context.get_current()
+
+
+def current_span_attribute(key, value) -> None:
+    trace.get_current_span().set_attribute(key, value)
+
+
+def inject() -> dict:
+    """W3C trace headers ({"traceparent": ...}) for the current span; {} when there is none."""
+    carrier = {}
+    propagate.inject(carrier)
+    return carrier
+
+
+def extract(carrier):
+    """Context from trace headers (as returned by inject) or gRPC invocation metadata."""
+    if not carrier:
+        return otel_context.Context()
+    if not isinstance(carrier, dict):
+        carrier = {key: value for key, value in carrier if isinstance(value, str)}
+    return propagate.extract(carrier)
+
+
+def bind_context(fn):
+    """fn bound to the caller's context, for running on executor / plain threads."""
+    ctx = contextvars.copy_context()
+
+    @functools.wraps(fn)
+    def run(*args, **kwargs):
+        # A Context can't be entered by two threads at once: one copy per call
+        return ctx.copy().run(fn, *args, **kwargs)
+    return run
+
+
+def replay(rec, parent) -> None:
+    """
+    Child spans of `parent` (a context, as current_context() returned) for the
+    stage timings of a metrics.Recording; its events become attributes of
+    the parent span ("ocr.qr", "ocr.pipeline").
+    """
+    for name, start, seconds in rec.timings:
+        start_ns = int(start * 1e9)
+        child = _tracer.start_span(name, context=parent, start_time=start_ns)
+        child.end(end_time=start_ns + int(seconds * 1e9))
+    parent_span = trace.get_current_span(parent)
+    for name, label in rec.events:
+        parent_span.set_attribute(f"ocr.{name}", label)
+
+
+# ---------------------------------------------------------------------------
+# RPCs
+# ---------------------------------------------------------------------------
+
+def _start_rpc(name, grpc_context):
+    parent = extract(grpc_context.invocation_metadata())
+    rpc_span = _tracer.start_span(
+        f"OCRService/{name}", context=parent, kind=SpanKind.SERVER,
+        attributes={"rpc.system": "grpc", "rpc.service": "OCRService", "rpc.method": name},
+    )
+    return rpc_span, trace.set_span_in_context(rpc_span, parent)
+
+
+def _fail(rpc_span, error) -> None:
+    if isinstance(error, (GeneratorExit, StopAsyncIteration)):
+        return
+    rpc_span.record_exception(error)
+    rpc_span.set_status(Status(StatusCode.ERROR, str(error)))
+
+
+def trace_rpc(method):
+    """
+    Decorator for servicer methods (threaded or asyncio): a server span per
+    call, continuing the trace in the request metadata. The span is current
+    while the handler runs, including every step of a streaming response.
+    """
+    name = method.__name__
+
+    if inspect.isasyncgenfunction(method):
+        @functools.wraps(method)
+        async def wrapper(self, request, context):
+            rpc_span, ctx = _start_rpc(name, context)
+            results = method(self, request, context)
+            try:
+                while True:
+                    token = otel_context.attach(ctx)
+                    try:
+                        item = await results.__anext__()
+                    except StopAsyncIteration:
+                        break
+                    finally:
+                        otel_context.detach(token)
+                    yield item
+            except BaseException as e:
+                _fail(rpc_span, e)
+                raise
+            finally:
+                rpc_span.end()
+        return wrapper
+
+    if inspect.iscoroutinefunction(method):
+        @functools.wraps(method)
+        async def wrapper(self, request, context):
+            rpc_span, ctx = _start_rpc(name, context)
+            token = otel_context.attach(ctx)
+            try:
+                return await method(self, request, context)
+            except BaseException as e:
+                _fail(rpc_span, e)
+                raise
+            finally:
+                otel_context.detach(token)
+                rpc_span.end()
+        return wrapper
+
+    def stream(results, rpc_span, ctx):
+        try:
+            while True:
+                token = otel_context.attach(ctx)
+                try:
+                    item = next(results)
+                except StopIteration:
+                    break
+                finally:
+                    otel_context.detach(token)
+                yield item
+        except BaseException as e:
+            _fail(rpc_span, e)
+            raise
+        finally:
+            rpc_span.end()
+
+    @functools.wraps(method)
+    def wrapper(self, request, context):
+        rpc_span, ctx = _start_rpc(name, context)
+        token = otel_context.attach(ctx)
+        try:
+            result = method(self, request, context)
+        except BaseException as e:
+            _fail(rpc_span, e)
+            rpc_span.end()
+            raise
+        finally:
+            otel_context.detach(token)
+        if isinstance(result, types.GeneratorType):
+            # Streaming response: the span lasts as long as the stream
+            return stream(result, rpc_span, ctx)
+        rpc_span.end()
+        return result
+    return wrapper
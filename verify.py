@@ -2,6 +2,7 @@ import cv2
 from PIL import Image
 import numpy as np
 import binascii
+import os
 
 
 def read_qr_opencv(image_path):
@@ -74,6 +75,106 @@ def extract_promptpay_info(qr):
 
 
 
+# ---------------------------------------------------------------------------
+# Slip QR fast path (ใช้ใน main.extract_info_from_image)
+# ---------------------------------------------------------------------------
+
+# QR detection runs on a copy no larger than this (px, longest side). Much
+# below ~1000 the modules of a typical slip QR blur together.
+QR_MAX_SIDE = int(os.environ.get("QR_MAX_SIDE", "1024"))
+
+_qr_detectors = None
+
+
+def decode_qr(gray, max_side=QR_MAX_SIDE):
+    """Decode the first QR code of a grayscale ndarray on a downscaled copy; "" if none."""
+    global _qr_detectors
+    if _qr_detectors is None:
+        # The ArUco-based detector (OpenCV >= 4.8) finds codes the classic one misses
+        _qr_detectors = [cv2.QRCodeDetector()]
+        if hasattr(cv2, "QRCodeDetectorAruco"):
+            _qr_detectors.insert(0, cv2.QRCodeDetectorAruco())
+
+    h, w = gray.shape[:2]
+    scale = max_side / max(h, w)
+    if scale < 1:
+        gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+    for detector in _qr_detectors:
+        try:
+            data, _, _ = detector.detectAndDecode(gray)
+        except cv2.error:
+            continue
+        if data:
+            return data
+    return ""
+
+
+def _tlv_with_offsets(data):
+    i = 0
+    while i + 4 <= len(data):
+        tag = data[i:i+2]
+        length = int(data[i+2:i+4])
+        yield i, tag, data[i+4:i+4+length]
+        i += 4 + length
+
+
+def slip_qr_info(payload):
+    """
+    Amount / reference from a bank slip-verification QR or an EMVCo (PromptPay) QR.
+
+    Returns None unless the payload parses as TLV and its CRC-16/CCITT checks
+    out (tag 91 for slip-verification QR, tag 63 for EMVCo). "kind" tells the
+    two apart: "slip" is the verification QR a bank prints on a completed
+    transfer (tag 00 holding sub-tags, 02 = transaction ref); "payment_request"
+    is any other EMVCo QR — a PromptPay request to be paid, whose amount (54)
+    and reference (62/05) say nothing about a transfer having happened. Fields
+    the QR doesn't carry are left out of the dict.
+    """
+    try:
+        tlvs = list(_tlv_with_offsets(payload))
+    except ValueError:
+        return None
+
+    crc_tag = None
+    info = {}
+    for offset, tag, value in tlvs:
+        if tag in ("63", "91") and len(value) == 4:
+            # CRC covers everything up to and including this tag + length
+            crc = binascii.crc_hqx(payload[:offset+4].encode("utf-8"), 0xFFFF)
+            if format(crc, "04X") == value.upper():
+                crc_tag = tag
+        elif tag == "54":  # Transaction amount
+            try:
+                info["amount"] = f"{float(value):,.2f}"
+            except ValueError:
+                pass
+        elif tag == "00" and len(value) > 2:  # Slip verification: 02 = transaction ref
+            try:
+                for st, sv in parse_tlv(value):
+                    if st == "02" and sv:
+                        info["slip_ref"] = sv
+            except ValueError:
+                pass
+        elif tag == "62":  # Additional data: 05 = reference label, 01 = bill number
+            try:
+                sub = dict(parse_tlv(value))
+            except ValueError:
+                continue
+            ref = sub.get("05") or sub.get("01")
+            if ref:
+                info.setdefault("ref", ref)
+
+    if crc_tag is None:
+        return None
+    if crc_tag == "91" and "slip_ref" in info:
+        info["ref"] = info.pop("slip_ref")
+        info["kind"] = "slip"
+    else:
+        info.pop("slip_ref", None)
+        info["kind"] = "payment_request"
+    return info
+
 
 if __name__ == "__main__":
     text = read_qr_opencv("1765679961630.jpg")
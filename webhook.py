@@ -0,0 +1,305 @@
+"""
+Background n8n webhook delivery with a durable SQLite outbox.
+
+RPC handlers used to POST to n8n inline, with no timeout, so a slow n8n
+directly inflated OCR latency and could hang handler threads forever.  Now
+handlers only append the payload to a local SQLite outbox and return.  A
+dispatcher thread claims pending rows in batches and delivers them over a
+pooled keep-alive session, with a timeout per POST and exponential backoff
+between attempts.  Rows survive restarts, so nothing queued is lost — as long
+as WEBHOOK_OUTBOX_PATH is on storage that outlives the process (in the chart:
+webhook.persistence).  An error delivering one row only backs that row off;
+the dispatcher thread keeps running, and start() replaces it if it ever died.
+
+Claiming marks the rows 'sending' with a lease in one write transaction, so
+processes sharing an outbox file never deliver the same row twice.  A row
+whose lease runs out (its process died mid-delivery) is pending again and
+delivered once more: delivery is at least once, not exactly once.
+
+Configuration (environment):
+  WEBHOOK_OUTBOX_PATH    SQLite file                     (default: webhook_outbox.db)
+  WEBHOOK_TIMEOUT        seconds per POST                (default: 10)
+  WEBHOOK_MAX_ATTEMPTS   attempts before a row is dead   (default: 8)
+  WEBHOOK_BACKOFF_BASE   first retry delay, doubles      (default: 2)
+  WEBHOOK_BACKOFF_MAX    cap on the retry delay          (default: 300)
+  WEBHOOK_BATCH_SIZE     rows claimed per poll           (default: 20)
+  WEBHOOK_CONCURRENCY    parallel POSTs per batch        (default: 4)
+  WEBHOOK_LEASE          seconds a claimed row is held   (default: 300)
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent import futures
+from typing import Optional
+
+import requests
+from opentelemetry.trace import SpanKind
+from requests.adapters import HTTPAdapter
+
+import tracing
+from metrics import stage
+
+
+WEBHOOK_OUTBOX_PATH = os.environ.get("WEBHOOK_OUTBOX_PATH", "webhook_outbox.db")
+WEBHOOK_TIMEOUT = float(os.environ.get("WEBHOOK_TIMEOUT", "10"))
+WEBHOOK_MAX_ATTEMPTS = int(os.environ.get("WEBHOOK_MAX_ATTEMPTS", "8"))
+WEBHOOK_BACKOFF_BASE = float(os.environ.get("WEBHOOK_BACKOFF_BASE", "2"))
+WEBHOOK_BACKOFF_MAX = float(os.environ.get("WEBHOOK_BACKOFF_MAX", "300"))
+WEBHOOK_BATCH_SIZE = int(os.environ.get("WEBHOOK_BATCH_SIZE", "20"))
+WEBHOOK_CONCURRENCY = int(os.environ.get("WEBHOOK_CONCURRENCY", "4"))
+# Must outlast delivering a whole batch: batch_size / concurrency POSTs of up to
+# WEBHOOK_TIMEOUT each
+WEBHOOK_LEASE = float(os.environ.get("WEBHOOK_LEASE", "300"))
+
+# Retry these; any other 4xx means n8n will never accept the payload
+_RETRY_STATUS = {408, 425, 429}
+
+
+class WebhookDispatcher:
+    def __init__(self, outbox_path: str = WEBHOOK_OUTBOX_PATH, timeout: float = WEBHOOK_TIMEOUT,
+                 max_attempts: int = WEBHOOK_MAX_ATTEMPTS, batch_size: int = WEBHOOK_BATCH_SIZE,
+                 concurrency: int = WEBHOOK_CONCURRENCY, lease: float = WEBHOOK_LEASE):
+        self.outbox_path = outbox_path
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.batch_size = batch_size
+        self.concurrency = max(1, concurrency)
+        self.lease = lease
+
+        self._db = sqlite3.connect(outbox_path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                url TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                last_error TEXT,
+                trace_context TEXT,
+                lease_until REAL
+            )
+        """)
+        # Outboxes created before trace propagation / leases
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(outbox)")}
+        if "trace_context" not in columns:
+            self._db.execute("ALTER TABLE outbox ADD COLUMN trace_context TEXT")
+        if "lease_until" not in columns:
+            self._db.execute("ALTER TABLE outbox ADD COLUMN lease_until REAL")
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, next_attempt_at)"
+        )
+        self._db_lock = threading.Lock()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({
+            "Content-Type": "application/json",
+            "x-AUTH": "",
+        })
+
+        self.delivered = 0
+        self.failed_attempts = 0
+        self.dead = 0
+        self.last_delivery_lag = 0.0
+
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+
+    # -- producer side ------------------------------------------------------
+
+    def enqueue(self, url: str, payload: dict) -> dict:
+        """
+        Persist a payload for delivery; returns immediately. The current trace
+        context is stored with it, so the delivery joins the caller's trace.
+        """
+        now = time.time()
+        carrier = tracing.inject()
+        trace_context = json.dumps(carrier) if carrier else None
+        with self._db_lock:
+            cur = self._db.execute(
+                "INSERT INTO outbox (url, payload, created_at, next_attempt_at, trace_context) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (url, json.dumps(payload, ensure_ascii=False), now, now, trace_context),
+            )
+            outbox_id = cur.lastrowid
+        self.start()
+        self._wake.set()
+        return {"status": "queued", "outbox_id": outbox_id}
+
+    def stats(self) -> dict:
+        """Queue depth and delivery lag for monitoring."""
+        now = time.time()
+        with self._db_lock:
+            depth, oldest = self._db.execute(
+                "SELECT COUNT(*), MIN(created_at) FROM outbox "
+                "WHERE status IN ('pending', 'sending')"
+            ).fetchone()
+        return {
+            "queue_depth": depth,
+            "oldest_pending_age": now - oldest if oldest else 0.0,
+            "delivered": self.delivered,
+            "failed_attempts": self.failed_attempts,
+            "dead": self.dead,
+            "last_delivery_lag": self.last_delivery_lag,
+        }
+
+    # -- dispatcher thread --------------------------------------------------
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._stop.is_set():
+                return
+            if self._thread is None or not self._thread.is_alive():
+                if self._thread is not None:
+                    print("Webhook dispatcher thread had died; restarting it")
+                self._thread = threading.Thread(
+                    target=self._run, name="webhook-dispatcher", daemon=True
+                )
+                self._thread.start()
+
+    def stop(self, timeout: float = 5) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self) -> None:
+        with futures.ThreadPoolExecutor(self.concurrency, thread_name_prefix="webhook") as pool:
+            while not self._stop.is_set():
+                try:
+                    rows = self._claim_due()
+                    if rows:
+                        list(pool.map(self._deliver, rows))
+                        continue
+                    self._wake.wait(self._seconds_until_next_due())
+                    self._wake.clear()
+                except Exception as err:
+                    # e.g. the outbox is locked or its disk full: keep the thread, try again later
+                    print(f"Webhook dispatcher error: {err}")
+                    self._stop.wait(WEBHOOK_BACKOFF_BASE)
+
+    def _claim_due(self) -> list:
+        """
+        Lease up to batch_size due rows to this process and return them.
+
+        BEGIN IMMEDIATE takes the outbox's write lock before the SELECT, so
+        another process claiming at the same time waits and then sees these
+        rows as 'sending'.
+        """
+        now = time.time()
+        with self._db_lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                # Leases of a process that died mid-delivery
+                self._db.execute(
+                    "UPDATE outbox SET status = 'pending', lease_until = NULL "
+                    "WHERE status = 'sending' AND lease_until <= ?",
+                    (now,),
+                )
+                rows = self._db.execute(
+                    "SELECT id, url, payload, created_at, attempts, trace_context FROM outbox "
+                    "WHERE status = 'pending' AND next_attempt_at <= ? "
+                    "ORDER BY next_attempt_at LIMIT ?",
+                    (now, self.batch_size),
+                ).fetchall()
+                self._db.executemany(
+                    "UPDATE outbox SET status = 'sending', lease_until = ? WHERE id = ?",
+                    [(now + self.lease, row[0]) for row in rows],
+                )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return rows
+
+    def _seconds_until_next_due(self) -> float:
+        with self._db_lock:
+            (next_due,) = self._db.execute(
+                "SELECT MIN(CASE WHEN status = 'pending' THEN next_attempt_at ELSE lease_until END) "
+                "FROM outbox WHERE status IN ('pending', 'sending')"
+            ).fetchone()
+        if next_due is None:
+            return 60.0
+        return min(60.0, max(0.0, next_due - time.time()))
+
+    def _deliver(self, row) -> None:
+        outbox_id, url, payload, created_at, attempts, trace_context = row
+        attempts += 1
+        retry = True
+        try:
+            parent = tracing.extract(json.loads(trace_context) if trace_context else None)
+        except ValueError:
+            # Unreadable trace context: still deliver, just untraced
+            parent = None
+        try:
+            with stage("webhook"), tracing.span("webhook", context=parent, kind=SpanKind.CLIENT,
+                                                **{"http.method": "POST", "http.url": url,
+                                                   "webhook.outbox_id": outbox_id,
+                                                   "webhook.attempt": attempts}) as span:
+                # traceparent lets n8n continue the trace
+                response = self.session.post(url, data=payload.encode("utf-8"),
+                                             headers=tracing.inject(), timeout=self.timeout)
+                span.set_attribute("http.status_code", response.status_code)
+            if response.status_code < 400:
+                self._mark_delivered(outbox_id, created_at)
+                return
+            error = f"HTTP {response.status_code}: {response.text[:200]}"
+            retry = response.status_code >= 500 or response.status_code in _RETRY_STATUS
+        except requests.RequestException as err:
+            error = str(err)
+        except Exception as err:
+            # A bad row or a local error: back this row off like a failed POST
+            # instead of letting it escape and kill the dispatcher thread
+            error = f"{type(err).__name__}: {err}"
+
+        print(f"Webhook delivery {outbox_id} failed (attempt {attempts}): {error}")
+        if not retry or attempts >= self.max_attempts:
+            with self._db_lock:
+                self.failed_attempts += 1
+                self.dead += 1
+                self._db.execute(
+                    "UPDATE outbox SET status = 'dead', attempts = ?, last_error = ?, "
+                    "lease_until = NULL WHERE id = ?",
+                    (attempts, error, outbox_id),
+                )
+            return
+
+        delay = min(WEBHOOK_BACKOFF_MAX, WEBHOOK_BACKOFF_BASE * 2 ** (attempts - 1))
+        with self._db_lock:
+            self.failed_attempts += 1
+            self._db.execute(
+                "UPDATE outbox SET status = 'pending', attempts = ?, next_attempt_at = ?, "
+                "last_error = ?, lease_until = NULL WHERE id = ?",
+                (attempts, time.time() + delay, error, outbox_id),
+            )
+
+    def _mark_delivered(self, outbox_id: int, created_at: float) -> None:
+        with self._db_lock:
+            self._db.execute("DELETE FROM outbox WHERE id = ?", (outbox_id,))
+            self.delivered += 1
+            self.last_delivery_lag = time.time() - created_at
+
+
+_default_dispatcher: Optional[WebhookDispatcher] = None
+_default_dispatcher_lock = threading.Lock()
+
+
+def get_webhook_dispatcher() -> WebhookDispatcher:
+    global _default_dispatcher
+    if _default_dispatcher is None:
+        with _default_dispatcher_lock:
+            if _default_dispatcher is None:
+                _default_dispatcher = WebhookDispatcher()
+    return _default_dispatcher